@@ -1,26 +1,116 @@
 # __init__.py
-from flask import Flask
+from flask import Flask, session, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+from werkzeug.middleware.proxy_fix import ProxyFix
 from urllib.parse import quote_plus
+import time
 import os
 
 db = SQLAlchemy()
 
+# Connection pool settings (per worker process). A request normally holds one connection at a time,
+# so the pool defaults to one connection per gunicorn thread with a little headroom
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", os.getenv("WEB_THREADS", "4")))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "2"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Connecting through PgBouncer (transaction pooling): no client-side pool and no startup options
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+# Seconds a session keeps reading from the primary after it committed (read-your-writes)
+DB_REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+# Reverse proxies in front of the app; their X-Forwarded-* headers give the client IP (0 = direct connections)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+# Helper: SQLAlchemy engine options for one bind
+def engine_options(read_only=False):
+    connect_args = {"connect_timeout": DB_CONNECT_TIMEOUT}
+
+    if DB_PGBOUNCER:
+        # PgBouncer rejects startup parameters; set statement_timeout on the database role instead
+        return {"poolclass": NullPool, "connect_args": connect_args}
+
+    options = []
+    if DB_STATEMENT_TIMEOUT_MS:
+        options.append(f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}")
+    if read_only:
+        options.append("-c default_transaction_read_only=on")
+    if options:
+        connect_args["options"] = " ".join(options)
+
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+# Helper: connection URL of the primary (or the replica) built from the environment
+def database_url(driver="psycopg2", replica=False):
+    user = quote_plus(os.getenv("DB_USER", "postgres"))
+    password = quote_plus(os.getenv("DB_PASSWORD", "password"))
+    name = quote_plus(os.getenv("DB_NAME", "postgres"))
+    port = os.getenv("DB_INTERNAL_PORT", "5432")
+    if replica:
+        host = quote_plus(os.getenv("DB_REPLICA_HOST", ""))
+        port = os.getenv("DB_REPLICA_PORT", port)
+    else:
+        host = quote_plus(os.getenv("DB_HOST", "db"))
+    return f"postgresql+{driver}://{user}:{password}@{host}:{port}/{name}"
+
+# Engine for reads that tolerate replication lag: the replica when configured,
+# unless the session committed on the primary in the last DB_REPLICA_STICKY_SECONDS
+def read_engine():
+    replica = db.engines.get("replica")
+    if replica is None:
+        return db.engine
+    if has_request_context() and session.get("primary_until", 0) > time.time():
+        return db.engine
+    return replica
+
 def create_app():
     app = Flask(__name__)
     app.secret_key = os.getenv("SECRET_KEY", "dev-secret-change-me")
 
-    DB_USER = quote_plus(os.getenv("DB_USER", "postgres"))
-    DB_PASSWORD = quote_plus(os.getenv("DB_PASSWORD", "password"))
-    DB_NAME = quote_plus(os.getenv("DB_NAME", "postgres"))
-    DB_HOST = quote_plus(os.getenv("DB_HOST", "db"))
-    DB_PORT = os.getenv("DB_INTERNAL_PORT", "5432")
+    # request.remote_addr is the real client only once the proxy hops are unwrapped (login throttling keys on it)
+    if TRUSTED_PROXY_HOPS:
+        app.wsgi_app = ProxyFix(
+            app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS, x_host=TRUSTED_PROXY_HOPS
+        )
+
+    DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST", "")
 
-    app.config['SQLALCHEMY_DATABASE_URI'] = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Optional read-only replica serving catalog, notification and admin table reads
+    if DB_REPLICA_HOST:
+        app.config['SQLALCHEMY_BINDS'] = {
+            "replica": {
+                "url": database_url(replica=True),
+                **engine_options(read_only=True),
+            }
+        }
+
     db.init_app(app)
-    
+
+    with app.app_context():
+        # Pin the session to the primary for a while after each commit made while serving a request
+        @event.listens_for(db.engine, "commit")
+        def stick_to_primary(conn):
+            if DB_REPLICA_HOST and has_request_context():
+                session["primary_until"] = time.time() + DB_REPLICA_STICKY_SECONDS
+
+        from .metrics import init_metrics
+        init_metrics(app, db.engines.values())
+
     from .commands import register_commands
     register_commands(app)
 
@@ -0,0 +1,281 @@
+# api.py
+from contextlib import asynccontextmanager
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import BadSignature
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from datetime import datetime
+import os
+from . import (
+    database_url, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+    DB_CONNECT_TIMEOUT, DB_STATEMENT_TIMEOUT_MS, DB_PGBOUNCER
+)
+from .notifications import NOTIFICATION_WINDOW
+from .utility import encode_cursor, decode_cursor
+from .recommendations import RECOMMENDATION_TOP_K
+
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "50"))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "200"))
+
+BOOK_COLUMNS = """
+    book_id, title, authors, categories, avg_rating, total_copies, currently_issued_copies, currently_reserved_copies,
+    GREATEST(total_copies - currently_issued_copies - currently_reserved_copies, 0) AS available_copies
+"""
+
+# Helper: async (asyncpg) engine options matching the WSGI app's pool settings
+def async_engine_options(read_only=False):
+    connect_args = {"timeout": DB_CONNECT_TIMEOUT}
+
+    if DB_PGBOUNCER:
+        # Prepared statements don't survive PgBouncer's transaction pooling
+        connect_args["statement_cache_size"] = 0
+        return {"poolclass": NullPool, "connect_args": connect_args}
+
+    server_settings = {}
+    if DB_STATEMENT_TIMEOUT_MS:
+        server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+    if read_only:
+        server_settings["default_transaction_read_only"] = "on"
+    if server_settings:
+        connect_args["server_settings"] = server_settings
+
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+# Helper: JSON error response
+def error(message, status):
+    return JSONResponse({"error": message}, status_code=status)
+
+# Helper: bounded integer query parameter (None when missing, ValueError when invalid)
+def int_param(request, name, default=None, minimum=1, maximum=None):
+    value = request.query_params.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(name)
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ValueError(name)
+    return value
+
+# Helper: (sent_datetime, id) keyset cursor of the notifications endpoint, or None when absent
+def notification_cursor_param(request, name):
+    value = request.query_params.get(name)
+    if value in (None, ""):
+        return None
+    values = decode_cursor(value, 2)
+    try:
+        return datetime.fromisoformat(values[0]), int(values[1])
+    except (TypeError, ValueError):
+        raise ValueError(name)
+
+
+def create_api():
+    # The web app's signed session cookie authenticates API calls
+    cookie_app = Flask(__name__)
+    cookie_app.secret_key = os.getenv("SECRET_KEY", "dev-secret-change-me")
+    session_interface = SecureCookieSessionInterface()
+    serializer = session_interface.get_signing_serializer(cookie_app)
+    session_max_age = int(cookie_app.permanent_session_lifetime.total_seconds())
+
+    # Helper: reader id of the logged-in user (None when not logged in or without a library card).
+    # Only hits the database for sessions created before the reader id was cached in them.
+    async def current_reader_id(request):
+        cookie = request.cookies.get(cookie_app.config["SESSION_COOKIE_NAME"])
+        if not cookie:
+            return None
+        try:
+            session = serializer.loads(cookie, max_age=session_max_age)
+        except BadSignature:
+            return None
+        if "user_id" not in session:
+            return None
+        if "reader_id" in session:
+            return session["reader_id"]
+        async with request.app.state.engine.connect() as conn:
+            result = await conn.execute(
+                text("SELECT reader_id FROM app_user WHERE id = :user_id"),
+                {"user_id": session["user_id"]}
+            )
+            return result.scalar_one_or_none()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        app.state.engine = create_async_engine(database_url("asyncpg"), **async_engine_options())
+        app.state.read_engine = app.state.engine
+        if os.getenv("DB_REPLICA_HOST"):
+            app.state.read_engine = create_async_engine(database_url("asyncpg", replica=True), **async_engine_options(read_only=True))
+        yield
+        if app.state.read_engine is not app.state.engine:
+            await app.state.read_engine.dispose()
+        await app.state.engine.dispose()
+
+    # Catalog page: ?q=title substring, keyset-paginated by book id with ?after=
+    async def books(request):
+        try:
+            limit = int_param(request, "limit", API_PAGE_SIZE, maximum=API_MAX_PAGE_SIZE)
+            after = int_param(request, "after", 0, minimum=0)
+        except ValueError as e:
+            return error(f"Invalid {e} parameter", 400)
+
+        q = request.query_params.get("q", "").strip()
+        title_filter = "AND book_id IN (SELECT id FROM book WHERE title ILIKE :pattern)" if q else ""
+        pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+        async with request.app.state.read_engine.connect() as conn:
+            result = await conn.execute(
+                text(f"""
+                    SELECT {BOOK_COLUMNS}
+                    FROM book_availability
+                    WHERE book_id > :after
+                      {title_filter}
+                    ORDER BY book_id
+                    LIMIT :limit
+                """),
+                {"after": after, "limit": limit + 1, "pattern": pattern}
+            )
+            rows = [dict(row) for row in result.mappings()]
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return JSONResponse({
+            "books": rows,
+            "next_after": rows[-1]["book_id"] if has_more else None
+        })
+
+    # Availability of one book, with its copies
+    async def book_availability(request):
+        book_id = request.path_params["book_id"]
+
+        async with request.app.state.read_engine.connect() as conn:
+            book = (await conn.execute(
+                text(f"SELECT {BOOK_COLUMNS} FROM book_availability WHERE book_id = :book_id"),
+                {"book_id": book_id}
+            )).mappings().one_or_none()
+
+            if book is None:
+                return error("Book not found", 404)
+
+            copies = (await conn.execute(
+                text("""
+                    SELECT
+                        bc.id AS book_copy_id,
+                        bc.isbn,
+                        EXISTS (
+                            SELECT 1 FROM issue i
+                            WHERE i.book_copy_id = bc.id AND COALESCE(i.return_datetime, 'infinity'::timestamp) > CURRENT_TIMESTAMP
+                        ) AS issued,
+                        EXISTS (
+                            SELECT 1 FROM reservation r
+                            WHERE r.book_copy_id = bc.id AND r.to_datetime > CURRENT_TIMESTAMP
+                        ) AS reserved
+                    FROM book_copy bc
+                    WHERE bc.book_id = :book_id
+                    ORDER BY bc.id
+                """),
+                {"book_id": book_id}
+            )).mappings().all()
+
+        return JSONResponse({**dict(book), "copies": [dict(c) for c in copies]})
+
+    # Books that readers who liked this one also liked, best first (precomputed by `flask build-recommendations`)
+    async def similar_books(request):
+        book_id = request.path_params["book_id"]
+        try:
+            limit = int_param(request, "limit", min(10, RECOMMENDATION_TOP_K), maximum=RECOMMENDATION_TOP_K)
+        except ValueError as e:
+            return error(f"Invalid {e} parameter", 400)
+
+        async with request.app.state.read_engine.connect() as conn:
+            result = await conn.execute(
+                text(f"""
+                    SELECT {BOOK_COLUMNS}, s.score
+                    FROM (
+                        SELECT similar_book_id AS book_id, rank, score
+                        FROM book_similarity
+                        WHERE book_id = :book_id
+                          AND rank <= :limit
+                    ) s
+                    JOIN book_availability USING (book_id)
+                    ORDER BY s.rank
+                """),
+                {"book_id": book_id, "limit": limit}
+            )
+            rows = [dict(row) for row in result.mappings()]
+
+        return JSONResponse({"book_id": book_id, "similar": rows})
+
+    # Latest notifications of the logged-in reader, keyset-paginated on (sent_datetime, id) with ?after=<cursor>
+    # like the web page, so the (reader_id, sent_datetime DESC) index serves every page
+    async def notifications(request):
+        try:
+            limit = int_param(request, "limit", API_PAGE_SIZE, maximum=API_MAX_PAGE_SIZE)
+            after = notification_cursor_param(request, "after")
+        except ValueError as e:
+            return error(f"Invalid {e} parameter", 400)
+
+        reader_id = await current_reader_id(request)
+        if reader_id is None:
+            return error("Not logged in as a reader", 401)
+
+        cursor_filter = "AND (sent_datetime, id) < (:k0, :k1)" if after else ""
+        async with request.app.state.engine.connect() as conn:
+            result = await conn.execute(
+                text(f"""
+                    SELECT id, sent_datetime, subject, body, read
+                    FROM app_notification
+                    WHERE reader_id = :reader_id
+                      AND {NOTIFICATION_WINDOW}
+                      {cursor_filter}
+                    ORDER BY sent_datetime DESC, id DESC
+                    LIMIT :limit
+                """),
+                {"reader_id": reader_id, "k0": after and after[0], "k1": after and after[1], "limit": limit + 1}
+            )
+            rows = result.mappings().all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return JSONResponse({
+            "notifications": [
+                {**dict(n), "sent_datetime": n["sent_datetime"].isoformat(timespec="seconds")}
+                for n in rows
+            ],
+            "next_after": encode_cursor([rows[-1]["sent_datetime"], rows[-1]["id"]]) if has_more else None
+        })
+
+    # Unread notification count (the endpoint polled by the mobile app)
+    async def unread_count(request):
+        reader_id = await current_reader_id(request)
+        if reader_id is None:
+            return error("Not logged in as a reader", 401)
+
+        async with request.app.state.engine.connect() as conn:
+            result = await conn.execute(
+                text("SELECT unread_count FROM reader_notification_counter WHERE reader_id = :reader_id"),
+                {"reader_id": reader_id}
+            )
+            return JSONResponse({"unread_count": result.scalar_one_or_none() or 0})
+
+    return Starlette(
+        routes=[
+            Route("/api/v1/books", books),
+            Route("/api/v1/books/{book_id:int}/availability", book_availability),
+            Route("/api/v1/books/{book_id:int}/similar", similar_books),
+            Route("/api/v1/notifications", notifications),
+            Route("/api/v1/notifications/unread_count", unread_count),
+        ],
+        lifespan=lifespan
+    )
@@ -3,7 +3,16 @@ from flask import session, abort, redirect, url_for
 from sqlalchemy import text
 from functools import wraps
 from . import db
-from .utility import is_superadmin_role
+from .utility import PERMISSION_MATRIX, has_permission
+
+# Helper: reader id of the logged-in user, cached in the session
+def current_reader_id(conn):
+    if "reader_id" not in session:
+        session["reader_id"] = conn.execute(
+            text("SELECT reader_id FROM app_user WHERE app_user.id = :user_id LIMIT 1"),
+            {"user_id": session["user_id"]}
+        ).scalar_one_or_none()
+    return session["reader_id"]
 
 # Require logined user
 def login_required(f):
@@ -31,27 +40,10 @@ def require_permission(entity, access_level):
             if "role_id" not in session:
                 abort(401)
 
-            with db.engine.connect() as conn:
-                if not session.get("is_superadmin"):
-                    allowed = not conn.execute(
-                        text("""
-                            SELECT 1
-                            FROM app_role_entity_permission rp
-                            JOIN entity_permission p
-                                ON p.id = rp.permission_id
-                            WHERE rp.role_id = :role_id
-                                AND p.entity = :entity
-                                AND p.access_level >= :access_level
-                        """),
-                        {
-                            "role_id": session["role_id"],
-                            "entity": entity,
-                            "access_level": access_level
-                        }
-                    ).scalar()
-
-                    if not allowed:
-                        abort(403)
+            if not session.get("is_superadmin"):
+                matrix = PERMISSION_MATRIX.get_from(db.engine)
+                if not has_permission(matrix, session["role_id"], entity, access_level):
+                    abort(403)
 
             return f(*args, **kwargs)
         return wrapper
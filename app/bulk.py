@@ -0,0 +1,525 @@
+# bulk.py
+from sqlalchemy import text
+from itertools import islice
+from pathlib import Path
+import csv
+import io
+import json
+import queue
+import threading
+import zlib
+
+CATALOG_FIELDS = [
+    "title",
+    "description",
+    "publisher",
+    "isbn",
+    "year_published",
+    "place_of_publication",
+    "purchase_price",
+    "copies",
+]
+
+# Helper: stream rows into a table with COPY ... FROM STDIN (CSV, empty field = NULL)
+def copy_rows(conn, table, columns, rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    with conn.connection.cursor() as cur:
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+# Parse pasted/uploaded CSV (header row of column names) for a table. Empty fields are NULL.
+# Returns (header, rows); raises ValueError for unknown columns, ragged rows or more than max_rows rows.
+def parse_table_csv(data, columns, max_rows):
+    reader = csv.reader(io.StringIO(data))
+    header = [name.strip() for name in next(reader, [])]
+    if not header:
+        raise ValueError("The CSV is empty")
+
+    unknown = [name for name in header if name not in columns]
+    if unknown:
+        raise ValueError(f"Unknown or read-only columns: {', '.join(unknown)}")
+    if len(set(header)) != len(header):
+        raise ValueError("The header repeats a column")
+
+    rows = []
+    for row in reader:
+        if not any(field.strip() for field in row):
+            continue
+        if len(row) != len(header):
+            raise ValueError(f"Line {reader.line_num}: expected {len(header)} fields, got {len(row)}")
+        if len(rows) == max_rows:
+            raise ValueError(f"The CSV has more than {max_rows} rows")
+        rows.append([field if field != "" else None for field in row])
+    return header, rows
+
+# Insert rows into a table with a single INSERT ... SELECT FROM unnest(...) statement.
+# column_types maps column names to their Postgres type names (udt_name); returns the inserted row count.
+def insert_rows(conn, table, header, rows, column_types):
+    params = {f"c{i}": [row[i] for row in rows] for i in range(len(header))}
+    arrays = ", ".join(f"CAST(:c{i} AS {column_types[name]}[])" for i, name in enumerate(header))
+    return conn.execute(
+        text(f"INSERT INTO {table} ({', '.join(header)}) SELECT * FROM unnest({arrays})"),
+        params
+    ).rowcount
+
+# Helper: guess input format from the file extension
+def detect_format(path):
+    return "ndjson" if Path(path).suffix.lower() in (".ndjson", ".jsonl", ".json") else "csv"
+
+# Read records from a CSV (with header) or NDJSON file.
+# Yields (line_no, record, error); record is None when the line couldn't be parsed.
+def read_records(path, fmt):
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from parse_records(f, fmt)
+
+# Same as read_records, from an open text file (e.g. an upload)
+def parse_records(f, fmt):
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line_no, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "record is not a JSON object"
+            continue
+        yield line_no, record, None
+
+# Helper: list field from a record (JSON list or separator-joined string)
+def split_list(value, separator):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        items = value
+    else:
+        items = str(value).split(separator)
+    return [str(item).strip() for item in items if str(item).strip()]
+
+# Helper: yield lists of up to `size` items
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+# Create per-session staging tables for the catalog import (emptied on every commit)
+def create_catalog_staging(conn):
+    conn.execute(text("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS catalog_staging (
+            line_no BIGINT PRIMARY KEY,
+            title TEXT,
+            description TEXT,
+            publisher TEXT,
+            isbn TEXT,
+            year_published TEXT,
+            place_of_publication TEXT,
+            purchase_price TEXT,
+            copies TEXT
+        ) ON COMMIT DELETE ROWS
+    """))
+    conn.execute(text("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS catalog_staging_author (
+            line_no BIGINT NOT NULL,
+            unique_name TEXT NOT NULL
+        ) ON COMMIT DELETE ROWS
+    """))
+    conn.execute(text("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS catalog_staging_category (
+            line_no BIGINT NOT NULL,
+            name TEXT NOT NULL
+        ) ON COMMIT DELETE ROWS
+    """))
+    conn.execute(text("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS catalog_staging_reject (
+            line_no BIGINT PRIMARY KEY,
+            reason TEXT NOT NULL
+        ) ON COMMIT DELETE ROWS
+    """))
+
+# Load one batch of parsed records: COPY into staging, reject invalid rows, then upsert set-based.
+# Returns (stats, rejects); the caller commits.
+def import_catalog_batch(conn, batch, list_separator="|"):
+    rejects = []
+    rows = []
+    authors = []
+    categories = []
+
+    for line_no, record, error in batch:
+        if error:
+            rejects.append((line_no, error))
+            continue
+        rows.append([line_no] + [record.get(field) for field in CATALOG_FIELDS])
+        authors.extend((line_no, name) for name in split_list(record.get("authors"), list_separator))
+        categories.extend((line_no, name) for name in split_list(record.get("categories"), list_separator))
+
+    copy_rows(conn, "catalog_staging", ["line_no"] + CATALOG_FIELDS, rows)
+    copy_rows(conn, "catalog_staging_author", ["line_no", "unique_name"], authors)
+    copy_rows(conn, "catalog_staging_category", ["line_no", "name"], categories)
+
+    # Validate
+    conn.execute(text("""
+        INSERT INTO catalog_staging_reject (line_no, reason)
+        SELECT line_no, reason
+        FROM (
+            SELECT
+                line_no,
+                CASE
+                    WHEN NULLIF(btrim(title), '') IS NULL THEN 'missing title'
+                    WHEN copies IS NOT NULL AND copies !~ '^[0-9]{1,4}$' THEN 'copies is not an integer between 0 and 9999'
+                    WHEN COALESCE(copies, '1') <> '0' AND NULLIF(btrim(publisher), '') IS NULL THEN 'missing publisher'
+                    WHEN COALESCE(copies, '1') <> '0' AND purchase_price IS NULL THEN 'missing purchase_price'
+                    WHEN purchase_price IS NOT NULL AND purchase_price !~ '^[0-9]{1,8}(\\.[0-9]{1,2})?$' THEN 'invalid purchase_price'
+                    WHEN isbn IS NOT NULL AND isbn !~ '^[0-9]{13}$' THEN 'invalid isbn'
+                    WHEN year_published IS NOT NULL AND year_published !~ '^-?[0-9]{1,4}$' THEN 'invalid year_published'
+                END AS reason
+            FROM catalog_staging
+        ) checked
+        WHERE reason IS NOT NULL
+    """))
+    invalid = conn.execute(text("""
+        DELETE FROM catalog_staging s
+        USING catalog_staging_reject r
+        WHERE r.line_no = s.line_no
+        RETURNING r.line_no, r.reason
+    """)).all()
+    rejects.extend((line_no, reason) for line_no, reason in invalid)
+
+    stats = {"rows": len(rows) - len(invalid)}
+
+    stats["authors"] = conn.execute(text("""
+        INSERT INTO author (unique_name)
+        SELECT DISTINCT sa.unique_name
+        FROM catalog_staging_author sa
+        JOIN catalog_staging s ON s.line_no = sa.line_no
+        ON CONFLICT (unique_name) DO NOTHING
+    """)).rowcount
+
+    stats["categories"] = conn.execute(text("""
+        INSERT INTO category (name)
+        SELECT DISTINCT sc.name
+        FROM catalog_staging_category sc
+        JOIN catalog_staging s ON s.line_no = sc.line_no
+        ON CONFLICT (name) DO NOTHING
+    """)).rowcount
+
+    stats["publishers"] = conn.execute(text("""
+        INSERT INTO publisher (name)
+        SELECT DISTINCT btrim(publisher)
+        FROM catalog_staging
+        WHERE NULLIF(btrim(publisher), '') IS NOT NULL
+        ON CONFLICT (name) DO NOTHING
+    """)).rowcount
+
+    # Last description in the file wins; an empty one keeps the stored description
+    stats["books"] = conn.execute(text("""
+        INSERT INTO book (title, description)
+        SELECT DISTINCT ON (btrim(title)) btrim(title), description
+        FROM catalog_staging
+        ORDER BY btrim(title), line_no DESC
+        ON CONFLICT (title) DO UPDATE
+            SET description = COALESCE(EXCLUDED.description, book.description)
+    """)).rowcount
+
+    conn.execute(text("""
+        INSERT INTO book_author (book_id, author_id)
+        SELECT DISTINCT b.id, a.id
+        FROM catalog_staging s
+        JOIN book b ON b.title = btrim(s.title)
+        JOIN catalog_staging_author sa ON sa.line_no = s.line_no
+        JOIN author a ON a.unique_name = sa.unique_name
+        ON CONFLICT DO NOTHING
+    """))
+
+    conn.execute(text("""
+        INSERT INTO book_category (book_id, category_id)
+        SELECT DISTINCT b.id, c.id
+        FROM catalog_staging s
+        JOIN book b ON b.title = btrim(s.title)
+        JOIN catalog_staging_category sc ON sc.line_no = s.line_no
+        JOIN category c ON c.name = sc.name
+        ON CONFLICT DO NOTHING
+    """))
+
+    stats["copies"] = conn.execute(text("""
+        INSERT INTO book_copy (isbn, year_published, place_of_publication, book_id, publisher_id, purchase_price)
+        SELECT
+            s.isbn,
+            s.year_published::SMALLINT,
+            s.place_of_publication,
+            b.id,
+            p.id,
+            s.purchase_price::NUMERIC(10, 2)
+        FROM catalog_staging s
+        JOIN book b ON b.title = btrim(s.title)
+        JOIN publisher p ON p.name = btrim(s.publisher)
+        CROSS JOIN generate_series(1, COALESCE(s.copies, '1')::INTEGER)
+    """)).rowcount
+
+    return stats, rejects
+
+# Helper: read book updates from a JSON array file or an NDJSON file
+def read_book_updates(path):
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    if content.lstrip().startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+# Apply a batch of book updates with the set-based update_books procedure
+def update_books(conn, books):
+    conn.execute(text("CALL update_books(CAST(:books AS JSONB))"), {"books": json.dumps(books)})
+
+# Read-only views that can be exported next to the registered tables
+EXPORT_VIEWS = {
+    "book_info_view": "Book info",
+    "reader_info_view": "Reader info",
+    "user_info_view": "User info",
+}
+
+# Stream a table/view as CSV (with header) or NDJSON text chunks.
+# CSV comes from COPY, so it matches `flask export-table` byte for byte; NDJSON is built from a server-side cursor.
+def export_chunks(conn, name, fmt="csv", fetch_size=5000):
+    if fmt == "csv":
+        yield from copy_chunks(conn, name)
+        return
+
+    result = conn.execution_options(stream_results=True, yield_per=fetch_size).execute(text(f"SELECT * FROM {name}"))
+    columns = list(result.keys())
+    buf = io.StringIO()
+
+    for rows in result.partitions():
+        for row in rows:
+            buf.write(json.dumps(dict(zip(columns, row)), default=str))
+            buf.write("\n")
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+class ExportCancelled(Exception):
+    pass
+
+# Text file object handing COPY output to a bounded queue in chunks of about chunk_size characters.
+# Writing fails once the reader has gone away, which aborts the COPY.
+class QueueWriter(io.TextIOBase):
+    def __init__(self, chunks, cancelled, chunk_size):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.chunk_size = chunk_size
+        self.pending = []
+        self.pending_size = 0
+
+    def write(self, data):
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size >= self.chunk_size:
+            self.emit()
+        return len(data)
+
+    def emit(self):
+        if self.pending:
+            self.put("".join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+
+    def put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise ExportCancelled()
+
+# Stream COPY ... TO STDOUT (CSV with header) as text chunks. COPY blocks until the whole table is written,
+# so it runs in a helper thread on `conn` while this generator yields what it has produced so far.
+def copy_chunks(conn, name, chunk_size=65536, queue_size=8):
+    chunks = queue.Queue(queue_size)
+    cancelled = threading.Event()
+    done = object()
+
+    def run():
+        writer = QueueWriter(chunks, cancelled, chunk_size)
+        try:
+            copy_table_to(conn, name, writer)
+            writer.emit()
+            writer.put(done)
+        except ExportCancelled:
+            pass
+        except Exception as e:
+            try:
+                writer.put(e)
+            except ExportCancelled:
+                pass
+
+    thread = threading.Thread(target=run, name=f"copy-{name}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+        thread.join()
+
+# Helper: gzip-compress a stream of text chunks on the fly (each chunk is flushed to the client)
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+# Write a table/view as CSV with COPY ... TO STDOUT into a text file object
+def copy_table_to(conn, name, f):
+    with conn.connection.cursor() as cur:
+        cur.copy_expert(f"COPY (SELECT * FROM {name}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+
+
+READER_FIELDS = ["username", "first_name", "last_name", "password"]
+
+# Create the per-session staging table for the reader import (emptied on every commit)
+def create_reader_staging(conn):
+    conn.execute(text("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS reader_staging (
+            line_no BIGINT PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            password_hash TEXT,
+            card_no VARCHAR(15)
+        ) ON COMMIT DELETE ROWS
+    """))
+
+# Hash the passwords of every parsed record of a batch up front (generating the missing ones with new_password()),
+# so import_readers_batch(..., hashed=...) doesn't hold its transaction open while hashing.
+# Returns {line_no: (password_hash, generated_password or None)}.
+def hash_reader_passwords(batch, hash_many, new_password):
+    line_nos = []
+    passwords = []
+    generated = {}
+    for line_no, record, error in batch:
+        if error:
+            continue
+        password = record.get("password") or None
+        if password is None:
+            password = generated[line_no] = new_password()
+        line_nos.append(line_no)
+        passwords.append(password)
+    return {line_no: (password_hash, generated.get(line_no)) for line_no, password_hash in zip(line_nos, hash_many(passwords))}
+
+# Provision one batch of reader + app_user pairs set-based.
+# Records missing fields or whose username is taken (in the database or earlier in the file) are rejected
+# in bulk before any password is hashed. hash_many(passwords) returns the hashes of the accepted rows;
+# rows without a password get one from new_password(), returned so it can be handed out.
+# With `hashed` (from hash_reader_passwords) nothing is hashed here and the precomputed values are used.
+# Returns (created, rejects): created is [(line_no, username, card_no, generated_password)]; the caller commits.
+def import_readers_batch(conn, batch, hash_many=None, new_password=None, hashed=None):
+    rejects = []
+    rows = []
+    passwords = {}
+
+    for line_no, record, error in batch:
+        if error:
+            rejects.append((line_no, error))
+            continue
+        rows.append([line_no] + [(str(record.get(field) or "").strip() or None) for field in READER_FIELDS[:3]])
+        passwords[line_no] = record.get("password") or None
+
+    copy_rows(conn, "reader_staging", ["line_no", "username", "first_name", "last_name"], rows)
+
+    invalid = conn.execute(text("""
+        WITH checked AS (
+            SELECT
+                s.line_no,
+                CASE
+                    WHEN s.username IS NULL THEN 'missing username'
+                    WHEN s.first_name IS NULL THEN 'missing first_name'
+                    WHEN s.last_name IS NULL THEN 'missing last_name'
+                    WHEN u.id IS NOT NULL THEN 'username already exists'
+                    WHEN s.line_no <> MIN(s.line_no) OVER (PARTITION BY s.username) THEN 'duplicate username in file'
+                END AS reason
+            FROM reader_staging s
+            LEFT JOIN app_user u ON u.username = s.username
+        )
+        DELETE FROM reader_staging s
+        USING checked c
+        WHERE c.line_no = s.line_no AND c.reason IS NOT NULL
+        RETURNING c.line_no, c.reason
+    """)).all()
+    rejects.extend((line_no, reason) for line_no, reason in invalid)
+
+    accepted = conn.execute(text("SELECT line_no FROM reader_staging ORDER BY line_no")).scalars().all()
+    if not accepted:
+        return [], rejects
+
+    if hashed is None:
+        generated = {line_no: new_password() for line_no in accepted if passwords[line_no] is None}
+        hashes = hash_many([passwords[line_no] or generated[line_no] for line_no in accepted])
+    else:
+        generated = {line_no: hashed[line_no][1] for line_no in accepted if hashed[line_no][1] is not None}
+        hashes = [hashed[line_no][0] for line_no in accepted]
+
+    conn.execute(
+        text("""
+            UPDATE reader_staging s
+            SET password_hash = h.password_hash,
+                card_no = next_card_no()
+            FROM unnest(CAST(:line_nos AS BIGINT[]), CAST(:hashes AS TEXT[])) AS h(line_no, password_hash)
+            WHERE h.line_no = s.line_no
+        """),
+        {"line_nos": list(accepted), "hashes": hashes}
+    )
+
+    # A username or card number taken by a concurrent import since the check above is skipped, not fatal:
+    # such rows are missing from RETURNING and are rejected below
+    inserted = conn.execute(text("""
+        WITH new_reader AS (
+            INSERT INTO reader (card_no, first_name, last_name)
+            SELECT card_no, first_name, last_name
+            FROM reader_staging
+            ORDER BY line_no
+            ON CONFLICT DO NOTHING
+            RETURNING id, card_no
+        ),
+        new_user AS (
+            INSERT INTO app_user (username, password_hash, reader_id, is_active)
+            SELECT s.username, s.password_hash, r.id, TRUE
+            FROM reader_staging s
+            JOIN new_reader r ON r.card_no = s.card_no
+            ON CONFLICT DO NOTHING
+            RETURNING username
+        )
+        SELECT s.line_no, s.username, s.card_no, r.id AS reader_id, u.username IS NOT NULL AS has_user
+        FROM reader_staging s
+        LEFT JOIN new_reader r ON r.card_no = s.card_no
+        LEFT JOIN new_user u ON u.username = s.username
+        ORDER BY s.line_no
+    """)).all()
+
+    created = []
+    orphans = []
+    for line_no, username, card_no, reader_id, has_user in inserted:
+        if has_user:
+            created.append((line_no, username, card_no, generated.get(line_no)))
+        elif reader_id is None:
+            rejects.append((line_no, "card number already exists"))
+        else:
+            orphans.append(reader_id)
+            rejects.append((line_no, "username already exists"))
+
+    # Readers whose app_user was skipped would be left without an account
+    if orphans:
+        conn.execute(text("DELETE FROM reader WHERE id = ANY(:ids)"), {"ids": orphans})
+
+    return created, rejects
@@ -0,0 +1,163 @@
+# cache.py
+from sqlalchemy import text
+from collections import OrderedDict
+import threading
+import time
+import os
+
+# Default number of seconds a cached value is trusted before its version is re-checked
+DEFAULT_CACHE_TTL = float(os.getenv("CACHE_VERSION_TTL", "5"))
+
+# Helper: read the current version stamp of a named cache
+def get_cache_version(conn, name):
+    return conn.execute(
+        text("SELECT version FROM cache_version WHERE name = :name"),
+        {"name": name}
+    ).scalar_one_or_none() or 0
+
+# Helper: bump the version stamp of a named cache (invalidates it in every process)
+def bump_cache_version(conn, name):
+    return conn.execute(
+        text("SELECT bump_cache_version(:name)"),
+        {"name": name}
+    ).scalar_one()
+
+
+# Process-wide cache for a value built from the database.
+# The value is rebuilt by loader(conn) whenever the matching cache_version row changes.
+# The version is re-checked at most once every `ttl` seconds, so most reads cost no round-trip.
+class VersionedCache:
+    def __init__(self, name, loader, ttl=None):
+        self.name = name
+        self.loader = loader
+        self.ttl = DEFAULT_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def _is_fresh(self):
+        return self._version is not None and time.monotonic() - self._checked_at < self.ttl
+
+    def get(self, conn):
+        if self._is_fresh():
+            return self._value
+
+        with self._lock:
+            if self._is_fresh():
+                return self._value
+
+            version = get_cache_version(conn, self.name)
+            if version != self._version:
+                self._value = self.loader(conn)
+                self._version = version
+            self._checked_at = time.monotonic()
+            return self._value
+
+    # Like get(), but only checks out a connection from `engine` when the value is stale
+    def get_from(self, engine):
+        if self._is_fresh():
+            return self._value
+        with engine.connect() as conn:
+            return self.get(conn)
+
+    @property
+    def version(self):
+        return self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._version = None
+            self._checked_at = 0.0
+
+
+# Process-wide bounded LRU cache of values derived from the database (e.g. rendered page fragments).
+# All entries are dropped when the matching cache_version row changes; like VersionedCache,
+# the version is re-checked at most once every `ttl` seconds.
+class VersionedLRUCache:
+    def __init__(self, name, maxsize, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = DEFAULT_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self._changed_at = None
+        self._checked_at = 0.0
+
+    def _is_fresh(self):
+        return self._version is not None and time.monotonic() - self._checked_at < self.ttl
+
+    # Current (version, changed_at); only checks out a connection from `engine` when the version is stale
+    def stamp_from(self, engine):
+        if self._is_fresh():
+            return self._version, self._changed_at
+
+        with self._lock:
+            if not self._is_fresh():
+                with engine.connect() as conn:
+                    row = conn.execute(
+                        text("SELECT version, changed_at FROM cache_version WHERE name = :name"),
+                        {"name": self.name}
+                    ).one_or_none()
+                version, changed_at = row or (0, None)
+                if version != self._version:
+                    self._entries.clear()
+                    self._version = version
+                    self._changed_at = changed_at
+                self._checked_at = time.monotonic()
+            return self._version, self._changed_at
+
+    def get(self, version, key):
+        with self._lock:
+            if version != self._version or key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    # Values built under an older version than the current one are not stored
+    def put(self, version, key, value):
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+            self._changed_at = None
+            self._checked_at = 0.0
+
+
+# Process-wide bounded LRU cache whose entries expire `ttl` seconds after they were stored.
+# For values without a cache_version row, where a short staleness window is acceptable.
+class TTLCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
@@ -0,0 +1,204 @@
+# catalog.py
+
+SEARCH_FIELDS = ["q", "title", "authors", "categories", "description"]
+
+# Text search configuration of book_availability.search_vector
+SEARCH_CONFIG = "english"
+# Weight of the title's trigram word similarity (typo tolerance) next to ts_rank in the relevance score
+SEARCH_SIMILARITY_WEIGHT = 0.5
+# Relevance searches count their matches only up to this number (shown as "1000+")
+SEARCH_COUNT_LIMIT = 1000
+
+# Normalize the /books query string into (filters, page): stripped non-empty search fields,
+# available_only only when set, unknown parameters dropped. Equal searches give equal filters.
+def normalize_book_search(args):
+    filters = {}
+    for field in SEARCH_FIELDS:
+        value = args.get(field, "").strip()
+        if value:
+            filters[field] = value
+    if args.get("available_only") == "1":
+        filters["available_only"] = "1"
+
+    try:
+        page = max(int(args.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    return filters, page
+
+# Helper: match `value` literally in an ILIKE pattern (facet links search for exact author/category names)
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+# Helper: conditions on book `b` for the advanced search fields (title, authors, categories, description).
+# Terms of one field separated with || are OR-ed, fields are AND-ed. Returns (conditions, params).
+def field_conditions(args):
+    searches = {
+        "title": ("b.title ILIKE :{param}", args.get("title", "").strip()),
+        "authors": (
+            "EXISTS (SELECT 1 FROM book_author ba JOIN author a ON a.id = ba.author_id "
+            "WHERE ba.book_id = b.id AND a.unique_name ILIKE :{param})",
+            args.get("authors", "").strip()
+        ),
+        "categories": (
+            "EXISTS (SELECT 1 FROM book_category bc JOIN category c ON c.id = bc.category_id "
+            "WHERE bc.book_id = b.id AND c.name ILIKE :{param})",
+            args.get("categories", "").strip()
+        ),
+        "description": ("b.description ILIKE :{param}", args.get("description", "").strip())
+    }
+
+    conditions = []
+    params = {}
+    param_counter = 0
+
+    for condition, search_string in searches.values():
+        local_conditions = []
+        for pattern in search_string.split("||"):
+            if not pattern:
+                continue
+
+            param = f"p{param_counter}"
+            param_counter += 1
+            local_conditions.append(condition.format(param=param))
+            params[param] = f"{pattern}"
+
+        if local_conditions:
+            conditions.append("(" + " OR ".join(local_conditions) + ")")
+
+    return conditions, params
+
+# Build the catalog search statement behind /books: one query returning the total,
+# a page of books (JSON), author/category facet counts and availability counts.
+# `args` is a mapping of the search form fields (title, authors, categories, description, available_only).
+def build_book_search(args, page=1, page_size=20, facet_limit=10):
+    conditions, params = field_conditions(args)
+    where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+    params["available_only"] = args.get("available_only") == "1"
+    params["limit"] = page_size
+    params["offset"] = (page - 1) * page_size
+    params["facet_limit"] = facet_limit
+
+    query = f"""
+        WITH matched AS MATERIALIZED (
+            SELECT
+                v.book_id,
+                v.title,
+                v.authors,
+                v.categories,
+                v.description,
+                v.total_copies,
+                v.currently_issued_copies,
+                v.currently_reserved_copies,
+                v.avg_rating,
+                (v.total_copies - v.currently_issued_copies - v.currently_reserved_copies) > 0 AS available
+            FROM book_availability v
+            WHERE v.book_id IN (
+                SELECT b.id
+                FROM book b
+                {where_clause}
+            )
+        ),
+        filtered AS MATERIALIZED (
+            SELECT *
+            FROM matched
+            WHERE available OR NOT :available_only
+        )
+        SELECT
+            (SELECT COUNT(*) FROM filtered) AS total,
+            (
+                SELECT COALESCE(json_agg(p ORDER BY p.title), '[]'::json)
+                FROM (
+                    SELECT *
+                    FROM filtered
+                    ORDER BY title
+                    LIMIT :limit OFFSET :offset
+                ) p
+            ) AS books,
+            (
+                SELECT COALESCE(json_agg(json_build_object('name', f.name, 'count', f.count) ORDER BY f.count DESC, f.name), '[]'::json)
+                FROM (
+                    SELECT a.unique_name AS name, COUNT(*) AS count
+                    FROM filtered
+                    JOIN book_author ba ON ba.book_id = filtered.book_id
+                    JOIN author a ON a.id = ba.author_id
+                    GROUP BY a.unique_name
+                    ORDER BY count DESC, name
+                    LIMIT :facet_limit
+                ) f
+            ) AS author_facets,
+            (
+                SELECT COALESCE(json_agg(json_build_object('name', f.name, 'count', f.count) ORDER BY f.count DESC, f.name), '[]'::json)
+                FROM (
+                    SELECT c.name AS name, COUNT(*) AS count
+                    FROM filtered
+                    JOIN book_category bc ON bc.book_id = filtered.book_id
+                    JOIN category c ON c.id = bc.category_id
+                    GROUP BY c.name
+                    ORDER BY count DESC, name
+                    LIMIT :facet_limit
+                ) f
+            ) AS category_facets,
+            (SELECT COUNT(*) FILTER (WHERE available) FROM matched) AS available_count,
+            (SELECT COUNT(*) FILTER (WHERE NOT available) FROM matched) AS unavailable_count
+    """
+    return query, params
+
+# Build the relevance search behind /books?q=: books whose search_vector matches the words of `q`
+# (web search syntax: "phrases", or, -word) or whose title is trigram-similar to it (typos),
+# best first by ts_rank blended with the title similarity. Returns one row with the page of
+# books (JSON) and the number of matches counted up to count_limit; the advanced search fields
+# and available_only narrow the matches further.
+def build_ranked_search(args, page=1, page_size=20, count_limit=SEARCH_COUNT_LIMIT):
+    conditions, params = field_conditions(args)
+    book_filter = f"v.book_id IN (SELECT b.id FROM book b WHERE {' AND '.join(conditions)})" if conditions else ""
+
+    params["q"] = args.get("q", "").strip()
+    params["available_only"] = args.get("available_only") == "1"
+    params["similarity_weight"] = SEARCH_SIMILARITY_WEIGHT
+    params["count_limit"] = count_limit
+    params["limit"] = page_size
+    params["offset"] = (page - 1) * page_size
+
+    tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', :q)"
+    match = "\n                      AND ".join(filter(None, [
+        f"(v.search_vector @@ {tsquery} OR :q <% v.title)",
+        "((v.total_copies - v.currently_issued_copies - v.currently_reserved_copies) > 0 OR NOT :available_only)",
+        book_filter
+    ]))
+
+    query = f"""
+        SELECT
+            (
+                SELECT COUNT(*)
+                FROM (
+                    SELECT 1
+                    FROM book_availability v
+                    WHERE {match}
+                    LIMIT :count_limit
+                ) c
+            ) AS total,
+            (
+                SELECT COALESCE(json_agg(p ORDER BY p.rank DESC, p.book_id), '[]'::json)
+                FROM (
+                    SELECT
+                        v.book_id,
+                        v.title,
+                        v.authors,
+                        v.categories,
+                        v.description,
+                        v.total_copies,
+                        v.currently_issued_copies,
+                        v.currently_reserved_copies,
+                        v.avg_rating,
+                        ts_rank(v.search_vector, {tsquery}, 1)
+                            + :similarity_weight * word_similarity(:q, v.title) AS rank
+                    FROM book_availability v
+                    WHERE {match}
+                    ORDER BY rank DESC, v.book_id
+                    LIMIT :limit OFFSET :offset
+                ) p
+            ) AS books
+    """
+    return query, params
@@ -1,10 +1,23 @@
 # commands.py
 from werkzeug.security import generate_password_hash
 from sqlalchemy import text
+import csv
+import gzip
 import os
+import sys
+import time
 import click
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from . import db
-from .utility import load_table_registry
+from .utility import load_table_registry, load_schema_catalog, SCHEMA_CATALOG
+from .cache import bump_cache_version
+from .passwords import PASSWORD_HASH_METHOD, bulk_hash_pool, hash_passwords, generate_password
+from .bulk import batched, create_catalog_staging, create_reader_staging, import_readers_batch, detect_format, import_catalog_batch, read_records, read_book_updates, update_books, export_chunks, copy_table_to, EXPORT_VIEWS
+from .synthetic import seed_synthetic
+from .rollups import ROLLUP_CHUNK_DAYS, ROLLUP_WORKERS, rollup_chunks, build_rollup_chunk, default_rollup_range, set_rollup_watermark, circulation_report, report_month_range, get_rollup_watermark
+from .recommendations import RECOMMENDATION_TOP_K, RECOMMENDATION_CHUNK_BOOKS, SimilarityModel, similarity_watermark, set_similarity_watermark, stale_books, store_book_similarity, prune_book_similarity
+from .notifications import NOTIFICATION_RETENTION_MONTHS, send_reminders, expired_notification_partitions, drop_notification_partition, purge_reminder_claims
 
 def register_commands(app):
     # CLI command for creating a user with superadmin role
@@ -31,7 +44,7 @@ def register_commands(app):
                             password_hash = EXCLUDED.password_hash,
                             role_id = get_role_id(:superadmin_role)
                 """),
-                {"username": username, "pswd_hash": generate_password_hash(password), "superadmin_role": app_superadmin_role}
+                {"username": username, "pswd_hash": generate_password_hash(password, PASSWORD_HASH_METHOD), "superadmin_role": app_superadmin_role}
             )
         click.echo(f"Created {app_superadmin_role}: {username}")
 
@@ -137,3 +150,392 @@ def register_commands(app):
 
         click.echo(f"Deleted {len(orphan_permissions)} orphan permissions")
 
+    # CLI command for reloading the schema catalog cache in every running process
+    @app.cli.command("reload-schema-cache")
+    def reload_schema_cache():
+        with db.engine.begin() as conn:
+            version = bump_cache_version(conn, "schema")
+            catalog = load_schema_catalog(conn)
+        SCHEMA_CATALOG.invalidate()
+
+        missing = [name for name, table in catalog["tables"].items() if not table["columns"]]
+        click.echo(f"Schema cache version bumped to {version}: {len(catalog['tables']) - len(missing)} tables, {len(catalog['enums'])} enum types")
+        for name in missing:
+            click.echo(f" - {name} is registered but doesn't exist", err=True)
+
+    # CLI command for fully rebuilding the book_availability summary
+    @app.cli.command("rebuild-book-availability")
+    @click.option("--batch-size", default=10000, show_default=True, help="Books refreshed per transaction")
+    def rebuild_book_availability(batch_size):
+        refreshed = 0
+        last_id = 0
+
+        while True:
+            with db.engine.begin() as conn:
+                book_ids = conn.execute(
+                    text("""
+                        SELECT id
+                        FROM book
+                        WHERE id > :last_id
+                        ORDER BY id
+                        LIMIT :batch_size
+                    """),
+                    {"last_id": last_id, "batch_size": batch_size}
+                ).scalars().all()
+
+                if not book_ids:
+                    break
+
+                refreshed += conn.execute(
+                    text("SELECT refresh_book_availability(:book_ids)"),
+                    {"book_ids": book_ids}
+                ).scalar_one()
+                last_id = book_ids[-1]
+
+            click.echo(f"Refreshed {refreshed} books")
+
+        click.echo(f"Rebuilt book availability for {refreshed} books")
+
+    # CLI command for refreshing books whose issues/reservations expired without a write (run periodically)
+    @app.cli.command("sweep-book-availability")
+    def sweep_book_availability():
+        with db.engine.begin() as conn:
+            refreshed = conn.execute(text("SELECT sweep_book_availability()")).scalar_one()
+        click.echo(f"Refreshed {refreshed} books with expired issues or reservations")
+
+    # CLI command for generating due-soon, overdue and reservation-expiring notifications (run periodically)
+    @app.cli.command("send-reminders")
+    def send_reminders_command():
+        with db.engine.begin() as conn:
+            sent = send_reminders(conn)
+        for kind, count in sent.items():
+            click.echo(f"{kind}: {count} notifications")
+
+    # CLI command for dropping notification partitions older than the retention window (run monthly)
+    @app.cli.command("prune-notifications")
+    @click.option("--retention-months", default=NOTIFICATION_RETENTION_MONTHS, show_default=True, help="Months kept besides the current one")
+    @click.option("--archive-dir", type=click.Path(file_okay=False, writable=True), help="Write each partition to <dir>/<partition>.csv.gz before dropping it")
+    @click.option("--dry-run", is_flag=True, help="List the partitions that would be dropped without dropping them")
+    def prune_notifications(retention_months, archive_dir, dry_run):
+        with db.engine.connect() as conn:
+            expired = expired_notification_partitions(conn, retention_months)
+
+        for name, month in expired:
+            if dry_run:
+                click.echo(f"Would drop {name} ({month:%Y-%m})")
+                continue
+
+            # One transaction per partition, so the exclusive lock on it is held briefly
+            with db.engine.begin() as conn:
+                if archive_dir:
+                    os.makedirs(archive_dir, exist_ok=True)
+                    with gzip.open(os.path.join(archive_dir, f"{name}.csv.gz"), "wt", encoding="utf-8", newline="") as f:
+                        rows = drop_notification_partition(conn, name, f)
+                else:
+                    rows = drop_notification_partition(conn, name)
+            click.echo(f"Dropped {name} ({rows} notifications)")
+
+        if not dry_run:
+            with db.engine.begin() as conn:
+                purged = purge_reminder_claims(conn, retention_months)
+            click.echo(f"Dropped {len(expired)} partitions, forgot {purged} reminder claims")
+
+    # CLI command for building the daily rollups from the watermark up to yesterday (run daily)
+    @app.cli.command("build-rollups")
+    @click.option("--since", type=click.DateTime(formats=["%Y-%m-%d"]), help="Rebuild from this day instead of the watermark (needed after back-dated changes)")
+    @click.option("--until", type=click.DateTime(formats=["%Y-%m-%d"]), help="First day not built (default: today)")
+    @click.option("--chunk-days", default=ROLLUP_CHUNK_DAYS, show_default=True, help="Days rebuilt per transaction")
+    @click.option("--workers", default=ROLLUP_WORKERS, show_default=True, help="Chunks built concurrently, one connection each")
+    def build_rollups(since, until, chunk_days, workers):
+        with db.engine.connect() as conn:
+            start, end = default_rollup_range(conn)
+        if since:
+            start = since.date()
+        if until:
+            end = until.date()
+
+        chunks = rollup_chunks(start, end, chunk_days)
+        if not chunks:
+            click.echo(f"Rollups are up to date (built until {start})")
+            return
+
+        # Chunks cover disjoint days, so they can commit independently; the engine is captured
+        # here because the worker threads run outside the app context
+        engine = db.engine
+        started = time.perf_counter()
+
+        def build(chunk):
+            with engine.begin() as conn:
+                build_rollup_chunk(conn, *chunk)
+            return chunk
+
+        built = set()
+        failed = None
+        with ThreadPoolExecutor(max(1, workers)) as executor:
+            futures = [executor.submit(build, chunk) for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed = failed or (chunk, e)
+                    continue
+                built.add(chunk)
+                click.echo(f"Built {chunk[0]} .. {chunk[1]}")
+
+        # The watermark only moves past the chunks built without a gap, so a failed chunk is retried next run
+        watermark = start
+        for chunk in chunks:
+            if chunk not in built:
+                break
+            watermark = chunk[1]
+        if watermark > start:
+            with db.engine.begin() as conn:
+                set_rollup_watermark(conn, watermark)
+
+        elapsed = time.perf_counter() - started
+        click.echo(f"Rolled up {len(built)}/{len(chunks)} chunks in {elapsed:.1f}s, built until {watermark}")
+        if failed:
+            (chunk_start, chunk_end), error = failed
+            raise click.ClickException(f"Building {chunk_start} .. {chunk_end} failed: {error}")
+
+    # CLI command for printing the monthly circulation report (reads the rollups only)
+    @app.cli.command("circulation-report")
+    @click.option("--month", type=click.DateTime(formats=["%Y-%m"]), help="Month to report (default: the current one)")
+    def circulation_report_command(month):
+        start, end = report_month_range(month.date() if month else date.today())
+        with db.engine.connect() as conn:
+            report = circulation_report(conn, start, end)
+            built_until = get_rollup_watermark(conn)
+
+        summary = report["summary"]
+        click.echo(f"Circulation {start:%Y-%m} ({summary['days']} days rolled up, built until {built_until or 'never'})")
+        click.echo(f"  Issues: {summary['issues']}, returns: {summary['returns']}, late returns: {summary['late_returns']}")
+        click.echo(f"  Overdue rate: {summary['overdue_rate'] if summary['overdue_rate'] is not None else '-'}%")
+        click.echo(f"  Copy utilisation: {summary['utilisation'] if summary['utilisation'] is not None else '-'}% of {summary['copies'] or 0} copies")
+        click.echo(f"  New reservations: {summary['reservations']}")
+
+        click.echo("Issues per category:")
+        for row in report["categories"]:
+            rate = row["overdue_rate"] if row["overdue_rate"] is not None else "-"
+            click.echo(f"  {row['category']}: {row['issues']} issues, {row['returns']} returns, {rate}% late")
+
+        click.echo("Purchases per publisher:")
+        for row in report["publishers"]:
+            click.echo(f"  {row['publisher']}: {row['copies']} copies, {row['spend']:.2f}")
+
+    # CLI command for rebuilding the "readers who liked this also liked" recommendations (run nightly)
+    @app.cli.command("build-recommendations")
+    @click.option("--full", is_flag=True, help="Recompute every book instead of the ones affected by new ratings")
+    @click.option("--chunk-books", default=RECOMMENDATION_CHUNK_BOOKS, show_default=True, help="Books computed and stored per transaction")
+    @click.option("--top-k", default=RECOMMENDATION_TOP_K, show_default=True, help="Similar books stored per book")
+    def build_recommendations(full, chunk_books, top_k):
+        started = time.perf_counter()
+        with db.engine.connect() as conn:
+            since_id, built_at, until_id, started_at = similarity_watermark(conn)
+            if until_id is None:
+                click.echo("No ratings yet")
+                return
+
+            full = full or since_id is None
+            if not full:
+                book_ids = stale_books(conn, since_id, built_at, until_id)
+                if not book_ids:
+                    click.echo(f"Recommendations are up to date (rating {since_id})")
+                    return
+
+            # The whole rating matrix is needed even for a few books, as they are compared with every book
+            model = SimilarityModel.load(conn, until_id)
+
+        if full:
+            book_ids = model.book_ids.tolist()
+        click.echo(f"Loaded ratings of {len(model.book_ids)} books, computing {len(book_ids)}")
+
+        stored = 0
+        for chunk in batched(book_ids, chunk_books):
+            similarities = model.top_similar(model.rows_of(chunk), top_k)
+            with db.engine.begin() as conn:
+                stored += store_book_similarity(conn, chunk, similarities)
+
+        # Ratings changed or deleted in place are only picked up by a full build
+        with db.engine.begin() as conn:
+            pruned = prune_book_similarity(conn, until_id) if full else 0
+            set_similarity_watermark(conn, until_id, started_at)
+            # Rendered catalog pages show the recommendations
+            bump_cache_version(conn, "catalog")
+
+        elapsed = time.perf_counter() - started
+        click.echo(f"Stored {stored} recommendations for {len(book_ids)} books ({pruned} stale rows dropped) in {elapsed:.1f}s")
+
+    # CLI command for bulk-importing a supplier catalog (CSV with header or NDJSON)
+    @app.cli.command("import-catalog")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), help="Input format (default: from file extension)")
+    @click.option("--batch-size", default=50000, show_default=True, help="Records loaded and committed per batch")
+    @click.option("--list-separator", default="|", show_default=True, help="Separator of authors/categories in CSV fields")
+    @click.option("--rejects", "rejects_path", type=click.Path(dir_okay=False, writable=True), help="Write rejected rows (line_no, reason) to this CSV file")
+    def import_catalog(path, fmt, batch_size, list_separator, rejects_path):
+        fmt = fmt or detect_format(path)
+        totals = {"rows": 0, "rejected": 0, "authors": 0, "categories": 0, "publishers": 0, "books": 0, "copies": 0}
+        rejects_file = open(rejects_path, "w", newline="") if rejects_path else None
+        rejects_writer = csv.writer(rejects_file) if rejects_file else None
+        if rejects_writer:
+            rejects_writer.writerow(["line_no", "reason"])
+
+        started = time.perf_counter()
+        try:
+            with db.engine.connect() as conn:
+                create_catalog_staging(conn)
+                conn.commit()
+
+                for batch in batched(read_records(path, fmt), batch_size):
+                    batch_started = time.perf_counter()
+                    stats, rejects = import_catalog_batch(conn, batch, list_separator)
+                    conn.commit()
+
+                    for key, value in stats.items():
+                        totals[key] += value
+                    totals["rejected"] += len(rejects)
+                    if rejects_writer:
+                        rejects_writer.writerows(sorted(rejects))
+
+                    elapsed = time.perf_counter() - batch_started
+                    click.echo(
+                        f"Batch: {stats['rows']} rows, {len(rejects)} rejected, {stats['copies']} copies "
+                        f"({len(batch) / elapsed:,.0f} rows/s)"
+                    )
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+        elapsed = time.perf_counter() - started
+        processed = totals["rows"] + totals["rejected"]
+        click.echo(
+            f"Imported {totals['rows']} rows ({totals['rejected']} rejected) in {elapsed:.1f}s "
+            f"({processed / elapsed if elapsed else 0:,.0f} rows/s): "
+            f"{totals['books']} books upserted, {totals['copies']} copies, {totals['authors']} new authors, "
+            f"{totals['categories']} new categories, {totals['publishers']} new publishers"
+        )
+
+    # CLI command for provisioning reader + app_user pairs from CSV/NDJSON (username, first_name, last_name, optional password)
+    @app.cli.command("import-readers")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), help="Input format (default: from file extension)")
+    @click.option("--batch-size", default=5000, show_default=True, help="Records provisioned and committed per batch")
+    @click.option("--hash-workers", type=int, help="Password hashing processes (default: one per CPU)")
+    @click.option("--credentials", "credentials_path", type=click.Path(dir_okay=False, writable=True), required=True, help="Write username, card_no and generated password of every created account to this CSV file")
+    @click.option("--rejects", "rejects_path", type=click.Path(dir_okay=False, writable=True), help="Write rejected rows (line_no, reason) to this CSV file")
+    def import_readers(path, fmt, batch_size, hash_workers, credentials_path, rejects_path):
+        fmt = fmt or detect_format(path)
+        created_total = 0
+        rejected_total = 0
+        rejects_file = open(rejects_path, "w", newline="") if rejects_path else None
+        rejects_writer = csv.writer(rejects_file) if rejects_file else None
+        if rejects_writer:
+            rejects_writer.writerow(["line_no", "reason"])
+
+        started = time.perf_counter()
+        try:
+            with open(credentials_path, "w", newline="") as credentials_file, bulk_hash_pool(hash_workers) as pool, db.engine.connect() as conn:
+                credentials_writer = csv.writer(credentials_file)
+                credentials_writer.writerow(["line_no", "username", "card_no", "password"])
+                create_reader_staging(conn)
+                conn.commit()
+
+                for batch in batched(read_records(path, fmt), batch_size):
+                    batch_started = time.perf_counter()
+                    created, rejects = import_readers_batch(conn, batch, lambda passwords: hash_passwords(pool, passwords), generate_password)
+                    conn.commit()
+
+                    credentials_writer.writerows(created)
+                    created_total += len(created)
+                    rejected_total += len(rejects)
+                    if rejects_writer:
+                        rejects_writer.writerows(sorted(rejects))
+
+                    elapsed = time.perf_counter() - batch_started
+                    click.echo(f"Batch: {len(created)} readers created, {len(rejects)} rejected ({len(batch) / elapsed:,.0f} rows/s)")
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+        elapsed = time.perf_counter() - started
+        click.echo(f"Created {created_total} readers ({rejected_total} rejected) in {elapsed:.1f}s")
+
+    # CLI command for batch-updating books (description, authors, categories) from JSON/NDJSON
+    @app.cli.command("update-books")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--batch-size", default=5000, show_default=True, help="Books updated per transaction")
+    def update_books_command(path, batch_size):
+        books = read_book_updates(path)
+        updated = 0
+        started = time.perf_counter()
+
+        for batch in batched(books, batch_size):
+            with db.engine.begin() as conn:
+                update_books(conn, batch)
+            updated += len(batch)
+            click.echo(f"Updated {updated}/{len(books)} books")
+
+        elapsed = time.perf_counter() - started
+        click.echo(f"Updated {updated} books in {elapsed:.1f}s ({updated / elapsed if elapsed else 0:,.0f} books/s)")
+
+    # CLI command for exporting a registered table or view as CSV/NDJSON
+    @app.cli.command("export-table")
+    @click.argument("name")
+    @click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), default="csv", show_default=True)
+    @click.option("--output", "-o", type=click.Path(dir_okay=False, writable=True), help="Output file (default: stdout)")
+    @click.option("--gzip", "compress", is_flag=True, help="Gzip-compress the output")
+    def export_table(name, fmt, output, compress):
+        if name not in load_table_registry() and name not in EXPORT_VIEWS:
+            click.echo(f"{name} is neither a registered table nor an exportable view", err=True)
+            sys.exit(1)
+
+        if compress:
+            f = gzip.open(output or sys.stdout.buffer, "wt", encoding="utf-8", newline="")
+        elif output:
+            f = open(output, "w", encoding="utf-8", newline="")
+        else:
+            f = sys.stdout
+
+        try:
+            with db.engine.connect() as conn:
+                if fmt == "csv":
+                    copy_table_to(conn, name, f)
+                else:
+                    for chunk in export_chunks(conn, name, fmt):
+                        f.write(chunk)
+        finally:
+            if f is not sys.stdout:
+                f.close()
+
+    # CLI command for generating a large, skewed synthetic dataset (for load tests and query-plan benchmarks)
+    @app.cli.command("seed-synthetic")
+    @click.option("--books", default=100000, show_default=True)
+    @click.option("--authors", default=20000, show_default=True)
+    @click.option("--categories", default=200, show_default=True)
+    @click.option("--publishers", default=500, show_default=True)
+    @click.option("--readers", default=50000, show_default=True)
+    @click.option("--copies-per-book", default=3, show_default=True, help="Average number of copies per book")
+    @click.option("--issues", default=1000000, show_default=True, help="Returned (historical) issues")
+    @click.option("--active-issue-ratio", default=0.1, show_default=True, help="Fraction of copies currently issued")
+    @click.option("--reservations", default=50000, show_default=True)
+    @click.option("--ratings", default=200000, show_default=True)
+    @click.option("--notifications", default=500000, show_default=True)
+    @click.option("--seed", type=int, help="Random seed for a reproducible dataset")
+    def seed_synthetic_command(books, authors, categories, publishers, readers, copies_per_book,
+                               issues, active_issue_ratio, reservations, ratings, notifications, seed):
+        started = time.perf_counter()
+        with db.engine.begin() as conn:
+            tag, created = seed_synthetic(
+                conn, books, authors, categories, publishers, readers, copies_per_book,
+                issues, active_issue_ratio, reservations, ratings, notifications, seed
+            )
+
+        # Fresh statistics so the planner sees the new row counts
+        with db.engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("ANALYZE"))
+
+        elapsed = time.perf_counter() - started
+        for table, count in created.items():
+            click.echo(f"{table}: {count} rows")
+        click.echo(f"Seeded synthetic dataset '{tag}' in {elapsed:.1f}s")
@@ -0,0 +1,183 @@
+# metrics.py
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from bisect import bisect_left
+import threading
+import logging
+import time
+import os
+
+# Statements slower than this (milliseconds) are logged with their parameters redacted
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Add an X-DB-Queries header (query count, DB time, connection checkouts) to every response
+SQL_DEBUG_HEADER = os.getenv("SQL_DEBUG_HEADER", "0") == "1"
+
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+COUNT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+logger = logging.getLogger("app.sql")
+
+
+# Prometheus-style histogram with labels, kept in process memory.
+# With several worker processes every worker exposes its own series.
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            series["counts"][bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                labels = ",".join(f'{k}="{escape_label(v)}"' for k, v in zip(self.labels, label_values))
+                cumulative = 0
+                for bound, count in zip(self.buckets + ["+Inf"], series["counts"]):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{self.name}_sum{{{labels}}} {series['sum']}")
+                lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+# Prometheus-style counter without labels
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter", f"{self.name} {self._value}"]
+
+
+# Helper: escape a label value for the Prometheus text format
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Request duration including streamed bodies", ["route", "method", "status"], DURATION_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    "db_queries_per_request", "SQL statements executed per request", ["route", "method"], COUNT_BUCKETS
+)
+REQUEST_DB_TIME = Histogram(
+    "db_time_per_request_seconds", "Time spent executing SQL per request", ["route", "method"], DURATION_BUCKETS
+)
+REQUEST_CHECKOUTS = Histogram(
+    "db_checkouts_per_request", "Connections checked out from the pool per request", ["route", "method"], COUNT_BUCKETS
+)
+SLOW_QUERIES = Counter("db_slow_queries_total", f"SQL statements slower than {SLOW_QUERY_MS:g}ms")
+
+METRICS = [REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_TIME, REQUEST_CHECKOUTS, SLOW_QUERIES]
+
+
+# Helper: parameters with the values replaced by their type names, safe to log
+def redact_parameters(parameters):
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"<{len(parameters)} parameter sets>"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+# Helper: per-request counters (None outside of a request)
+def request_stats():
+    if has_request_context():
+        return g.get("sql_stats")
+    return None
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Attach SQL instrumentation to the app's engines and the per-request bookkeeping to the app
+def init_metrics(app, engines):
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+
+        stats = request_stats()
+        if stats is not None:
+            stats["queries"] += 1
+            stats["db_time"] += elapsed
+
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            SLOW_QUERIES.inc()
+            logger.warning(
+                "Slow query (%.1fms)%s: %s params=%s",
+                elapsed * 1000,
+                f" on {request.method} {request.path}" if has_request_context() else "",
+                " ".join(statement.split()),
+                redact_parameters(parameters)
+            )
+
+    def handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        stats = request_stats()
+        if stats is not None:
+            stats["checkouts"] += 1
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(engine, "handle_error", handle_error)
+        event.listen(engine, "checkout", checkout)
+
+    @app.before_request
+    def start_request_stats():
+        g.sql_stats = {"queries": 0, "db_time": 0.0, "checkouts": 0, "started": time.perf_counter()}
+
+    # Observed once the response is closed, so streamed bodies are included
+    @app.after_request
+    def record_request_stats(response):
+        stats = g.get("sql_stats")
+        if stats is None:
+            return response
+
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        method = request.method
+        status = str(response.status_code)
+
+        def observe():
+            REQUEST_DURATION.observe((route, method, status), time.perf_counter() - stats["started"])
+            REQUEST_QUERIES.observe((route, method), stats["queries"])
+            REQUEST_DB_TIME.observe((route, method), stats["db_time"])
+            REQUEST_CHECKOUTS.observe((route, method), stats["checkouts"])
+
+        response.call_on_close(observe)
+
+        if SQL_DEBUG_HEADER:
+            response.headers["X-DB-Queries"] = (
+                f"{stats['queries']}; time={stats['db_time'] * 1000:.1f}ms; checkouts={stats['checkouts']}"
+            )
+        return response
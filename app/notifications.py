@@ -0,0 +1,175 @@
+# notifications.py
+from sqlalchemy import text
+import os
+
+# Reminder windows: loans due within DUE_SOON_HOURS, reservations ending within RESERVATION_EXPIRY_HOURS,
+# and a repeated overdue reminder every OVERDUE_REMINDER_DAYS days
+DUE_SOON_HOURS = int(os.getenv("DUE_SOON_HOURS", "48"))
+OVERDUE_REMINDER_DAYS = int(os.getenv("OVERDUE_REMINDER_DAYS", "7"))
+RESERVATION_EXPIRY_HOURS = int(os.getenv("RESERVATION_EXPIRY_HOURS", "24"))
+
+# Months of notifications kept besides the current one (older monthly partitions are dropped)
+NOTIFICATION_RETENTION_MONTHS = int(os.getenv("NOTIFICATION_RETENTION_MONTHS", "12"))
+# Monthly partitions created ahead of time by every reminder run
+NOTIFICATION_PARTITIONS_AHEAD = 3
+
+# Filter on the partition key limiting per-reader queries to the retained partitions,
+# so the planner prunes the old ones instead of probing every partition's index
+NOTIFICATION_WINDOW = (
+    f"sent_datetime >= date_trunc('month', LOCALTIMESTAMP) - INTERVAL '{NOTIFICATION_RETENTION_MONTHS} months'"
+)
+
+# One INSERT ... SELECT per reminder kind. The candidates are claimed in notification_reminder
+# first; only the claimed ones become notifications, so a rerun in the same period inserts nothing.
+REMINDER_QUERIES = {
+    # Open loans due within the next DUE_SOON_HOURS (once per due date)
+    "due_soon": """
+        WITH candidates AS (
+            SELECT i.id AS ref_id, i.reader_id, CAST(i.due_datetime AS DATE) AS period_start, i.due_datetime, b.title
+            FROM issue i
+            JOIN book_copy bc ON bc.id = i.book_copy_id
+            JOIN book b ON b.id = bc.book_id
+            WHERE i.return_datetime IS NULL
+              AND i.due_datetime > LOCALTIMESTAMP
+              AND i.due_datetime <= LOCALTIMESTAMP + make_interval(hours => :due_soon_hours)
+        ),
+        claimed AS (
+            INSERT INTO notification_reminder (kind, ref_id, period_start)
+            SELECT 'due_soon', ref_id, period_start FROM candidates
+            ON CONFLICT DO NOTHING
+            RETURNING ref_id
+        )
+        INSERT INTO app_notification (reader_id, subject, body)
+        SELECT
+            c.reader_id,
+            'Book due soon',
+            format('"%s" is due back on %s.', c.title, to_char(c.due_datetime, 'YYYY-MM-DD HH24:MI'))
+        FROM candidates c
+        JOIN claimed USING (ref_id)
+    """,
+    # Open loans past their due date (on the due date, then every OVERDUE_REMINDER_DAYS days)
+    "overdue": """
+        WITH candidates AS (
+            SELECT
+                i.id AS ref_id,
+                i.reader_id,
+                CAST(i.due_datetime AS DATE)
+                    + (CURRENT_DATE - CAST(i.due_datetime AS DATE)) / :overdue_days * :overdue_days AS period_start,
+                i.due_datetime,
+                b.title
+            FROM issue i
+            JOIN book_copy bc ON bc.id = i.book_copy_id
+            JOIN book b ON b.id = bc.book_id
+            WHERE i.return_datetime IS NULL
+              AND i.due_datetime <= LOCALTIMESTAMP
+        ),
+        claimed AS (
+            INSERT INTO notification_reminder (kind, ref_id, period_start)
+            SELECT 'overdue', ref_id, period_start FROM candidates
+            ON CONFLICT DO NOTHING
+            RETURNING ref_id
+        )
+        INSERT INTO app_notification (reader_id, subject, body)
+        SELECT
+            c.reader_id,
+            'Book overdue',
+            format('"%s" was due back on %s. Please return it as soon as possible.', c.title, to_char(c.due_datetime, 'YYYY-MM-DD HH24:MI'))
+        FROM candidates c
+        JOIN claimed USING (ref_id)
+    """,
+    # Reservations ending within RESERVATION_EXPIRY_HOURS whose copy the reader hasn't picked up yet
+    "reservation_expiring": """
+        WITH candidates AS (
+            SELECT r.id AS ref_id, r.reader_id, CAST(r.to_datetime AS DATE) AS period_start, r.to_datetime, b.title
+            FROM reservation r
+            JOIN book_copy bc ON bc.id = r.book_copy_id
+            JOIN book b ON b.id = bc.book_id
+            WHERE r.to_datetime > LOCALTIMESTAMP
+              AND r.to_datetime <= LOCALTIMESTAMP + make_interval(hours => :reservation_hours)
+              AND NOT EXISTS (
+                  SELECT 1 FROM issue i
+                  WHERE i.book_copy_id = r.book_copy_id
+                    AND i.reader_id = r.reader_id
+                    AND i.issue_datetime >= r.from_datetime
+              )
+        ),
+        claimed AS (
+            INSERT INTO notification_reminder (kind, ref_id, period_start)
+            SELECT 'reservation_expiring', ref_id, period_start FROM candidates
+            ON CONFLICT DO NOTHING
+            RETURNING ref_id
+        )
+        INSERT INTO app_notification (reader_id, subject, body)
+        SELECT
+            c.reader_id,
+            'Reservation expiring',
+            format('Your reservation of "%s" ends on %s.', c.title, to_char(c.to_datetime, 'YYYY-MM-DD HH24:MI'))
+        FROM candidates c
+        JOIN claimed USING (ref_id)
+    """,
+}
+
+
+# Make sure the current and the next NOTIFICATION_PARTITIONS_AHEAD monthly partitions exist
+def ensure_notification_partitions(conn):
+    return conn.execute(
+        text("SELECT create_notification_partitions(LOCALTIMESTAMP, LOCALTIMESTAMP + make_interval(months => :ahead))"),
+        {"ahead": NOTIFICATION_PARTITIONS_AHEAD}
+    ).scalar_one()
+
+# Generate every kind of reminder for all readers; returns {kind: notifications created}. The caller commits.
+def send_reminders(conn):
+    ensure_notification_partitions(conn)
+    params = {
+        "due_soon_hours": DUE_SOON_HOURS,
+        "overdue_days": OVERDUE_REMINDER_DAYS,
+        "reservation_hours": RESERVATION_EXPIRY_HOURS,
+    }
+    return {kind: conn.execute(text(query), params).rowcount for kind, query in REMINDER_QUERIES.items()}
+
+
+# Monthly partitions entirely older than the retention window: [(partition name, month)], oldest first
+def expired_notification_partitions(conn, retention_months=NOTIFICATION_RETENTION_MONTHS):
+    return conn.execute(
+        text("""
+            SELECT c.relname, to_date(substr(c.relname, 18), 'YYYY_MM') AS month
+            FROM pg_inherits inh
+            JOIN pg_class c ON c.oid = inh.inhrelid
+            WHERE inh.inhparent = 'app_notification'::regclass
+              AND c.relname ~ '^app_notification_[0-9]{4}_[0-9]{2}$'
+              AND to_date(substr(c.relname, 18), 'YYYY_MM')
+                  < date_trunc('month', LOCALTIMESTAMP) - make_interval(months => :retention_months)
+            ORDER BY month
+        """),
+        {"retention_months": retention_months}
+    ).all()
+
+# Drop one expired partition (optionally writing it to archive as CSV first).
+# Unread notifications vanish without firing the row triggers, so the unread counters are adjusted here.
+# The caller commits.
+def drop_notification_partition(conn, name, archive=None):
+    conn.execute(text(f'LOCK TABLE "{name}" IN ACCESS EXCLUSIVE MODE'))
+
+    if archive is not None:
+        with conn.connection.cursor() as cur:
+            cur.copy_expert(f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER)', archive)
+
+    conn.execute(text(f"""
+        SELECT adjust_unread_notification_counter(reader_id, -CAST(COUNT(*) AS INTEGER))
+        FROM "{name}"
+        WHERE NOT read
+        GROUP BY reader_id
+    """))
+    rows = conn.execute(text(f'SELECT COUNT(*) FROM "{name}"')).scalar_one()
+    conn.execute(text(f'DROP TABLE "{name}"'))
+    return rows
+
+# Forget reminder claims older than the retention window
+def purge_reminder_claims(conn, retention_months=NOTIFICATION_RETENTION_MONTHS):
+    return conn.execute(
+        text("""
+            DELETE FROM notification_reminder
+            WHERE period_start < date_trunc('month', LOCALTIMESTAMP) - make_interval(months => :retention_months)
+        """),
+        {"retention_months": retention_months}
+    ).rowcount
@@ -0,0 +1,160 @@
+# passwords.py
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import text
+from werkzeug.security import check_password_hash, generate_password_hash
+from itertools import repeat
+import multiprocessing
+import threading
+import secrets
+import os
+
+# Werkzeug hash method for new and rehashed passwords, e.g. "scrypt" or "pbkdf2:sha256:1000000"
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+# Hashing processes per web worker and how many hashes may be queued or running at once
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", "1"))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_POOL_WORKERS * 4)))
+# Seconds a request waits for a free hashing slot before giving up
+HASH_QUEUE_TIMEOUT = float(os.getenv("HASH_QUEUE_TIMEOUT", "2"))
+
+# Failed logins allowed per username from one client IP / per client IP within the throttle window
+LOGIN_MAX_FAILURES_PER_USER = int(os.getenv("LOGIN_MAX_FAILURES_PER_USER", "5"))
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "100"))
+LOGIN_THROTTLE_WINDOW = int(os.getenv("LOGIN_THROTTLE_WINDOW", "900"))
+# Past LOGIN_MAX_FAILURES_PER_USER failures from all IPs, a username is slowed down rather than locked:
+# each further attempt must wait LOGIN_BACKOFF_SECONDS, doubling per failure up to LOGIN_BACKOFF_MAX_SECONDS
+LOGIN_BACKOFF_SECONDS = float(os.getenv("LOGIN_BACKOFF_SECONDS", "2"))
+LOGIN_BACKOFF_MAX_SECONDS = float(os.getenv("LOGIN_BACKOFF_MAX_SECONDS", "60"))
+
+# Random bytes in generated initial passwords (base64url-encoded, so ~4/3 as many characters)
+INITIAL_PASSWORD_BYTES = 9
+
+
+# Raised when every hashing slot is taken for longer than HASH_QUEUE_TIMEOUT
+class HashingBusy(Exception):
+    pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_MAX_PENDING)
+_hash_prefix = None
+
+# Helper: the process pool, created on first use so every web worker gets its own after forking
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(HASH_POOL_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+        return _pool
+
+# Helper: run fn(*args) in the hashing pool, bounded by the pending-hash semaphore
+def run_in_pool(fn, *args):
+    if not _slots.acquire(timeout=HASH_QUEUE_TIMEOUT):
+        raise HashingBusy()
+    try:
+        return get_pool().submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+def hash_password(password):
+    return run_in_pool(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+def verify_password(password_hash, password):
+    return run_in_pool(check_password_hash, password_hash, password)
+
+# True when a stored hash was made with different parameters than PASSWORD_HASH_METHOD
+def needs_rehash(password_hash):
+    global _hash_prefix
+    if _hash_prefix is None:
+        # Method with werkzeug's defaults filled in, e.g. "scrypt" -> "scrypt:32768:8:1"
+        _hash_prefix = hash_password("").split("$", 1)[0]
+    return password_hash.split("$", 1)[0] != _hash_prefix
+
+
+# Helper: throttle keys of a login attempt with their failure limits. Failures of a username are limited per
+# client IP, so an attacker elsewhere can't lock its owner out; across IPs they only add back-off (limit None).
+def throttle_keys(username, ip):
+    username = username.lower()
+    return {
+        f"user-ip:{username}:{ip}": LOGIN_MAX_FAILURES_PER_USER,
+        f"ip:{ip}": LOGIN_MAX_FAILURES_PER_IP,
+        f"user:{username}": None,
+    }
+
+# Helper: seconds the next attempt of a username must wait after `failures` failures from all IPs
+def login_backoff(failures):
+    over = failures - LOGIN_MAX_FAILURES_PER_USER
+    if over < 0:
+        return 0
+    return min(LOGIN_BACKOFF_SECONDS * 2 ** min(over, 32), LOGIN_BACKOFF_MAX_SECONDS)
+
+# Seconds the client has to wait before this login attempt is allowed (0 when it may go ahead)
+def login_throttle_delay(conn, username, ip):
+    keys = throttle_keys(username, ip)
+    counters = conn.execute(
+        text("""
+            SELECT
+                key,
+                failures,
+                EXTRACT(EPOCH FROM window_start + make_interval(secs => :window) - CURRENT_TIMESTAMP) AS window_left,
+                EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - last_failure) AS since_failure
+            FROM login_throttle
+            WHERE key = ANY(:keys)
+              AND window_start > CURRENT_TIMESTAMP - make_interval(secs => :window)
+        """),
+        {"keys": list(keys), "window": LOGIN_THROTTLE_WINDOW}
+    ).all()
+
+    delay = 0
+    for key, failures, window_left, since_failure in counters:
+        limit = keys[key]
+        if limit is None:
+            delay = max(delay, login_backoff(failures) - float(since_failure))
+        elif failures >= limit:
+            delay = max(delay, float(window_left))
+    return max(delay, 0)
+
+# Count a failed login against the username (per client IP and overall) and the client IP
+def record_login_failure(conn, username, ip):
+    conn.execute(
+        text("""
+            INSERT INTO login_throttle (key, failures, window_start, last_failure)
+            SELECT unnest(CAST(:keys AS TEXT[])), 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+            ON CONFLICT (key) DO UPDATE
+                SET failures = CASE
+                        WHEN login_throttle.window_start > CURRENT_TIMESTAMP - make_interval(secs => :window)
+                            THEN login_throttle.failures + 1
+                        ELSE 1
+                    END,
+                    window_start = CASE
+                        WHEN login_throttle.window_start > CURRENT_TIMESTAMP - make_interval(secs => :window)
+                            THEN login_throttle.window_start
+                        ELSE CURRENT_TIMESTAMP
+                    END,
+                    last_failure = CURRENT_TIMESTAMP
+        """),
+        {"keys": list(throttle_keys(username, ip)), "window": LOGIN_THROTTLE_WINDOW}
+    )
+
+# Reset the username's failure counts after a successful login (and purge expired counters)
+def clear_login_failures(conn, username, ip):
+    conn.execute(
+        text("""
+            DELETE FROM login_throttle
+            WHERE key = ANY(:keys)
+               OR window_start < CURRENT_TIMESTAMP - make_interval(secs => :window)
+        """),
+        {"keys": [f"user-ip:{username.lower()}:{ip}", f"user:{username.lower()}"], "window": LOGIN_THROTTLE_WINDOW}
+    )
+
+
+# Bulk provisioning: a separate pool hashing on all CPUs, outside the login pool's back-pressure
+def bulk_hash_pool(workers=None):
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("forkserver"))
+
+def hash_passwords(pool, passwords):
+    return list(pool.map(generate_password_hash, passwords, repeat(PASSWORD_HASH_METHOD), chunksize=16))
+
+# Random initial password for provisioned accounts
+def generate_password():
+    return secrets.token_urlsafe(INITIAL_PASSWORD_BYTES)
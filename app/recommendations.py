@@ -0,0 +1,228 @@
+# recommendations.py
+from sqlalchemy import text
+import os
+
+# Similar books stored per book, and shown per book card in the catalog
+RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", "20"))
+RECOMMENDATIONS_PER_BOOK = int(os.getenv("RECOMMENDATIONS_PER_BOOK", "3"))
+# Books whose similarities are computed per sparse product (bounds the memory of one step)
+RECOMMENDATION_CHUNK_BOOKS = int(os.getenv("RECOMMENDATION_CHUNK_BOOKS", "500"))
+# Pairs rated by fewer readers are ignored; scores of pairs with few co-raters are shrunk towards 0
+RECOMMENDATION_MIN_CORATERS = int(os.getenv("RECOMMENDATION_MIN_CORATERS", "3"))
+RECOMMENDATION_SHRINKAGE = float(os.getenv("RECOMMENDATION_SHRINKAGE", "10"))
+# Ratings fetched per round-trip while loading the rating matrix
+RATING_FETCH_SIZE = 100000
+# Ratings posted this long before the last build are checked again by the next incremental build:
+# a rating whose transaction was still open during a build has an id below its watermark
+RECOMMENDATION_RESCAN_SECONDS = int(os.getenv("RECOMMENDATION_RESCAN_SECONDS", "3600"))
+
+# Watermark row of book_similarity in similarity_watermark
+SIMILARITY_NAME = "book_similarity"
+
+# Online path: top recommendations of a page of books, one indexed lookup on (book_id, rank)
+SIMILAR_BOOKS_QUERY = """
+    SELECT
+        s.book_id,
+        json_agg(json_build_object('book_id', s.similar_book_id, 'title', b.title) ORDER BY s.rank) AS similar
+    FROM book_similarity s
+    JOIN book b ON b.id = s.similar_book_id
+    WHERE s.book_id = ANY(:book_ids)
+      AND s.rank <= :limit
+    GROUP BY s.book_id
+"""
+
+
+# Helper: {book_id: [{"book_id", "title"}]} for the given books
+def similar_books(conn, book_ids, limit=RECOMMENDATIONS_PER_BOOK):
+    if not book_ids:
+        return {}
+    rows = conn.execute(text(SIMILAR_BOOKS_QUERY), {"book_ids": list(book_ids), "limit": limit})
+    return {row.book_id: row.similar for row in rows}
+
+
+# (last rating id covered by book_similarity or None, when the build covering it started or None,
+#  newest rating id or None, now)
+def similarity_watermark(conn):
+    return conn.execute(
+        text("""
+            SELECT
+                w.last_rating_id,
+                w.built_at,
+                (SELECT MAX(id) FROM rating),
+                CAST(CURRENT_TIMESTAMP AS TIMESTAMP)
+            FROM (SELECT 1) one
+            LEFT JOIN similarity_watermark w ON w.name = :name
+        """),
+        {"name": SIMILARITY_NAME}
+    ).one()
+
+# built_at is when the build read its watermark, so the next one knows which ratings may have been in flight
+def set_similarity_watermark(conn, last_rating_id, built_at):
+    conn.execute(
+        text("""
+            INSERT INTO similarity_watermark (name, last_rating_id, built_at)
+            VALUES (:name, :last_rating_id, :built_at)
+            ON CONFLICT (name) DO UPDATE
+                SET last_rating_id = EXCLUDED.last_rating_id,
+                    built_at = EXCLUDED.built_at
+        """),
+        {"name": SIMILARITY_NAME, "last_rating_id": last_rating_id, "built_at": built_at}
+    )
+
+# Books whose recommendations are stale after the ratings since_id..until_id (plus the ones posted within
+# RECOMMENDATION_RESCAN_SECONDS of the last build, which it may have missed):
+# - every book rated by the readers behind those ratings: the new ratings shift the reader's mean, which
+#   recenters all of their ratings, and pair the new books with every book the reader rated before
+# - the books currently recommending any of these
+# Books that could newly recommend one of them only through its changed norm are left to a --full build.
+def stale_books(conn, since_id, built_at, until_id):
+    return conn.execute(
+        text("""
+            WITH raters AS (
+                SELECT DISTINCT reader_id
+                FROM rating
+                WHERE id <= :until_id
+                  AND (id > :since_id OR post_datetime >= CAST(:built_at AS TIMESTAMP) - make_interval(secs => :rescan))
+            ),
+            rated AS (
+                SELECT DISTINCT r.book_id
+                FROM rating r
+                JOIN raters rr ON rr.reader_id = r.reader_id
+                WHERE r.id <= :until_id
+            )
+            SELECT book_id FROM rated
+            UNION
+            SELECT s.book_id
+            FROM book_similarity s
+            JOIN rated r ON r.book_id = s.similar_book_id
+        """),
+        {"since_id": since_id, "built_at": built_at, "until_id": until_id, "rescan": RECOMMENDATION_RESCAN_SECONDS}
+    ).scalars().all()
+
+# Replace the stored recommendations of book_ids with [(book_id, [similar_book_id], [score])]
+def store_book_similarity(conn, book_ids, similarities):
+    rows = {"book_ids": [], "ranks": [], "similar_ids": [], "scores": []}
+    for book_id, similar_ids, scores in similarities:
+        for rank, (similar_id, score) in enumerate(zip(similar_ids, scores), start=1):
+            rows["book_ids"].append(book_id)
+            rows["ranks"].append(rank)
+            rows["similar_ids"].append(similar_id)
+            rows["scores"].append(score)
+
+    conn.execute(text("DELETE FROM book_similarity WHERE book_id = ANY(:book_ids)"), {"book_ids": list(book_ids)})
+    if rows["book_ids"]:
+        conn.execute(
+            text("""
+                INSERT INTO book_similarity (book_id, rank, similar_book_id, score)
+                SELECT *
+                FROM unnest(
+                    CAST(:book_ids AS BIGINT[]),
+                    CAST(:ranks AS SMALLINT[]),
+                    CAST(:similar_ids AS BIGINT[]),
+                    CAST(:scores AS REAL[])
+                )
+            """),
+            rows
+        )
+    return len(rows["book_ids"])
+
+# Drop the recommendations of books without ratings up to last_rating_id (after a full build)
+def prune_book_similarity(conn, last_rating_id):
+    return conn.execute(
+        text("""
+            DELETE FROM book_similarity s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM rating r
+                WHERE r.book_id = s.book_id AND r.id <= :last_rating_id
+            )
+        """),
+        {"last_rating_id": last_rating_id}
+    ).rowcount
+
+
+# Item-item similarities over the sparse book x reader rating matrix.
+# Ratings are centered on each reader's mean (adjusted cosine), so two books are similar when the same
+# readers liked both more than they usually like books. NumPy/SciPy are only needed by the offline build.
+class SimilarityModel:
+    def __init__(self, book_ids, reader_ids, ratings):
+        import numpy as np
+        from scipy import sparse
+
+        self.book_ids, book_idx = np.unique(book_ids, return_inverse=True)
+        readers, reader_idx = np.unique(reader_ids, return_inverse=True)
+        shape = (len(self.book_ids), len(readers))
+
+        # Repeated ratings of a book by the same reader are averaged
+        coords = (book_idx, reader_idx)
+        sums = sparse.csr_matrix((ratings.astype(np.float64), coords), shape=shape)
+        counts = sparse.csr_matrix((np.ones(len(ratings)), coords), shape=shape)
+        values = sums.data / counts.data
+
+        reader_sums = np.bincount(sums.indices, weights=values, minlength=shape[1])
+        reader_counts = np.bincount(sums.indices, minlength=shape[1])
+        centered = values - (reader_sums / np.maximum(reader_counts, 1))[sums.indices]
+
+        matrix = sparse.csr_matrix((centered.astype(np.float32), sums.indices, sums.indptr), shape=shape)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        inverse_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        self.normalized = sparse.diags(inverse_norms.astype(np.float32)) @ matrix
+        self.normalized_t = self.normalized.T.tocsr()
+
+        self.rated = sparse.csr_matrix((np.ones(len(values), np.float32), sums.indices, sums.indptr), shape=shape)
+        self.rated_t = self.rated.T.tocsr()
+        self._index = {book_id: i for i, book_id in enumerate(self.book_ids.tolist())}
+
+    @classmethod
+    def load(cls, conn, last_rating_id, fetch_size=RATING_FETCH_SIZE):
+        import numpy as np
+
+        count = conn.execute(
+            text("SELECT COUNT(*) FROM rating WHERE id <= :last_rating_id"),
+            {"last_rating_id": last_rating_id}
+        ).scalar_one()
+
+        # Preallocated columns filled from a server-side cursor, so rows are never held as Python objects
+        columns = np.empty((count, 3), dtype=np.int64)
+        loaded = 0
+        result = conn.execution_options(stream_results=True, yield_per=fetch_size).execute(
+            text("SELECT book_id, reader_id, rating FROM rating WHERE id <= :last_rating_id"),
+            {"last_rating_id": last_rating_id}
+        )
+        for rows in result.partitions():
+            rows = rows[:count - loaded]
+            columns[loaded:loaded + len(rows)] = rows
+            loaded += len(rows)
+
+        columns = columns[:loaded]
+        return cls(columns[:, 0], columns[:, 1], columns[:, 2])
+
+    # Positions of the given book ids in the matrix (books without ratings are skipped)
+    def rows_of(self, book_ids):
+        return [self._index[book_id] for book_id in book_ids if book_id in self._index]
+
+    # [(book_id, [similar_book_id], [score])] with the top_k most similar books of each matrix row
+    def top_similar(self, rows, top_k=RECOMMENDATION_TOP_K,
+                    min_coraters=RECOMMENDATION_MIN_CORATERS, shrinkage=RECOMMENDATION_SHRINKAGE):
+        import numpy as np
+
+        scores = (self.normalized[rows] @ self.normalized_t).tocsr()
+        weights = (self.rated[rows] @ self.rated_t).tocsr()
+        weights.data = np.where(weights.data >= min_coraters, weights.data / (weights.data + shrinkage), 0)
+        scores = scores.multiply(weights).tocsr()
+
+        similarities = []
+        for i, row in enumerate(rows):
+            start, end = scores.indptr[i], scores.indptr[i + 1]
+            columns, values = scores.indices[start:end], scores.data[start:end]
+            keep = (columns != row) & (values > 0)
+            columns, values = columns[keep], values[keep]
+            if len(values) > top_k:
+                best = np.argpartition(-values, top_k - 1)[:top_k]
+                columns, values = columns[best], values[best]
+            order = np.argsort(-values, kind="stable")
+            similarities.append((
+                int(self.book_ids[row]),
+                self.book_ids[columns[order]].tolist(),
+                values[order].astype(float).tolist()
+            ))
+        return similarities
@@ -0,0 +1,221 @@
+# rollups.py
+from sqlalchemy import text
+from datetime import timedelta
+import os
+
+# Days rebuilt per transaction by `flask build-rollups`, and chunks built concurrently (one connection each)
+ROLLUP_CHUNK_DAYS = int(os.getenv("ROLLUP_CHUNK_DAYS", "31"))
+ROLLUP_WORKERS = int(os.getenv("ROLLUP_WORKERS", "4"))
+
+# Watermark row of the daily circulation rollups in rollup_watermark
+ROLLUP_NAME = "circulation"
+
+# Per day: issues, returns (late ones too), new reservations, copies owned and copies on loan / reserved.
+# Every fact is keyed by the day it happened on, so a finished day only changes when rows dated on it are
+# inserted, edited or deleted afterwards (e.g. a back-dated loan or a corrected return); the incremental
+# build doesn't see those, so rebuild the affected days with `flask build-rollups --since <day>`.
+CIRCULATION_ROLLUP = """
+    WITH days AS (
+        SELECT CAST(d AS DATE) AS day
+        FROM generate_series(CAST(:start AS TIMESTAMP), CAST(:end AS TIMESTAMP) - INTERVAL '1 day', INTERVAL '1 day') AS d
+    ),
+    issued AS (
+        SELECT CAST(issue_datetime AS DATE) AS day, COUNT(*) AS issues
+        FROM issue
+        WHERE issue_datetime >= :start AND issue_datetime < :end
+        GROUP BY 1
+    ),
+    returned AS (
+        SELECT
+            CAST(return_datetime AS DATE) AS day,
+            COUNT(*) AS returns,
+            COUNT(*) FILTER (WHERE return_datetime > due_datetime) AS late_returns
+        FROM issue
+        WHERE return_datetime >= :start AND return_datetime < :end
+        GROUP BY 1
+    ),
+    reserved AS (
+        SELECT CAST(from_datetime AS DATE) AS day, COUNT(*) AS reservations
+        FROM reservation
+        WHERE from_datetime >= :start AND from_datetime < :end
+        GROUP BY 1
+    ),
+    purchased AS (
+        SELECT CAST(purchase_datetime AS DATE) AS day, COUNT(*) AS copies
+        FROM book_copy
+        WHERE purchase_datetime >= :start AND purchase_datetime < :end
+        GROUP BY 1
+    )
+    INSERT INTO rollup_circulation_daily (
+        day, issues, returns, late_returns, reservations, copies, copies_on_loan, copies_reserved
+    )
+    SELECT
+        d.day,
+        COALESCE(i.issues, 0),
+        COALESCE(r.returns, 0),
+        COALESCE(r.late_returns, 0),
+        COALESCE(rs.reservations, 0),
+        (SELECT COUNT(*) FROM book_copy WHERE purchase_datetime < :start)
+            + SUM(COALESCE(p.copies, 0)) OVER (ORDER BY d.day),
+        (
+            SELECT COUNT(DISTINCT book_copy_id)
+            FROM issue
+            WHERE period && tsrange(CAST(d.day AS TIMESTAMP), CAST(d.day + 1 AS TIMESTAMP))
+        ),
+        (
+            SELECT COUNT(DISTINCT book_copy_id)
+            FROM reservation
+            WHERE period && tsrange(CAST(d.day AS TIMESTAMP), CAST(d.day + 1 AS TIMESTAMP))
+        )
+    FROM days d
+    LEFT JOIN issued i ON i.day = d.day
+    LEFT JOIN returned r ON r.day = d.day
+    LEFT JOIN reserved rs ON rs.day = d.day
+    LEFT JOIN purchased p ON p.day = d.day
+"""
+
+# Per day and category: issues, returns and late returns (a book in two categories counts in both)
+CATEGORY_ROLLUP = """
+    INSERT INTO rollup_category_daily (day, category_id, issues, returns, late_returns)
+    SELECT day, category_id, SUM(issues), SUM(returns), SUM(late_returns)
+    FROM (
+        SELECT CAST(i.issue_datetime AS DATE) AS day, bcat.category_id, 1 AS issues, 0 AS returns, 0 AS late_returns
+        FROM issue i
+        JOIN book_copy bc ON bc.id = i.book_copy_id
+        JOIN book_category bcat ON bcat.book_id = bc.book_id
+        WHERE i.issue_datetime >= :start AND i.issue_datetime < :end
+
+        UNION ALL
+
+        SELECT
+            CAST(i.return_datetime AS DATE),
+            bcat.category_id,
+            0,
+            1,
+            CASE WHEN i.return_datetime > i.due_datetime THEN 1 ELSE 0 END
+        FROM issue i
+        JOIN book_copy bc ON bc.id = i.book_copy_id
+        JOIN book_category bcat ON bcat.book_id = bc.book_id
+        WHERE i.return_datetime >= :start AND i.return_datetime < :end
+    ) facts
+    GROUP BY day, category_id
+"""
+
+# Per day and publisher: copies purchased and their total price
+PURCHASE_ROLLUP = """
+    INSERT INTO rollup_purchase_daily (day, publisher_id, copies, spend)
+    SELECT CAST(purchase_datetime AS DATE), publisher_id, COUNT(*), SUM(purchase_price)
+    FROM book_copy
+    WHERE purchase_datetime >= :start AND purchase_datetime < :end
+    GROUP BY 1, 2
+"""
+
+ROLLUP_TABLES = ["rollup_circulation_daily", "rollup_category_daily", "rollup_purchase_daily"]
+
+
+# Helper: split the days start..end (exclusive) into [(chunk_start, chunk_end)] of at most chunk_days days
+def rollup_chunks(start, end, chunk_days):
+    chunks = []
+    while start < end:
+        chunk_end = min(start + timedelta(days=chunk_days), end)
+        chunks.append((start, chunk_end))
+        start = chunk_end
+    return chunks
+
+# (Re)build every rollup for the days start..end (exclusive). The caller commits.
+def build_rollup_chunk(conn, start, end):
+    params = {"start": start, "end": end}
+    for table in ROLLUP_TABLES:
+        conn.execute(text(f"DELETE FROM {table} WHERE day >= :start AND day < :end"), params)
+    conn.execute(text(CIRCULATION_ROLLUP), params)
+    conn.execute(text(CATEGORY_ROLLUP), params)
+    conn.execute(text(PURCHASE_ROLLUP), params)
+
+# First day not yet rolled up (None before the first build)
+def get_rollup_watermark(conn):
+    return conn.execute(
+        text("SELECT built_until FROM rollup_watermark WHERE name = :name"),
+        {"name": ROLLUP_NAME}
+    ).scalar_one_or_none()
+
+# Never moves backwards, so rebuilding an old range with --since keeps the newer days rolled up
+def set_rollup_watermark(conn, day):
+    conn.execute(
+        text("""
+            INSERT INTO rollup_watermark (name, built_until, built_at)
+            VALUES (:name, :day, CURRENT_TIMESTAMP)
+            ON CONFLICT (name) DO UPDATE
+                SET built_until = GREATEST(rollup_watermark.built_until, EXCLUDED.built_until),
+                    built_at = EXCLUDED.built_at
+        """),
+        {"name": ROLLUP_NAME, "day": day}
+    )
+
+# Day range a build should cover by default: from the watermark (or the first recorded activity) to today
+def default_rollup_range(conn):
+    return conn.execute(text("""
+        SELECT
+            COALESCE(
+                (SELECT built_until FROM rollup_watermark WHERE name = :name),
+                CAST(LEAST(
+                    (SELECT MIN(issue_datetime) FROM issue),
+                    (SELECT MIN(from_datetime) FROM reservation),
+                    (SELECT MIN(purchase_datetime) FROM book_copy)
+                ) AS DATE),
+                CURRENT_DATE
+            ),
+            CURRENT_DATE
+    """), {"name": ROLLUP_NAME}).one()
+
+
+# Helper: (first day of the month of `day`, first day of the next month)
+def report_month_range(day):
+    start = day.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+# Monthly circulation report for the days start..end (exclusive), read from the rollups only
+def circulation_report(conn, start, end):
+    params = {"start": start, "end": end}
+
+    summary = conn.execute(text("""
+        SELECT
+            COUNT(*) AS days,
+            COALESCE(SUM(issues), 0) AS issues,
+            COALESCE(SUM(returns), 0) AS returns,
+            COALESCE(SUM(late_returns), 0) AS late_returns,
+            ROUND(100.0 * SUM(late_returns) / NULLIF(SUM(returns), 0), 1) AS overdue_rate,
+            COALESCE(SUM(reservations), 0) AS reservations,
+            MAX(copies) AS copies,
+            ROUND(100.0 * SUM(copies_on_loan) / NULLIF(SUM(copies), 0), 1) AS utilisation
+        FROM rollup_circulation_daily
+        WHERE day >= :start AND day < :end
+    """), params).mappings().one()
+
+    categories = conn.execute(text("""
+        SELECT
+            c.name AS category,
+            SUM(r.issues) AS issues,
+            SUM(r.returns) AS returns,
+            SUM(r.late_returns) AS late_returns,
+            ROUND(100.0 * SUM(r.late_returns) / NULLIF(SUM(r.returns), 0), 1) AS overdue_rate
+        FROM rollup_category_daily r
+        JOIN category c ON c.id = r.category_id
+        WHERE r.day >= :start AND r.day < :end
+        GROUP BY c.name
+        ORDER BY issues DESC, c.name
+    """), params).mappings().all()
+
+    publishers = conn.execute(text("""
+        SELECT
+            p.name AS publisher,
+            SUM(r.copies) AS copies,
+            SUM(r.spend) AS spend
+        FROM rollup_purchase_daily r
+        JOIN publisher p ON p.id = r.publisher_id
+        WHERE r.day >= :start AND r.day < :end
+        GROUP BY p.name
+        ORDER BY spend DESC, p.name
+    """), params).mappings().all()
+
+    return {"summary": summary, "categories": categories, "publishers": publishers}
@@ -1,68 +1,172 @@
 # routes.py
-from flask import render_template, session, request, redirect, url_for, flash
+from flask import render_template, stream_template, stream_with_context, session, request, redirect, url_for, flash, jsonify, make_response, Response
+from markupsafe import Markup
 from sqlalchemy import text
-from sqlalchemy.exc import SQLAlchemyError
-from werkzeug.security import check_password_hash, generate_password_hash
-from datetime import datetime
-import random
-from . import db
-from .auth import login_required, require_superadmin
-from .utility import get_table_metadata, load_table_registry, prepare_columns, is_superadmin_role
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from itertools import islice
+import hashlib
+import hmac
+import json
+import math
+import io
+import os
+from datetime import date, datetime
+from . import db, read_engine
+from .catalog import build_book_search, build_ranked_search, normalize_book_search, escape_like, SEARCH_COUNT_LIMIT
+from .metrics import render_metrics
+from .cache import VersionedLRUCache, TTLCache
+from .notifications import NOTIFICATION_WINDOW
+from .recommendations import similar_books
+from .rollups import circulation_report, report_month_range, get_rollup_watermark
+from .bulk import update_books, export_chunks, gzip_chunks, EXPORT_VIEWS, detect_format, parse_records, create_reader_staging, hash_reader_passwords, import_readers_batch, parse_table_csv, insert_rows
+from .passwords import hash_password, verify_password, needs_rehash, login_throttle_delay, record_login_failure, clear_login_failures, HashingBusy, generate_password
+from .auth import login_required, require_superadmin, current_reader_id
+from .utility import get_table_metadata, get_table_keys, load_table_registry, prepare_columns, lookup_rows, is_superadmin_role, PERMISSION_MATRIX, decode_cursor, encode_cursor, build_keyset_query, KeysetPage, build_row_selection, ROW_FILTER_OPERATORS
+
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+ADMIN_MAX_PAGE_SIZE = int(os.getenv("ADMIN_MAX_PAGE_SIZE", "1000"))
+ADMIN_FETCH_SIZE = int(os.getenv("ADMIN_FETCH_SIZE", "100"))
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "5000"))
+# Largest reader file accepted by the admin upload (bigger imports go through `flask import-readers`)
+ADMIN_IMPORT_MAX_ROWS = int(os.getenv("ADMIN_IMPORT_MAX_ROWS", "200"))
+# Largest CSV pasted or uploaded into a table from the superadmin panel, and rows shown in its preview
+ADMIN_PASTE_MAX_ROWS = int(os.getenv("ADMIN_PASTE_MAX_ROWS", "10000"))
+ADMIN_PASTE_PREVIEW_ROWS = 20
+
+BOOKS_PAGE_SIZE = int(os.getenv("BOOKS_PAGE_SIZE", "20"))
+BOOKS_FACET_LIMIT = int(os.getenv("BOOKS_FACET_LIMIT", "10"))
+# Number of notifications per page on the notifications page
+NOTIFICATIONS_PAGE_SIZE = int(os.getenv("NOTIFICATIONS_PAGE_SIZE", "50"))
+
+# Rendered catalog result fragments kept per worker process
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "256"))
+CATALOG_FRAGMENTS = VersionedLRUCache("catalog", CATALOG_CACHE_SIZE)
+
+# Reader dashboards kept per worker process, and for how many seconds
+READER_DASHBOARD_CACHE_SIZE = 512
+READER_DASHBOARD_TTL = float(os.getenv("READER_DASHBOARD_TTL", "15"))
+READER_DASHBOARDS = TTLCache(READER_DASHBOARD_CACHE_SIZE, READER_DASHBOARD_TTL)
+
+# Reader dashboard: activity counts, open loans and active reservations of one reader (by id or card number)
+READER_DASHBOARD_QUERY = """
+    SELECT
+        a.*,
+        (
+            SELECT COALESCE(json_agg(l ORDER BY l.due_datetime), '[]'::json)
+            FROM (
+                SELECT
+                    i.id AS issue_id,
+                    b.title,
+                    bc.isbn,
+                    i.issue_datetime,
+                    i.due_datetime,
+                    i.due_datetime < CURRENT_TIMESTAMP AS overdue
+                FROM (
+                    -- Open loans and loans returned in the future as separate branches (like reader_activity),
+                    -- so the first one can use the partial index idx_issue_open_reader_id
+                    SELECT id, book_copy_id, issue_datetime, due_datetime
+                    FROM issue
+                    WHERE reader_id = a.reader_id
+                      AND return_datetime IS NULL
+
+                    UNION ALL
+
+                    SELECT id, book_copy_id, issue_datetime, due_datetime
+                    FROM issue
+                    WHERE reader_id = a.reader_id
+                      AND return_datetime > CURRENT_TIMESTAMP
+                ) i
+                JOIN book_copy bc ON bc.id = i.book_copy_id
+                JOIN book b ON b.id = bc.book_id
+            ) l
+        ) AS loans,
+        (
+            SELECT COALESCE(json_agg(rv ORDER BY rv.from_datetime), '[]'::json)
+            FROM (
+                SELECT
+                    res.id AS reservation_id,
+                    b.title,
+                    bc.isbn,
+                    res.from_datetime,
+                    res.to_datetime
+                FROM reservation res
+                JOIN book_copy bc ON bc.id = res.book_copy_id
+                JOIN book b ON b.id = bc.book_id
+                WHERE res.reader_id = a.reader_id
+                  AND res.to_datetime >= CURRENT_TIMESTAMP
+            ) rv
+        ) AS reservations
+    FROM reader_activity(p_reader_id => CAST(:reader_id AS BIGINT), p_card_no => CAST(:card_no AS TEXT)) a
+"""
+
+# Bearer token required by /metrics (the endpoint is disabled when empty, so metrics are never public by accident)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Queries behind the notification bell (shared with the benchmarks)
+UNREAD_COUNT_QUERY = """
+    SELECT unread_count
+    FROM reader_notification_counter
+    WHERE reader_id = :reader_id
+"""
+NOTIFICATION_PREVIEW_QUERY = f"""
+    SELECT id, sent_datetime, subject, body, read
+    FROM app_notification
+    WHERE reader_id = :reader_id
+      AND {NOTIFICATION_WINDOW}
+    ORDER BY sent_datetime DESC
+    LIMIT 11
+"""
+
+# Tables whose edits change the permission matrix
+RBAC_TABLES = {"app_role", "entity_permission", "app_role_entity_permission"}
 
 def register_routes(app):
     TABLE_REGISTRY = load_table_registry()
 
+    # Template filter: literal ILIKE pattern for a facet value
+    app.add_template_filter(escape_like, "escape_like")
+
     # Context processor for templates: user flags
     @app.context_processor
     def inject_user_flags():
         return dict(is_superadmin=session.get("is_superadmin", False))
     
-    # Context processor for templates: notifications
+    # Context processor for templates: notifications (unread count only, preview is fetched lazily)
     @app.context_processor
     def inject_notifications():
-        if "card_no" not in session or "user_id" not in session:
+        if not session.get("card_no") or "user_id" not in session:
             return {}
 
         try:
             with db.engine.connect() as conn:
-                reader_id = conn.execute(text("""SELECT reader_id FROM app_user WHERE app_user.id = :user_id LIMIT 1"""), {"user_id": session["user_id"]}).scalar_one_or_none()
+                reader_id = current_reader_id(conn)
 
                 if not reader_id:
                     return {}
 
-                notifications = conn.execute(
-                    text("""
-                        SELECT id, sent_datetime, subject, body, read
-                        FROM app_notification
-                        WHERE reader_id = :reader_id
-                        ORDER BY sent_datetime DESC
-                        LIMIT 11
-                    """),
-                    {"reader_id": reader_id}
-                ).mappings().all()
-
                 unread_count = conn.execute(
-                text("""
-                        SELECT COUNT(*) 
-                        FROM app_notification
-                        WHERE reader_id = :reader_id AND read = FALSE
-                    """), {"reader_id": reader_id}
-                ).scalar_one()
-
-                return {
-                    "notifications": notifications[:10],
-                    "has_more": len(notifications) > 10,
-                    "unread_count": unread_count
-                }
+                    text(UNREAD_COUNT_QUERY), {"reader_id": reader_id}
+                ).scalar_one_or_none()
+
+                return {"unread_count": unread_count or 0}
 
         except SQLAlchemyError:
             return {}
-    
+
     # Main page
     @app.route("/")
     def index():
         return render_template("index.html")
 
+    # Prometheus metrics of this worker process
+    @app.route("/metrics")
+    def metrics():
+        if not METRICS_TOKEN:
+            return Response("Not Found\n", status=404, mimetype="text/plain")
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+            return Response("Unauthorized\n", status=401, mimetype="text/plain")
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
     # Login page
     @app.route("/login", methods=["GET", "POST"])
     def login():
@@ -72,11 +176,18 @@ def register_routes(app):
         elif request.method == "POST":
             username = request.form["username"]
             password = request.form["password"]
+            ip = request.remote_addr
+
+            # Throttle check and user lookup; the connection is released before hashing
+            with db.engine.begin() as conn:
+                delay = login_throttle_delay(conn, username, ip)
+                if delay:
+                    flash(f"Too many failed login attempts. Try again in {math.ceil(delay)} seconds.", "error")
+                    return redirect(url_for("login"))
 
-            with db.engine.connect() as conn:
                 user = conn.execute(
                     text("""
-                        SELECT app_user.id, app_user.username, app_user.password_hash, app_user.role_id, app_user.is_active, reader.card_no
+                        SELECT app_user.id, app_user.username, app_user.password_hash, app_user.role_id, app_user.is_active, app_user.reader_id, reader.card_no
                         FROM app_user
                         LEFT JOIN reader ON reader.id = app_user.reader_id
                         WHERE app_user.username = :username
@@ -84,19 +195,43 @@ def register_routes(app):
                 ).mappings().first()
 
                 if not user or not user["is_active"]:
+                    record_login_failure(conn, username, ip)
                     flash("User isn't active or doesn't exist", "error")
                     return redirect(url_for("login"))
 
-                if not check_password_hash(user["password_hash"], password):
+            try:
+                valid = verify_password(user["password_hash"], password)
+                new_hash = hash_password(password) if valid and needs_rehash(user["password_hash"]) else None
+            except HashingBusy:
+                flash("The server is busy. Please try to log in again in a moment.", "error")
+                return redirect(url_for("login"))
+
+            with db.engine.begin() as conn:
+                if not valid:
+                    record_login_failure(conn, username, ip)
                     flash("Invalid credentials", "error")
                     return redirect(url_for("login"))
-                
+
+                clear_login_failures(conn, username, ip)
+
+                # Transparent rehash when the configured hash parameters changed
+                if new_hash:
+                    conn.execute(
+                        text("""
+                            UPDATE app_user
+                            SET password_hash = :new_hash
+                            WHERE id = :user_id AND password_hash = :old_hash
+                        """),
+                        {"new_hash": new_hash, "user_id": user["id"], "old_hash": user["password_hash"]}
+                    )
+
                 session.clear()
                 session["user_id"] = user["id"]
                 session["username"] = user["username"]
                 session["role_id"] = user["role_id"]
                 session["is_superadmin"] = is_superadmin_role(conn, user["role_id"])
                 session["card_no"] = user["card_no"]
+                session["reader_id"] = user["reader_id"]
 
             return redirect(url_for("index"))
 
@@ -129,54 +264,42 @@ def register_routes(app):
                 flash("Passwords do not match", "error")
                 return redirect(url_for("register"))
 
-            password_hash = generate_password_hash(password)
-
-            # card_no: YYYYMMDDHHMM + random 3 digits -> length = 15
-            now = datetime.now()
-            card_no = f"{now:%Y%m%d%H%M}{random.randint(0, 999):03d}"
+            try:
+                password_hash = hash_password(password)
+            except HashingBusy:
+                flash("The server is busy. Please try again in a moment.", "error")
+                return redirect(url_for("register"))
 
+            # One statement: the reader gets a sequence-backed card number, the username is checked by its unique constraint
             try:
                 with db.engine.begin() as conn:
-                    # check username uniqueness
-                    existing = conn.execute(
-                        text("SELECT 1 FROM app_user WHERE username = :username"),
-                        {"username": username}
-                    ).first()
-
-                    if existing:
-                        flash("This username is already in use", "error")
-                        return redirect(url_for("register"))
-
-                    # create reader
-                    reader_id = conn.execute(
-                        text("""
-                            INSERT INTO reader (first_name, last_name, card_no)
-                            VALUES (:first_name, :last_name, :card_no)
-                            RETURNING id
-                        """),
-                        {
-                            "first_name": first_name,
-                            "last_name": last_name,
-                            "card_no": card_no
-                        }
-                    ).scalar_one()
-
-                    # create app_user (no role assigned)
                     conn.execute(
                         text("""
+                            WITH new_reader AS (
+                                INSERT INTO reader (first_name, last_name)
+                                VALUES (:first_name, :last_name)
+                                RETURNING id
+                            )
                             INSERT INTO app_user (username, password_hash, reader_id, is_active)
-                            VALUES (:username, :password_hash, :reader_id, true)
+                            SELECT :username, :password_hash, id, true
+                            FROM new_reader
                         """),
                         {
+                            "first_name": first_name,
+                            "last_name": last_name,
                             "username": username,
-                            "password_hash": password_hash,
-                            "reader_id": reader_id
+                            "password_hash": password_hash
                         }
                     )
 
                 flash("Registration successful. You can now log in.", "success")
                 return redirect(url_for("login"))
 
+            except IntegrityError as e:
+                if getattr(getattr(e.orig, "diag", None), "constraint_name", None) == "app_user_username_key":
+                    flash("This username is already in use", "error")
+                    return redirect(url_for("register"))
+                flash(f"Registration failed: {str(getattr(e, 'orig', e))}", "error")
             except SQLAlchemyError as e:
                 flash(f"Registration failed: {str(getattr(e, 'orig', e))}", "error")
 
@@ -187,9 +310,134 @@ def register_routes(app):
     @login_required
     @require_superadmin
     def admin():
-        return render_template("superadmin/superadmin_panel.html", tables=TABLE_REGISTRY)
+        return render_template("superadmin/superadmin_panel.html", tables=TABLE_REGISTRY, views=EXPORT_VIEWS)
+
+    # Front-desk reader dashboard, looked up by ?card_no= or ?reader_id=.
+    # Cached for READER_DASHBOARD_TTL seconds; ?refresh=1 reads it again.
+    @app.route("/superadmin_panel/readers/activity")
+    @login_required
+    @require_superadmin
+    def admin_reader_activity():
+        card_no = request.args.get("card_no", "").strip()
+        reader_id = request.args.get("reader_id", type=int)
+        if not card_no and reader_id is None:
+            return render_template("superadmin/reader_activity.html", reader=None, card_no="")
 
-    # Raw-table viewer
+        key = ("reader_id", reader_id) if reader_id is not None else ("card_no", card_no)
+        reader = None if request.args.get("refresh") == "1" else READER_DASHBOARDS.get(key)
+
+        if reader is None:
+            with read_engine().connect() as conn:
+                reader = conn.execute(
+                    text(READER_DASHBOARD_QUERY),
+                    {"reader_id": reader_id, "card_no": None if reader_id is not None else card_no}
+                ).mappings().one_or_none()
+
+            if reader is None:
+                flash("Reader not found", "error")
+                return render_template("superadmin/reader_activity.html", reader=None, card_no=card_no)
+
+            reader = dict(reader)
+            READER_DASHBOARDS.put(key, reader)
+
+        return render_template("superadmin/reader_activity.html", reader=reader, card_no=card_no)
+
+    # Monthly circulation report, read from the daily rollups only (built by `flask build-rollups`)
+    @app.route("/superadmin_panel/reports/circulation")
+    @login_required
+    @require_superadmin
+    def admin_circulation_report():
+        month = request.args.get("month", "").strip()
+        try:
+            day = datetime.strptime(month, "%Y-%m").date() if month else date.today()
+        except ValueError:
+            flash("Month must look like YYYY-MM", "error")
+            day = date.today()
+
+        start, end = report_month_range(day)
+        with read_engine().connect() as conn:
+            report = circulation_report(conn, start, end)
+            built_until = get_rollup_watermark(conn)
+
+        return render_template(
+            "superadmin/circulation_report.html",
+            month=f"{start:%Y-%m}",
+            built_until=built_until,
+            **report
+        )
+
+    # Reader provisioning from an uploaded CSV/NDJSON file (username, first_name, last_name, optional password)
+    @app.route("/superadmin_panel/readers/import", methods=["GET", "POST"])
+    @login_required
+    @require_superadmin
+    def admin_import_readers():
+        if request.method == "POST":
+            upload = request.files.get("file")
+            if not upload or not upload.filename:
+                flash("Choose a CSV or NDJSON file to upload", "error")
+                return render_template("superadmin/import_readers.html")
+
+            fmt = detect_format(upload.filename)
+            records = list(islice(
+                parse_records(io.TextIOWrapper(upload.stream, encoding="utf-8", newline=""), fmt),
+                ADMIN_IMPORT_MAX_ROWS + 1
+            ))
+            if len(records) > ADMIN_IMPORT_MAX_ROWS:
+                flash(f"The file has more than {ADMIN_IMPORT_MAX_ROWS} readers, use `flask import-readers` instead", "error")
+                return render_template("superadmin/import_readers.html")
+
+            # Hashed one at a time in the worker's login hashing pool, before the transaction opens,
+            # so logins keep getting slots and no connection is held idle meanwhile
+            try:
+                hashed = hash_reader_passwords(
+                    records, lambda passwords: [hash_password(password) for password in passwords], generate_password
+                )
+            except HashingBusy:
+                flash("The server is busy. Please try the import again in a moment.", "error")
+                return render_template("superadmin/import_readers.html")
+
+            try:
+                with db.engine.begin() as conn:
+                    create_reader_staging(conn)
+                    created, rejects = import_readers_batch(conn, records, hashed=hashed)
+            except SQLAlchemyError as e:
+                flash(f"Import failed: {str(getattr(e, 'orig', e))}", "error")
+                return render_template("superadmin/import_readers.html")
+
+            flash(f"Created {len(created)} readers, rejected {len(rejects)} rows", "success" if not rejects else "warning")
+            return render_template("superadmin/import_readers.html", created=created, rejects=sorted(rejects))
+
+        return render_template("superadmin/import_readers.html")
+
+    # Bulk book update (JSON payload for the update_books procedure)
+    @app.route("/superadmin_panel/books/bulk_update", methods=["GET", "POST"])
+    @login_required
+    @require_superadmin
+    def admin_bulk_update_books():
+        if request.method == "POST":
+            upload = request.files.get("file")
+            payload = upload.read().decode("utf-8") if upload and upload.filename else request.form.get("payload", "")
+
+            try:
+                books = json.loads(payload)
+                if not isinstance(books, list):
+                    raise ValueError("The payload must be a JSON array")
+            except ValueError as e:
+                flash(f"Invalid payload: {str(e)}", "error")
+                return render_template("superadmin/bulk_update_books.html", payload=payload)
+
+            try:
+                with db.engine.begin() as conn:
+                    update_books(conn, books)
+                flash(f"Updated {len(books)} books", "success")
+                return redirect(url_for("admin_bulk_update_books"))
+            except SQLAlchemyError as e:
+                flash(f"Failed to update books: {str(getattr(e, 'orig', e))}", "error")
+                return render_template("superadmin/bulk_update_books.html", payload=payload)
+
+        return render_template("superadmin/bulk_update_books.html", payload="")
+
+    # Raw-table viewer (keyset-paginated, streamed from a server-side cursor)
     @app.route("/superadmin_panel/table/<table_name>")
     @login_required
     @require_superadmin
@@ -198,23 +446,114 @@ def register_routes(app):
             flash(f"The table doesn't exist", "error")
             return redirect(url_for("admin"))
 
+        page_size = min(
+            max(request.args.get("per_page", ADMIN_PAGE_SIZE, type=int) or ADMIN_PAGE_SIZE, 1),
+            ADMIN_MAX_PAGE_SIZE
+        )
+        descending = request.args.get("dir") == "desc"
+        backwards = "before" in request.args
+
+        conn = read_engine().connect()
         try:
-            with db.engine.connect() as conn:
-                _, pk, _ = get_table_metadata(conn, table_name)
-                result = conn.execute(text(f"SELECT * FROM {table_name}"))
-                rows = result.mappings().all()
-                column_names = result.keys()
+            columns, pk, fk_columns = get_table_metadata(conn, table_name)
+            editable_columns, _, _ = prepare_columns(conn, columns, fk_columns)
+            pk_columns, sortable_columns = get_table_keys(conn, table_name)
+            if not pk_columns:
+                raise ValueError("The table doesn't have a PK")
+
+            sort = request.args.get("sort")
+            if sort not in sortable_columns:
+                sort = None
+            order_cols = ([sort] if sort and sort not in pk_columns else []) + pk_columns
+
+            cursor_values = decode_cursor(request.args.get("before" if backwards else "after"), len(order_cols))
+            query, params = build_keyset_query(table_name, order_cols, cursor_values, backwards, descending)
+            params["limit"] = page_size + 1
+
+            result = conn.execution_options(stream_results=True, yield_per=ADMIN_FETCH_SIZE).execute(text(query), params)
+            column_names = list(result.keys())
         except Exception as e:
+            conn.close()
             flash(f"Failed to fetch table data: {str(e)}", "error")
             return redirect(url_for("admin"))
 
-        return render_template(
-            "superadmin/table_list.html",
-            table_name=TABLE_REGISTRY[table_name],
-            raw_table_name=table_name,
-            columns=column_names,
-            rows=rows,
-            pk=pk
+        page = KeysetPage(result, order_cols, page_size, backwards, has_cursor=cursor_values is not None)
+
+        def generate():
+            try:
+                yield from stream_template(
+                    "superadmin/table_list.html",
+                    table_name=TABLE_REGISTRY[table_name],
+                    raw_table_name=table_name,
+                    columns=column_names,
+                    rows=page,
+                    pk=pk,
+                    # Selection value of a row for the bulk actions (its PK values, like a keyset cursor)
+                    row_key=lambda row: encode_cursor([row[col] for col in pk_columns]),
+                    editable_columns=[col["column_name"] for col in editable_columns],
+                    sortable_columns=sortable_columns,
+                    sort=sort,
+                    direction="desc" if descending else "asc",
+                    per_page=page_size
+                )
+            finally:
+                conn.close()
+
+        return Response(stream_with_context(generate()), mimetype="text/html")
+
+    # Streaming CSV/NDJSON export of a registered table or view
+    @app.route("/superadmin_panel/export/<name>")
+    @login_required
+    @require_superadmin
+    def admin_export(name):
+        if name not in TABLE_REGISTRY and name not in EXPORT_VIEWS:
+            flash(f"The table doesn't exist", "error")
+            return redirect(url_for("admin"))
+
+        fmt = "ndjson" if request.args.get("format") == "ndjson" else "csv"
+        compress = request.args.get("gzip") == "1"
+        filename = f"{name}.{fmt}" + (".gz" if compress else "")
+
+        def generate():
+            with db.engine.connect() as conn:
+                chunks = export_chunks(conn, name, fmt, fetch_size=EXPORT_FETCH_SIZE)
+                yield from gzip_chunks(chunks) if compress else chunks
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="application/gzip" if compress else ("application/x-ndjson" if fmt == "ndjson" else "text/csv"),
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
+
+    # FK typeahead lookup (JSON)
+    @app.route("/superadmin_panel/table/<table_name>/lookup")
+    @login_required
+    @require_superadmin
+    def admin_lookup(table_name):
+        if table_name not in TABLE_REGISTRY:
+            return jsonify(error="The table doesn't exist"), 404
+
+        limit = min(max(request.args.get("limit", 20, type=int) or 20, 1), 100)
+        with db.engine.connect() as conn:
+            columns, pk, _ = get_table_metadata(conn, table_name)
+            value_column = request.args.get("column", pk)
+            if value_column not in {col["column_name"] for col in columns}:
+                return jsonify(error="The column doesn't exist"), 400
+
+            q = request.args.get("q", "").strip()
+            rows = lookup_rows(
+                conn,
+                table_name,
+                value_column,
+                q=q,
+                after=request.args.get("after", type=int),
+                limit=limit
+            )
+
+        # Ranked query results have no next page; only the unfiltered list pages by value
+        return jsonify(
+            results=[{"id": r["id"], "label": r["label"]} for r in rows],
+            next=rows[-1]["id"] if len(rows) == limit and not q else None
         )
 
     # Edit row
@@ -226,41 +565,45 @@ def register_routes(app):
             flash(f"The table doesn't exist", "error")
             return redirect(url_for("admin"))
 
-        with db.engine.begin() as conn:
+        # Connections are released before the template renders
+        with db.engine.connect() as conn:
             columns, pk, fk_columns = get_table_metadata(conn, table_name)
             if pk is None:
                 flash(f"The table doesn't have a PK", "error")
                 return redirect(url_for("admin"))
 
             row = conn.execute(text(f"SELECT * FROM {table_name} WHERE {pk} = :id"), {"id": row_id}).mappings().first()
-            if not row:
-                flash(f"The row doesn't exist", "error")
-                return redirect(url_for("admin"))
-
             editable_columns, fk_info, enum_info = prepare_columns(conn, columns, fk_columns)
 
-            if request.method == "POST":
-                updates = {col["column_name"]: request.form.get(col["column_name"]) or None for col in editable_columns}
-                updates["id"] = row_id
-                set_clause = ", ".join(f"{c} = :{c}" for c in updates if c != "id")
+        if not row:
+            flash(f"The row doesn't exist", "error")
+            return redirect(url_for("admin"))
 
-                try:
+        if request.method == "POST":
+            updates = {col["column_name"]: request.form.get(col["column_name"]) or None for col in editable_columns}
+            updates["id"] = row_id
+            set_clause = ", ".join(f"{c} = :{c}" for c in updates if c != "id")
+
+            try:
+                with db.engine.begin() as conn:
                     conn.execute(text(f"UPDATE {table_name} SET {set_clause} WHERE {pk} = :id"), updates)
-                    flash("Row updated successfully", "success")
-                    return redirect(url_for("admin_table", table_name=table_name))
-                except SQLAlchemyError as e:
-                    flash(f"Failed to update row: {str(getattr(e, 'orig', e))}", "error")
+                if table_name in RBAC_TABLES:
+                    PERMISSION_MATRIX.invalidate()
+                flash("Row updated successfully", "success")
+                return redirect(url_for("admin_table", table_name=table_name))
+            except SQLAlchemyError as e:
+                flash(f"Failed to update row: {str(getattr(e, 'orig', e))}", "error")
 
-            return render_template(
-                "superadmin/edit_row.html",
-                table_name=TABLE_REGISTRY[table_name],
-                raw_table_name=table_name,
-                pk=pk,
-                row=row,
-                columns=editable_columns,
-                fk_info=fk_info,
-                enum_info=enum_info
-            )
+        return render_template(
+            "superadmin/edit_row.html",
+            table_name=TABLE_REGISTRY[table_name],
+            raw_table_name=table_name,
+            pk=pk,
+            row=row,
+            columns=editable_columns,
+            fk_info=fk_info,
+            enum_info=enum_info
+        )
 
     # Add row
     @app.route('/superadmin_panel/table/<table_name>/add', methods=["GET", "POST"])
@@ -271,40 +614,184 @@ def register_routes(app):
             flash(f"The table doesn't exist", "error")
             return redirect(url_for("admin"))
 
-        with db.engine.begin() as conn:
+        with db.engine.connect() as conn:
             columns, _, fk_columns = get_table_metadata(conn, table_name)
             editable_columns, fk_info, enum_info = prepare_columns(conn, columns, fk_columns)
 
-            insert_data = {}
-            if request.method == "POST":
-                for col in editable_columns:
-                    name = col["column_name"]
-                    value = request.form.get(name)
+        insert_data = {}
+        if request.method == "POST":
+            for col in editable_columns:
+                name = col["column_name"]
+                value = request.form.get(name)
 
-                    if value == "" or value is None:
-                        continue
+                if value == "" or value is None:
+                    continue
 
-                    insert_data[name] = value
+                insert_data[name] = value
 
-                if insert_data:
-                    cols_str = ", ".join(insert_data.keys())
-                    placeholders = ", ".join(f":{c}" for c in insert_data.keys())
-                    try:
+            if insert_data:
+                cols_str = ", ".join(insert_data.keys())
+                placeholders = ", ".join(f":{c}" for c in insert_data.keys())
+                try:
+                    with db.engine.begin() as conn:
                         conn.execute(text(f"INSERT INTO {table_name} ({cols_str}) VALUES ({placeholders})"), insert_data)
-                        flash("Row inserted successfully", "success")
-                        return redirect(url_for("admin_table", table_name=table_name))
-                    except SQLAlchemyError as e:
-                        flash(f"Failed to insert row: {str(getattr(e, 'orig', e))}", "error")
+                    if table_name in RBAC_TABLES:
+                        PERMISSION_MATRIX.invalidate()
+                    flash("Row inserted successfully", "success")
+                    return redirect(url_for("admin_table", table_name=table_name))
+                except SQLAlchemyError as e:
+                    flash(f"Failed to insert row: {str(getattr(e, 'orig', e))}", "error")
 
+        return render_template(
+            "superadmin/add_row.html",
+            table_name=TABLE_REGISTRY[table_name],
+            raw_table_name=table_name,
+            columns=editable_columns,
+            fk_info=fk_info,
+            enum_info=enum_info
+        )
+
+    # Bulk delete / column update of the rows selected in the table viewer or matching a filter.
+    # The first POST previews how many rows match; the operation runs once that count is confirmed.
+    @app.route('/superadmin_panel/table/<table_name>/bulk', methods=["GET", "POST"])
+    @login_required
+    @require_superadmin
+    def admin_bulk_rows(table_name):
+        if table_name not in TABLE_REGISTRY:
+            flash(f"The table doesn't exist", "error")
+            return redirect(url_for("admin"))
+
+        with db.engine.connect() as conn:
+            columns, _, fk_columns = get_table_metadata(conn, table_name)
+            pk_columns, _ = get_table_keys(conn, table_name)
+            editable_columns, _, _ = prepare_columns(conn, columns, fk_columns)
+
+        form = {
+            "action": request.form.get("action", "update"),
+            "keys": request.form.getlist("keys"),
+            "column": request.form.get("column", ""),
+            "value": request.form.get("value", ""),
+            "filter_column": request.form.get("filter_column", ""),
+            "filter_op": request.form.get("filter_op", "="),
+            "filter_value": request.form.get("filter_value", ""),
+        }
+        template_args = {
+            "table_name": TABLE_REGISTRY[table_name],
+            "raw_table_name": table_name,
+            "columns": [col["column_name"] for col in columns],
+            "editable_columns": [col["column_name"] for col in editable_columns],
+            "operators": list(ROW_FILTER_OPERATORS),
+            "form": form,
+        }
+        if request.method == "GET":
+            return render_template("superadmin/bulk_rows.html", preview=None, **template_args)
+
+        try:
+            where, params = build_row_selection(
+                columns, pk_columns, form["keys"],
+                form["filter_column"] if not form["keys"] else None, form["filter_op"], form["filter_value"]
+            )
+            if form["action"] == "delete":
+                statement = f"DELETE FROM {table_name} WHERE {where}"
+            elif form["action"] == "update":
+                if form["column"] not in template_args["editable_columns"]:
+                    raise ValueError("Choose the column to update")
+                statement = f"UPDATE {table_name} SET {form['column']} = :new_value WHERE {where}"
+                params["new_value"] = form["value"] or None
+            else:
+                raise ValueError("Unknown bulk action")
+        except ValueError as e:
+            flash(str(e), "error")
+            return render_template("superadmin/bulk_rows.html", preview=None, **template_args)
+
+        expected = request.form.get("confirm", type=int)
+        try:
+            if expected is None:
+                with db.engine.connect() as conn:
+                    count = conn.execute(text(f"SELECT COUNT(*) FROM {table_name} WHERE {where}"), params).scalar_one()
+                return render_template("superadmin/bulk_rows.html", preview=count, **template_args)
+
+            # One statement in one transaction, kept only if it touched the previewed number of rows
+            with db.engine.connect() as conn, conn.begin() as transaction:
+                affected = conn.execute(text(statement), params).rowcount
+                if affected != expected:
+                    transaction.rollback()
+        except SQLAlchemyError as e:
+            flash(f"Bulk {form['action']} failed: {str(getattr(e, 'orig', e))}", "error")
+            return render_template("superadmin/bulk_rows.html", preview=None, **template_args)
+
+        if affected != expected:
+            flash(f"{affected} rows match now instead of {expected}, nothing was changed. Check the new count and confirm again.", "warning")
+            return render_template("superadmin/bulk_rows.html", preview=affected, **template_args)
+
+        if table_name in RBAC_TABLES:
+            PERMISSION_MATRIX.invalidate()
+        flash(f"{'Deleted' if form['action'] == 'delete' else 'Updated'} {affected} rows", "success")
+        return redirect(url_for("admin_table", table_name=table_name))
+
+    # CSV paste/upload into a registered table (header row of column names, empty field = NULL).
+    # The first POST inserts the rows in a transaction that is rolled back to preview the count and errors;
+    # confirming inserts them with the same single statement.
+    @app.route('/superadmin_panel/table/<table_name>/import', methods=["GET", "POST"])
+    @login_required
+    @require_superadmin
+    def admin_import_rows(table_name):
+        if table_name not in TABLE_REGISTRY:
+            flash(f"The table doesn't exist", "error")
+            return redirect(url_for("admin"))
+
+        with db.engine.connect() as conn:
+            columns, _, fk_columns = get_table_metadata(conn, table_name)
+            editable_columns, _, _ = prepare_columns(conn, columns, fk_columns)
+
+        # Array columns can't be passed through unnest() as one array per column
+        column_types = {
+            col["column_name"]: col["udt_name"] for col in editable_columns
+            if not col["udt_name"].startswith("_")
+        }
+        template_args = {
+            "table_name": TABLE_REGISTRY[table_name],
+            "raw_table_name": table_name,
+            "columns": list(column_types),
+        }
+        if request.method == "GET":
+            return render_template("superadmin/import_rows.html", payload="", preview=None, **template_args)
+
+        upload = request.files.get("file")
+        payload = upload.read().decode("utf-8-sig") if upload and upload.filename else request.form.get("payload", "")
+
+        try:
+            header, rows = parse_table_csv(payload, column_types, ADMIN_PASTE_MAX_ROWS)
+        except (ValueError, UnicodeDecodeError) as e:
+            flash(str(e), "error")
+            return render_template("superadmin/import_rows.html", payload=payload, preview=None, **template_args)
+
+        confirmed = request.form.get("confirm") == "1"
+        try:
+            if confirmed:
+                with db.engine.begin() as conn:
+                    inserted = insert_rows(conn, table_name, header, rows, column_types)
+            else:
+                # Dry run: the connection closes without committing
+                with db.engine.connect() as conn:
+                    inserted = insert_rows(conn, table_name, header, rows, column_types)
+        except SQLAlchemyError as e:
+            flash(f"Import failed: {str(getattr(e, 'orig', e))}", "error")
+            return render_template("superadmin/import_rows.html", payload=payload, preview=None, **template_args)
+
+        if not confirmed:
             return render_template(
-                "superadmin/add_row.html",
-                table_name=TABLE_REGISTRY[table_name],
-                raw_table_name=table_name,
-                columns=editable_columns,
-                fk_info=fk_info,
-                enum_info=enum_info
+                "superadmin/import_rows.html",
+                payload=payload,
+                preview={"count": inserted, "header": header, "rows": rows[:ADMIN_PASTE_PREVIEW_ROWS]},
+                **template_args
             )
-        
+
+        if table_name in RBAC_TABLES:
+            PERMISSION_MATRIX.invalidate()
+        flash(f"Inserted {inserted} rows", "success")
+        return redirect(url_for("admin_table", table_name=table_name))
+
     # Delete row
     @app.route('/superadmin_panel/table/<table_name>/<int:row_id>/delete', methods=["POST"])
     @login_required
@@ -322,13 +809,15 @@ def register_routes(app):
 
             try:
                 conn.execute(text(f"DELETE FROM {table_name} WHERE {pk} = :id"), {"id": row_id})
+                if table_name in RBAC_TABLES:
+                    PERMISSION_MATRIX.invalidate()
                 flash("Row deleted successfully", "success")
             except SQLAlchemyError as e:
                 flash(f"Failed to delete row: {str(getattr(e, 'orig', e))}", "error")
 
         return redirect(url_for("admin_table", table_name=table_name))
     
-    # All user notifications page
+    # User notifications page, newest first, keyset-paginated on (sent_datetime, id) with ?after=<cursor>
     @app.route("/notifications")
     @login_required
     def notifications():
@@ -336,119 +825,196 @@ def register_routes(app):
             flash(f"Your user doesn't have a library card number", "error")
             return redirect(url_for("index"))
 
-        with db.engine.begin() as conn:
-            reader_id = conn.execute(text("""SELECT reader_id FROM app_user WHERE app_user.id = :user_id LIMIT 1"""), {"user_id": session["user_id"]}).scalar_one_or_none()
+        after = request.args.get("after")
+        cursor_values = decode_cursor(after, 2)
+        cursor_filter = "AND (sent_datetime, id) < (:k0, :k1)" if cursor_values else ""
+
+        with read_engine().connect() as conn:
+            reader_id = current_reader_id(conn)
 
             if not reader_id:
                 flash(f"Your user doesn't have a library card number", "error")
                 return redirect(url_for("index"))
 
             notifications = conn.execute(
-                text("""
+                text(f"""
                     SELECT id, sent_datetime, subject, body, read
                     FROM app_notification
                     WHERE reader_id = :reader_id
-                    ORDER BY sent_datetime DESC
+                      AND {NOTIFICATION_WINDOW}
+                      {cursor_filter}
+                    ORDER BY sent_datetime DESC, id DESC
+                    LIMIT :limit
                 """),
-                {"reader_id": reader_id}
+                {
+                    "reader_id": reader_id,
+                    "k0": cursor_values and cursor_values[0],
+                    "k1": cursor_values and cursor_values[1],
+                    "limit": NOTIFICATIONS_PAGE_SIZE + 1
+                }
             ).mappings().all()
 
+        next_cursor = None
+        if len(notifications) > NOTIFICATIONS_PAGE_SIZE:
+            notifications = notifications[:NOTIFICATIONS_PAGE_SIZE]
+            next_cursor = encode_cursor([notifications[-1]["sent_datetime"], notifications[-1]["id"]])
+
         return render_template(
             "reader/notifications.html",
-            notifications=notifications
+            notifications=notifications,
+            after=after if cursor_values else None,
+            next_cursor=next_cursor
         )
     
-    # Toggle read/unread for a single notification
+    # Latest notifications preview for the dropdown (JSON)
+    @app.route("/notifications/preview")
+    @login_required
+    def notifications_preview():
+        with db.engine.connect() as conn:
+            reader_id = current_reader_id(conn)
+
+            if not reader_id:
+                return jsonify(notifications=[], has_more=False)
+
+            notifications = conn.execute(
+                text(NOTIFICATION_PREVIEW_QUERY),
+                {"reader_id": reader_id}
+            ).mappings().all()
+
+        return jsonify(
+            notifications=[
+                {
+                    "id": n["id"],
+                    "sent_datetime": n["sent_datetime"].strftime("%Y-%m-%d %H:%M"),
+                    "subject": n["subject"],
+                    "body": n["body"],
+                    "read": n["read"]
+                }
+                for n in notifications[:10]
+            ],
+            has_more=len(notifications) > 10
+        )
+
+    # Toggle read/unread for a single notification of the logged-in reader
     @app.route("/notification/<int:notif_id>/toggle", methods=["POST"])
     @login_required
     def toggle_notification_read(notif_id):
+        after = request.args.get("after")
+
         with db.engine.begin() as conn:
-            current = conn.execute(
-                text("SELECT read FROM app_notification WHERE id = :id"),
-                {"id": notif_id}
+            toggled = conn.execute(
+                text(f"""
+                    UPDATE app_notification
+                    SET read = NOT read
+                    WHERE id = :id
+                      AND reader_id = :reader_id
+                      AND {NOTIFICATION_WINDOW}
+                    RETURNING id
+                """),
+                {"id": notif_id, "reader_id": current_reader_id(conn)}
             ).scalar_one_or_none()
 
-            if current is None:
-                flash("Notification not found", "error")
-                return redirect(url_for("notifications"))
-
-            conn.execute(
-                text("UPDATE app_notification SET read = :new WHERE id = :id"),
-                {"new": not current, "id": notif_id}
-            )
-
-        return redirect(url_for("notifications") + f"#notif-{notif_id}")
-    
-    # Browse books page
-    @app.route("/books")
-    def browse_books():
-        searches = {
-            "b.title": request.args.get("title", "").strip(),
-            "a.unique_name": request.args.get("authors", "").strip(),
-            "c.name": request.args.get("categories", "").strip(),
-            "b.description": request.args.get("description", "").strip()
-        }
+        if toggled is None:
+            flash("Notification not found", "error")
+            return redirect(url_for("notifications", after=after))
 
-        conditions = []
-        params = {}
-        param_counter = 0
+        return redirect(url_for("notifications", after=after) + f"#notif-{notif_id}")
 
-        for column, search_string in searches.items():
-            local_conditions = []
-            for pattern in search_string.split("||"):
-                if not pattern:
-                    continue
+    # Mark the selected (or all) notifications of the logged-in reader as read, in one statement
+    @app.route("/notifications/mark_read", methods=["POST"])
+    @login_required
+    def mark_notifications_read():
+        after = request.form.get("after") or None
+        mark_all = request.form.get("scope") == "all"
+        ids = request.form.getlist("ids", type=int)
 
-                param = f"p{param_counter}"
-                param_counter += 1
-                local_conditions.append("{column} ILIKE :{param}".format(column=column, param=param))
-                params[param] = f"{pattern}"
+        if not mark_all and not ids:
+            flash("No notifications selected", "error")
+            return redirect(url_for("notifications", after=after))
 
-            if local_conditions:
-                conditions.append(" OR ".join(local_conditions))
+        # Both scopes stay inside the retention window, so only its partitions are scanned
+        selection = "" if mark_all else "AND id = ANY(:ids)"
 
-        where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
-        
         with db.engine.begin() as conn:
-            rows = conn.execute(
-                text(f"""
-                    SELECT DISTINCT b.id
-                    FROM book b
-                    LEFT JOIN book_author ba ON ba.book_id = b.id
-                    LEFT JOIN author a ON a.id = ba.author_id
-                    LEFT JOIN book_category bc ON bc.book_id = b.id
-                    LEFT JOIN category c ON c.id = bc.category_id
-                    {where_clause}
-                """),
-                params
-            ).all()
-
-            book_ids = [r[0] for r in rows]
-            view_where_clause = ""
-            view_params = {}
-
-            if book_ids:
-                view_where_clause = f"WHERE book_id = ANY(:book_ids)"
-                view_params = {"book_ids": book_ids}
-                if request.args.get("available_only") == "1":
-                    view_where_clause += " AND (total_copies - currently_issued_copies - currently_reserved_copies) > 0"
-            elif conditions:
-                view_where_clause = "WHERE 1 = 0"
-            
-            books = conn.execute(
+            marked = conn.execute(
                 text(f"""
-                    SELECT *
-                    FROM book_info_view
-                    {view_where_clause}
-                    ORDER BY title
+                    UPDATE app_notification
+                    SET read = TRUE
+                    WHERE reader_id = :reader_id
+                      AND NOT read
+                      AND {NOTIFICATION_WINDOW}
+                      {selection}
                 """),
-                view_params
-            ).mappings().all()
+                {"reader_id": current_reader_id(conn), "ids": ids}
+            ).rowcount
 
-            return render_template(
-                "reader/books.html",
-                books=books,
-                filters=request.args
+        flash(f"Marked {marked} notification{'s' if marked != 1 else ''} as read", "success")
+        return redirect(url_for("notifications", after=None if mark_all else after))
+    
+    # Browse books page (one statement: page of books, total and facet counts).
+    # The rendered results are cached per normalized search and catalog version, and anonymous
+    # visitors get ETag / Last-Modified validators, so hot pages are served without a query.
+    @app.route("/books")
+    def browse_books():
+        filters, page = normalize_book_search(request.args)
+        key = (tuple(sorted(filters.items())), page)
+
+        engine = read_engine()
+        # The catalog version is only ever stamped from the replica (or the primary without one).
+        # A sticky session reading the primary may see a newer catalog than that version says,
+        # so its pages bypass the cache instead of being stored under a version the replica lacks.
+        cached = engine is (db.engines.get("replica") or db.engine)
+        version, changed_at, results = None, None, None
+        if cached:
+            version, changed_at = CATALOG_FRAGMENTS.stamp_from(engine)
+            results = CATALOG_FRAGMENTS.get(version, key)
+
+        if results is None:
+            ranked = bool(filters.get("q"))
+            if ranked:
+                # Relevance search: best matches first, total counted up to SEARCH_COUNT_LIMIT, no facets
+                query, params = build_ranked_search(filters, page, BOOKS_PAGE_SIZE)
+            else:
+                query, params = build_book_search(filters, page, BOOKS_PAGE_SIZE, BOOKS_FACET_LIMIT)
+
+            with engine.connect() as conn:
+                result = conn.execute(text(query), params).mappings().one()
+                # Precomputed by `flask build-recommendations`, which bumps the catalog version
+                similar = similar_books(conn, [b["book_id"] for b in result["books"]])
+
+            total = result["total"]
+            results = render_template(
+                "reader/book_results.html",
+                books=result["books"],
+                similar=similar,
+                total=total,
+                total_capped=ranked and total >= SEARCH_COUNT_LIMIT,
+                page=page,
+                pages=max((total + BOOKS_PAGE_SIZE - 1) // BOOKS_PAGE_SIZE, 1),
+                facets=None if ranked else {
+                    "authors": result["author_facets"],
+                    "categories": result["category_facets"],
+                    "availability": {
+                        "available": result["available_count"],
+                        "unavailable": result["unavailable_count"]
+                    }
+                },
+                args=filters
             )
-
-
+            if cached:
+                CATALOG_FRAGMENTS.put(version, key, results)
+
+        response = make_response(render_template("reader/books.html", results=Markup(results), filters=filters))
+
+        # Logged-in pages carry per-user content (and flashed messages), so only plain anonymous pages
+        # rendered under the stamped version are validated
+        if not cached or "user_id" in session or "_flashes" in session:
+            response.cache_control.private = True
+            return response
+
+        response.set_etag(hashlib.sha1(repr((version, key)).encode()).hexdigest(), weak=True)
+        if changed_at is not None:
+            response.last_modified = changed_at
+        response.cache_control.no_cache = True
+        response.vary.add("Cookie")
+        return response.make_conditional(request)
@@ -0,0 +1,37 @@
+// Typeahead for FK inputs: fills the input's <datalist> from the superadmin lookup endpoint
+document.querySelectorAll("input.fk-lookup").forEach(input => {
+    const datalist = document.getElementById(input.getAttribute("list"));
+    let timer = null;
+    let controller = null;
+
+    const refresh = () => {
+        const url = new URL(input.dataset.lookupUrl, window.location.origin);
+        url.searchParams.set("q", input.value.trim());
+
+        // Only the latest lookup may fill the list: a slower earlier response would show stale options
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+
+        fetch(url, { signal: controller.signal })
+            .then(response => response.json())
+            .then(data => {
+                datalist.replaceChildren();
+                for (const row of data.results || []) {
+                    const option = document.createElement("option");
+                    option.value = row.id;
+                    option.label = row.label;
+                    option.textContent = row.label;
+                    datalist.appendChild(option);
+                }
+            })
+            .catch(() => {});
+    };
+
+    input.addEventListener("input", () => {
+        clearTimeout(timer);
+        timer = setTimeout(refresh, 200);
+    });
+    input.addEventListener("focus", refresh, { once: true });
+});
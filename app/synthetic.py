@@ -0,0 +1,312 @@
+# synthetic.py
+from sqlalchemy import text
+import random
+import string
+
+# Vocabulary for generated titles, descriptions and names
+WORDS = [
+    "shadow", "river", "empire", "garden", "silent", "winter", "crown", "stone", "hidden", "storm",
+    "memory", "glass", "forest", "ocean", "fire", "last", "night", "golden", "broken", "wild",
+    "city", "dream", "iron", "secret", "song", "island", "mountain", "letter", "house", "road",
+    "star", "blood", "light", "dark", "war", "love", "kingdom", "daughter", "journey", "machine",
+    "ghost", "paper", "bridge", "harbor", "library", "clock", "mirror", "summer", "tide", "wolf",
+]
+FIRST_NAMES = ["Anna", "Jan", "Maria", "Piotr", "Ewa", "Tomasz", "Olga", "Adam", "Zofia", "Marek", "Lena", "Igor"]
+LAST_NAMES = ["Nowak", "Kowalski", "Wiśniewska", "Wójcik", "Kamińska", "Lewandowski", "Zielińska", "Szymański"]
+
+# Skew used for "popular" picks: 1 + floor(n * random() ^ SKEW) favours low numbers
+SKEW = 2.5
+
+
+# Generate a scalable, skewed dataset with set-based SQL (one statement per entity).
+# Generated rows are tagged with a random run tag so repeated runs don't collide.
+# Returns the number of rows created per table.
+def seed_synthetic(conn, books, authors, categories, publishers, readers, copies_per_book,
+                   issues, active_issue_ratio, reservations, ratings, notifications, seed=None):
+    rng = random.Random(seed)
+    tag = "".join(rng.choices(string.ascii_lowercase, k=4))
+    if seed is not None:
+        conn.execute(text("SELECT setseed(:seed)"), {"seed": rng.uniform(-1, 1)})
+
+    params = {
+        "tag": tag,
+        "words": WORDS,
+        "first_names": FIRST_NAMES,
+        "last_names": LAST_NAMES,
+        "skew": SKEW,
+        "books": books,
+        "authors": authors,
+        "categories": categories,
+        "publishers": publishers,
+        "readers": readers,
+        "copies_per_book": copies_per_book,
+        "issues": issues,
+        "active_issue_ratio": active_issue_ratio,
+        "reservations": reservations,
+        "ratings": ratings,
+        "notifications": notifications,
+    }
+    created = {}
+
+    # n -> id mappings of the generated rows
+    for name in ("syn_category", "syn_author", "syn_publisher", "syn_book", "syn_reader"):
+        conn.execute(text(f"CREATE TEMPORARY TABLE {name} (n BIGINT PRIMARY KEY, id BIGINT NOT NULL) ON COMMIT DROP"))
+    conn.execute(text("""
+        CREATE TEMPORARY TABLE syn_copy (
+            n BIGINT PRIMARY KEY,
+            id BIGINT NOT NULL,
+            has_active_issue BOOLEAN NOT NULL DEFAULT FALSE
+        ) ON COMMIT DROP
+    """))
+
+    created["category"] = conn.execute(text("""
+        WITH ins AS (
+            INSERT INTO category (name, suggested_min_age, description)
+            SELECT
+                initcap((:words)[1 + (g % array_length(:words, 1))]) || ' ' || :tag || ' ' || g,
+                CASE WHEN random() < 0.2 THEN 12 + floor(random() * 6)::INT END,
+                'Synthetic category ' || g
+            FROM generate_series(1, :categories) AS g
+            RETURNING id
+        )
+        INSERT INTO syn_category (n, id)
+        SELECT row_number() OVER (ORDER BY id), id
+        FROM ins
+    """), params).rowcount
+
+    created["author"] = conn.execute(text("""
+        WITH ins AS (
+            INSERT INTO author (unique_name, first_name, last_name, bio)
+            SELECT
+                f.first_name || ' ' || f.last_name || ' ' || :tag || g,
+                f.first_name,
+                f.last_name,
+                'Synthetic author ' || g
+            FROM generate_series(1, :authors) AS g
+            CROSS JOIN LATERAL (
+                SELECT
+                    (:first_names)[1 + floor(random() * array_length(:first_names, 1))::INT + 0 * g] AS first_name,
+                    (:last_names)[1 + floor(random() * array_length(:last_names, 1))::INT + 0 * g] AS last_name
+            ) f
+            RETURNING id
+        )
+        INSERT INTO syn_author (n, id)
+        SELECT row_number() OVER (ORDER BY id), id
+        FROM ins
+    """), params).rowcount
+
+    created["publisher"] = conn.execute(text("""
+        WITH ins AS (
+            INSERT INTO publisher (name, description)
+            SELECT 'Publisher ' || :tag || ' ' || g, 'Synthetic publisher ' || g
+            FROM generate_series(1, :publishers) AS g
+            RETURNING id
+        )
+        INSERT INTO syn_publisher (n, id)
+        SELECT row_number() OVER (ORDER BY id), id
+        FROM ins
+    """), params).rowcount
+
+    created["book"] = conn.execute(text("""
+        WITH ins AS (
+            INSERT INTO book (title, description)
+            SELECT
+                initcap(t.words) || ' ' || :tag || g,
+                d.words
+            FROM generate_series(1, :books) AS g
+            CROSS JOIN LATERAL (
+                SELECT string_agg((:words)[1 + floor(random() * array_length(:words, 1))::INT], ' ') AS words
+                FROM generate_series(1, 2 + (g % 3))
+            ) t
+            CROSS JOIN LATERAL (
+                SELECT string_agg((:words)[1 + floor(random() * array_length(:words, 1))::INT], ' ') AS words
+                FROM generate_series(1, 15 + (g % 25))
+            ) d
+            RETURNING id
+        )
+        INSERT INTO syn_book (n, id)
+        SELECT row_number() OVER (ORDER BY id), id
+        FROM ins
+    """), params).rowcount
+
+    created["book_author"] = conn.execute(text("""
+        INSERT INTO book_author (book_id, author_id)
+        SELECT b.id, a.id
+        FROM syn_book b
+        CROSS JOIN LATERAL (
+            SELECT 1 + floor(:authors * power(random(), :skew))::BIGINT + 0 * k AS author_n
+            FROM generate_series(1, 1 + (b.n % 3)) AS k
+        ) p
+        JOIN syn_author a ON a.n = p.author_n
+        ON CONFLICT DO NOTHING
+    """), params).rowcount
+
+    created["book_category"] = conn.execute(text("""
+        INSERT INTO book_category (book_id, category_id)
+        SELECT b.id, c.id
+        FROM syn_book b
+        CROSS JOIN LATERAL (
+            SELECT 1 + floor(:categories * power(random(), :skew))::BIGINT + 0 * k AS category_n
+            FROM generate_series(1, 1 + (b.n % 2)) AS k
+        ) p
+        JOIN syn_category c ON c.n = p.category_n
+        ON CONFLICT DO NOTHING
+    """), params).rowcount
+
+    created["book_copy"] = conn.execute(text("""
+        WITH ins AS (
+            INSERT INTO book_copy (isbn, year_published, place_of_publication, book_id, publisher_id, purchase_datetime, purchase_price)
+            SELECT
+                lpad(floor(random() * 1e13)::BIGINT::TEXT, 13, '0'),
+                (1950 + floor(random() * 75))::SMALLINT,
+                'Synthetic City',
+                b.id,
+                p.id,
+                CURRENT_TIMESTAMP - random() * INTERVAL '3650 days',
+                round((5 + random() * 95)::NUMERIC, 2)
+            FROM syn_book b
+            CROSS JOIN LATERAL (
+                SELECT 1 + floor(:publishers * power(random(), :skew))::BIGINT + 0 * k AS publisher_n
+                FROM generate_series(1, 1 + floor(random() * (2 * :copies_per_book - 1))::INT + 0 * b.n) AS k
+            ) k
+            JOIN syn_publisher p ON p.n = k.publisher_n
+            RETURNING id
+        )
+        INSERT INTO syn_copy (n, id)
+        SELECT row_number() OVER (ORDER BY id), id
+        FROM ins
+    """), params).rowcount
+    params["copies"] = created["book_copy"]
+
+    created["reader"] = conn.execute(text("""
+        WITH ins AS (
+            INSERT INTO reader (card_no, first_name, last_name)
+            SELECT
+                'SYN' || :tag || lpad(g::TEXT, 8, '0'),
+                (:first_names)[1 + floor(random() * array_length(:first_names, 1))::INT + 0 * g],
+                (:last_names)[1 + floor(random() * array_length(:last_names, 1))::INT + 0 * g]
+            FROM generate_series(1, :readers) AS g
+            RETURNING id
+        )
+        INSERT INTO syn_reader (n, id)
+        SELECT row_number() OVER (ORDER BY id), id
+        FROM ins
+    """), params).rowcount
+
+    # Returned issues: popular copies get long histories, one weekly slot per issue,
+    # all ending more than 30 days ago so they never overlap active issues
+    created["issue"] = conn.execute(text("""
+        WITH picks AS (
+            SELECT
+                g,
+                1 + floor(:copies * power(random(), :skew))::BIGINT AS copy_n,
+                1 + floor(:readers * power(random(), :skew))::BIGINT AS reader_n,
+                1 + floor(random() * 6)::INT AS loan_days
+            FROM generate_series(1, :issues) AS g
+        ),
+        slotted AS (
+            SELECT *, row_number() OVER (PARTITION BY copy_n ORDER BY g) AS k
+            FROM picks
+        )
+        INSERT INTO issue (issue_datetime, due_datetime, return_datetime, book_copy_id, reader_id)
+        SELECT
+            t.start,
+            t.start + INTERVAL '14 days',
+            t.start + s.loan_days * INTERVAL '1 day',
+            c.id,
+            r.id
+        FROM slotted s
+        CROSS JOIN LATERAL (
+            SELECT CURRENT_TIMESTAMP - INTERVAL '30 days' - s.k * INTERVAL '7 days' AS start
+        ) t
+        JOIN syn_copy c ON c.n = s.copy_n
+        JOIN syn_reader r ON r.n = s.reader_n
+    """), params).rowcount
+
+    # Active issues (some overdue) on a fraction of the copies
+    conn.execute(text("""
+        UPDATE syn_copy
+        SET has_active_issue = TRUE
+        WHERE random() < :active_issue_ratio
+    """), params)
+    created["issue"] += conn.execute(text("""
+        INSERT INTO issue (issue_datetime, due_datetime, book_copy_id, reader_id)
+        SELECT t.start, t.start + INTERVAL '14 days', c.id, r.id
+        FROM syn_copy c
+        CROSS JOIN LATERAL (
+            SELECT
+                CURRENT_TIMESTAMP - (1 + random() * 28) * INTERVAL '1 day' + 0 * c.n * INTERVAL '1 day' AS start,
+                1 + floor(:readers * power(random(), :skew))::BIGINT + 0 * c.n AS reader_n
+        ) t
+        JOIN syn_reader r ON r.n = t.reader_n
+        WHERE c.has_active_issue
+    """), params).rowcount
+
+    # Future reservations on copies without an active issue, one weekly slot per reservation
+    created["reservation"] = conn.execute(text("""
+        WITH free_copies AS (
+            SELECT row_number() OVER (ORDER BY n) AS free_n, id
+            FROM syn_copy
+            WHERE NOT has_active_issue
+        ),
+        picks AS (
+            SELECT
+                g,
+                1 + floor((SELECT COUNT(*) FROM free_copies) * power(random(), :skew))::BIGINT AS free_n,
+                1 + floor(:readers * random())::BIGINT AS reader_n
+            FROM generate_series(1, :reservations) AS g
+        ),
+        slotted AS (
+            SELECT *, row_number() OVER (PARTITION BY free_n ORDER BY g) - 1 AS k
+            FROM picks
+        )
+        INSERT INTO reservation (from_datetime, to_datetime, book_copy_id, reader_id)
+        SELECT
+            CURRENT_TIMESTAMP + INTERVAL '1 hour' + s.k * INTERVAL '7 days',
+            CURRENT_TIMESTAMP + INTERVAL '1 hour' + s.k * INTERVAL '7 days' + INTERVAL '3 days',
+            c.id,
+            r.id
+        FROM slotted s
+        JOIN free_copies c ON c.free_n = s.free_n
+        JOIN syn_reader r ON r.n = s.reader_n
+    """), params).rowcount
+
+    created["rating"] = conn.execute(text("""
+        WITH picks AS (
+            SELECT
+                1 + floor(:books * power(random(), :skew))::BIGINT AS book_n,
+                1 + floor(:readers * random())::BIGINT AS reader_n,
+                (1 + floor(10 * power(random(), 0.7)))::SMALLINT AS rating,
+                CURRENT_TIMESTAMP - random() * INTERVAL '1000 days' AS post_datetime
+            FROM generate_series(1, :ratings) AS g
+        )
+        INSERT INTO rating (book_id, reader_id, rating, review, post_datetime)
+        SELECT b.id, r.id, p.rating, CASE WHEN random() < 0.1 THEN 'Synthetic review' END, p.post_datetime
+        FROM picks p
+        JOIN syn_book b ON b.n = p.book_n
+        JOIN syn_reader r ON r.n = p.reader_n
+    """), params).rowcount
+
+    # Monthly partitions covering the generated sent_datetime range
+    conn.execute(text("SELECT create_notification_partitions(LOCALTIMESTAMP - INTERVAL '365 days', LOCALTIMESTAMP)"))
+
+    created["app_notification"] = conn.execute(text("""
+        WITH picks AS (
+            SELECT
+                g,
+                1 + floor(:readers * power(random(), :skew))::BIGINT AS reader_n,
+                CURRENT_TIMESTAMP - random() * INTERVAL '365 days' AS sent_datetime
+            FROM generate_series(1, :notifications) AS g
+        )
+        INSERT INTO app_notification (sent_datetime, reader_id, subject, body, read)
+        SELECT
+            p.sent_datetime,
+            r.id,
+            'Synthetic notification ' || p.g,
+            'This is a synthetic notification body.',
+            p.sent_datetime < CURRENT_TIMESTAMP - INTERVAL '14 days' OR random() < 0.3
+        FROM picks p
+        JOIN syn_reader r ON r.n = p.reader_n
+    """), params).rowcount
+
+    return tag, created
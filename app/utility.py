@@ -1,64 +1,220 @@
 # utility.py
 from sqlalchemy import text
 from pathlib import Path
+import base64
 import json
 import os
+from .cache import VersionedCache
+
+# Load columns, PKs, FKs and enum labels of every registered table with a few set-based catalog queries
+def load_schema_catalog(conn):
+    tables = list(load_table_registry().keys())
 
-def get_table_metadata(conn, table_name):
-    # Get all columns
     columns = conn.execute(text("""
         SELECT
+            table_name,
             column_name,
             data_type,
             is_nullable,
             column_default,
             udt_name,
-            is_identity
+            is_identity,
+            is_generated
         FROM information_schema.columns
-        WHERE table_name = :table
-        ORDER BY ordinal_position
-    """), {"table": table_name}).mappings().all()
+        WHERE table_schema = current_schema()
+          AND table_name = ANY(:tables)
+        ORDER BY table_name, ordinal_position
+    """), {"tables": tables}).mappings().all()
 
-    # Get primary key
-    pk = conn.execute(text("""
-        SELECT a.attname
+    # PK columns per table (in index key order)
+    pks = conn.execute(text("""
+        SELECT
+            c.relname AS table_name,
+            a.attname AS column_name
         FROM pg_index i
+        JOIN pg_class c
+            ON c.oid = i.indrelid
         JOIN pg_attribute a
             ON a.attrelid = i.indrelid
            AND a.attnum = ANY(i.indkey)
-        WHERE i.indrelid = to_regclass(:table)
-          AND i.indisprimary
-    """), {"table": table_name}).scalar()
+        WHERE i.indisprimary
+          AND pg_table_is_visible(c.oid)
+          AND c.relname = ANY(:tables)
+        ORDER BY c.relname, array_position(i.indkey::int2[], a.attnum)
+    """), {"tables": tables}).mappings().all()
+
+    # Leading columns of plain btree indexes (usable for ORDER BY + keyset pagination)
+    indexed = conn.execute(text("""
+        SELECT DISTINCT
+            c.relname AS table_name,
+            a.attname AS column_name
+        FROM pg_index i
+        JOIN pg_class c
+            ON c.oid = i.indrelid
+        JOIN pg_class ic
+            ON ic.oid = i.indexrelid
+        JOIN pg_am am
+            ON am.oid = ic.relam
+        JOIN pg_attribute a
+            ON a.attrelid = i.indrelid
+           AND a.attnum = i.indkey[0]
+        WHERE am.amname = 'btree'
+          AND i.indpred IS NULL
+          AND pg_table_is_visible(c.oid)
+          AND c.relname = ANY(:tables)
+    """), {"tables": tables}).mappings().all()
+
+    fks = conn.execute(text("""
+        SELECT
+            c.relname AS table_name,
+            a.attname AS column_name,
+            rc.relname AS ref_table,
+            ra.attname AS ref_column
+        FROM pg_constraint con
+        JOIN pg_class c
+            ON c.oid = con.conrelid
+        JOIN pg_class rc
+            ON rc.oid = con.confrelid
+        CROSS JOIN LATERAL unnest(con.conkey, con.confkey) AS k(attnum, ref_attnum)
+        JOIN pg_attribute a
+            ON a.attrelid = con.conrelid
+           AND a.attnum = k.attnum
+        JOIN pg_attribute ra
+            ON ra.attrelid = con.confrelid
+           AND ra.attnum = k.ref_attnum
+        WHERE con.contype = 'f'
+          AND pg_table_is_visible(c.oid)
+          AND c.relname = ANY(:tables)
+    """), {"tables": tables}).mappings().all()
+
+    enums = conn.execute(text("""
+        SELECT pg_type.typname, pg_enum.enumlabel
+        FROM pg_enum
+        JOIN pg_type ON pg_type.oid = pg_enum.enumtypid
+        ORDER BY pg_type.typname, pg_enum.enumsortorder
+    """)).all()
+
+    catalog = {
+        "tables": {
+            table: {"columns": [], "pk": None, "pk_columns": [], "fk_columns": {}, "indexed_columns": set()}
+            for table in tables
+        },
+        "enums": {}
+    }
 
-    # Get foreign keys
-    fk_columns = {}
     for col in columns:
-        col_name = col["column_name"]
-        fk = conn.execute(text("""
-            SELECT
-                ccu.table_name AS ref_table,
-                ccu.column_name AS ref_column
-            FROM information_schema.table_constraints tc
-            JOIN information_schema.key_column_usage kcu
-                ON tc.constraint_name = kcu.constraint_name
-               AND tc.table_name = kcu.table_name
-            JOIN information_schema.constraint_column_usage ccu
-                ON ccu.constraint_name = tc.constraint_name
-            WHERE tc.constraint_type = 'FOREIGN KEY'
-              AND tc.table_name = :table
-              AND kcu.column_name = :col
-        """), {"table": table_name, "col": col_name}).mappings().first()
-
-        if fk:
-            fk_columns[col_name] = fk
-
-    return columns, pk, fk_columns
-
-# Helper to prepare editable columns, FK values, and dropdown options
+        col = dict(col)
+        catalog["tables"][col.pop("table_name")]["columns"].append(col)
+
+    for row in pks:
+        table = catalog["tables"][row["table_name"]]
+        table["pk_columns"].append(row["column_name"])
+        table["pk"] = table["pk_columns"][0]
+
+    for row in indexed:
+        catalog["tables"][row["table_name"]]["indexed_columns"].add(row["column_name"])
+
+    for row in fks:
+        catalog["tables"][row["table_name"]]["fk_columns"].setdefault(
+            row["column_name"],
+            {"ref_table": row["ref_table"], "ref_column": row["ref_column"]}
+        )
+
+    for typname, label in enums:
+        catalog["enums"].setdefault(typname, []).append(label)
+
+    return catalog
+
+# Per-process schema catalog, reloaded when DDL bumps the 'schema' cache version
+SCHEMA_CATALOG = VersionedCache("schema", load_schema_catalog)
+
+def get_table_metadata(conn, table_name):
+    table = SCHEMA_CATALOG.get(conn)["tables"].get(table_name)
+    if table is None:
+        return [], None, {}
+    return table["columns"], table["pk"], table["fk_columns"]
+
+# Helper: full (possibly composite) PK and the columns the viewer may sort by
+def get_table_keys(conn, table_name):
+    table = SCHEMA_CATALOG.get(conn)["tables"].get(table_name)
+    if table is None:
+        return [], []
+
+    # Only NOT NULL columns led by a btree index keep keyset comparisons exact and index-backed
+    sortable = [
+        col["column_name"] for col in table["columns"]
+        if col["column_name"] in table["indexed_columns"] and col["is_nullable"] == "NO"
+    ]
+    return table["pk_columns"], sortable
+
+# Helper: labels of a Postgres enum type, in declaration order
+def get_enum_labels(conn, enum_type):
+    return SCHEMA_CATALOG.get(conn)["enums"].get(enum_type, [])
+
+# Typeahead lookups: table -> (searched column, human-readable label expression)
+LOOKUP_LABELS = {
+    "book": ("title", "title"),
+    "author": ("unique_name", "unique_name"),
+    "category": ("name", "name"),
+    "publisher": ("name", "name"),
+    "book_copy": (
+        "CAST(isbn AS TEXT)",
+        "COALESCE(isbn, '-') || ' (' || (SELECT title FROM book WHERE book.id = book_copy.book_id) || ')'"
+    ),
+    "reader": ("card_no", "card_no || ' ' || COALESCE(first_name, '') || ' ' || COALESCE(last_name, '')"),
+    "app_role": ("name", "name"),
+    "entity_permission": ("name", "name"),
+    "app_user": ("username", "username"),
+}
+
+# Helper: (value, label) pairs from `table_name` matching the prefix/typo-tolerant query `q`.
+# Matches are ranked (exact value or text, then prefix, then trigram similarity), so only the first page is returned
+# for a query; `after` pages through the unfiltered list in value order.
+def lookup_rows(conn, table_name, value_column, q="", after=None, limit=20):
+    search_column, label = LOOKUP_LABELS.get(table_name, (None, f"{value_column}::text"))
+    conditions = []
+    order = []
+    params = {"limit": limit}
+
+    if q:
+        matches = []
+        if q.isdigit():
+            params["value"] = int(q)
+            matches.append(f"{value_column} = :value")
+            order.append(f"{value_column} = :value DESC")
+        if search_column:
+            escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params["prefix"] = f"{escaped}%"
+            params["q"] = q
+            matches.append(f"{search_column} ILIKE :prefix")
+            matches.append(f"{search_column} % :q")
+            order.append(f"LOWER({search_column}) = LOWER(:q) DESC")
+            order.append(f"{search_column} ILIKE :prefix DESC")
+            order.append(f"similarity({search_column}, :q) DESC")
+        if not matches:
+            return []
+        conditions.append("(" + " OR ".join(matches) + ")")
+    elif after is not None:
+        params["after"] = after
+        conditions.append(f"{value_column} > :after")
+
+    where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
+    return conn.execute(
+        text(f"""
+            SELECT {value_column} AS id, {label} AS label
+            FROM {table_name}
+            {where_clause}
+            ORDER BY {", ".join(order + [value_column])}
+            LIMIT :limit
+        """),
+        params
+    ).mappings().all()
+
+# Helper to prepare editable columns, FK references, and dropdown options
 def prepare_columns(conn, columns, fk_columns):
     editable_columns = [
         col for col in columns
-        if col['is_identity'] != 'YES'
+        if col['is_identity'] != 'YES' and col['is_generated'] != 'ALWAYS'
     ]
 
     fk_cols = {}
@@ -68,19 +224,12 @@ def prepare_columns(conn, columns, fk_columns):
         col_name = col["column_name"]
         col_data_type = col["data_type"]
 
+        # FK values are looked up lazily through the typeahead endpoint
         if col_name in fk_columns:
-            ref_table = fk_columns[col_name]["ref_table"]
-            ref_column = fk_columns[col_name]["ref_column"]
-            fk_cols[col_name] = conn.execute(text(f"SELECT {ref_column} FROM {ref_table}")).scalars().all()
+            fk_cols[col_name] = fk_columns[col_name]
 
         if col_data_type == "USER-DEFINED":
-            rows = conn.execute(text("""
-                SELECT enumlabel, enumsortorder
-                FROM pg_enum
-                JOIN pg_type ON pg_type.oid = pg_enum.enumtypid
-                WHERE pg_type.typname = :enum_type
-            """), {"enum_type": col.get('udt_name', None)}).all()
-            enum_values = [row[0] for row in sorted(rows, key=lambda r: r[1])]
+            enum_values = get_enum_labels(conn, col.get('udt_name', None))
             if enum_values:
                 dropdown_cols[col_name] = enum_values
 
@@ -98,15 +247,175 @@ def load_table_registry():
         tables = json.load(f)
     return tables
 
+# Compile role -> entity -> max access level (as enum rank) plus the superadmin role id
+def load_permission_matrix(conn):
+    levels = {level: rank for rank, level in enumerate(get_enum_labels(conn, "access_level_enum"))}
+
+    rows = conn.execute(text("""
+        SELECT rp.role_id, p.entity, MAX(p.access_level)::text AS access_level
+        FROM app_role_entity_permission rp
+        JOIN entity_permission p
+            ON p.id = rp.permission_id
+        GROUP BY rp.role_id, p.entity
+    """)).all()
+
+    roles = {}
+    for role_id, entity, access_level in rows:
+        roles.setdefault(role_id, {})[entity] = levels[access_level]
+
+    superadmin_role_id = conn.execute(
+        text("SELECT id FROM app_role WHERE name = :superadmin_role"),
+        {"superadmin_role": os.getenv("APP_SUPERADMIN_ROLE", "superadmin")}
+    ).scalar_one_or_none()
+
+    return {"levels": levels, "roles": roles, "superadmin_role_id": superadmin_role_id}
+
+# Per-process permission matrix, reloaded when RBAC tables bump the 'permissions' cache version
+PERMISSION_MATRIX = VersionedCache("permissions", load_permission_matrix)
+
+# Helper: does the role hold at least `access_level` on `entity`
+def has_permission(matrix, role_id, entity, access_level):
+    required = matrix["levels"].get(access_level)
+    if required is None:
+        return False
+    return matrix["roles"].get(role_id, {}).get(entity, -1) >= required
+
 # Helper function: is role a superadmin
 def is_superadmin_role(conn, role_id):
-    return conn.execute(
-        text("""
-            SELECT :role_id = get_role_id(:superadmin_role)
-        """),
-        {
-            "role_id": role_id,
-            "superadmin_role": os.getenv("APP_SUPERADMIN_ROLE", "superadmin"),
-        }
-    ).scalar()
-    
+    superadmin_role_id = PERMISSION_MATRIX.get(conn)["superadmin_role_id"]
+    return superadmin_role_id is not None and role_id == superadmin_role_id
+
+# Helper: opaque URL-safe keyset cursor from a row's sort key
+def encode_cursor(values):
+    raw = json.dumps([None if v is None else str(v) for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+# Helper: sort key from a keyset cursor (None if malformed or of the wrong width)
+def decode_cursor(cursor, width):
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != width:
+        return None
+    return values
+
+# Build a keyset-paginated SELECT over `order_cols`.
+# Going backwards (before a cursor) the order is flipped; KeysetPage restores it.
+def build_keyset_query(table_name, order_cols, cursor_values, backwards=False, descending=False):
+    ascending = backwards == descending
+    direction = "ASC" if ascending else "DESC"
+    params = {}
+    where_clause = ""
+
+    if cursor_values is not None:
+        placeholders = []
+        for i, value in enumerate(cursor_values):
+            params[f"k{i}"] = value
+            placeholders.append(f":k{i}")
+        where_clause = "WHERE ({cols}) {op} ({vals})".format(
+            cols=", ".join(order_cols),
+            op=">" if ascending else "<",
+            vals=", ".join(placeholders)
+        )
+
+    order_clause = ", ".join(f"{col} {direction}" for col in order_cols)
+    return f"SELECT * FROM {table_name} {where_clause} ORDER BY {order_clause} LIMIT :limit", params
+
+# Operators of the superadmin bulk filter (the NULL tests take no value)
+ROW_FILTER_OPERATORS = {
+    "=": "=",
+    "<>": "<>",
+    "<": "<",
+    "<=": "<=",
+    ">": ">",
+    ">=": ">=",
+    "contains": "ILIKE",
+    "is null": "IS NULL",
+    "is not null": "IS NOT NULL",
+}
+
+# Build the WHERE condition of a bulk row operation: either the rows whose PK values are in `keys`
+# (encoded like keyset cursors) or the rows matching one column filter. Raises ValueError for bad input.
+def build_row_selection(columns, pk_columns, keys=None, filter_column=None, filter_op=None, filter_value=None):
+    types = {col["column_name"]: col["udt_name"] for col in columns}
+
+    if keys:
+        decoded = [decode_cursor(key, len(pk_columns)) for key in keys]
+        if not pk_columns or any(key is None for key in decoded):
+            raise ValueError("Invalid row selection")
+        # PK values arrive as text, one typed array per PK column
+        params = {f"k{i}": [key[i] for key in decoded] for i in range(len(pk_columns))}
+        arrays = ", ".join(f"CAST(:k{i} AS {types[col]}[])" for i, col in enumerate(pk_columns))
+        return f"({', '.join(pk_columns)}) IN (SELECT * FROM unnest({arrays}))", params
+
+    if filter_column:
+        if filter_column not in types:
+            raise ValueError("The filter column doesn't exist")
+        op = ROW_FILTER_OPERATORS.get(filter_op)
+        if op is None:
+            raise ValueError("Unknown filter operator")
+        if op in ("IS NULL", "IS NOT NULL"):
+            return f"{filter_column} {op}", {}
+        if op == "ILIKE":
+            escaped = (filter_value or "").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            return f"CAST({filter_column} AS TEXT) ILIKE :filter_value", {"filter_value": f"%{escaped}%"}
+        return f"{filter_column} {op} :filter_value", {"filter_value": filter_value}
+
+    raise ValueError("Select rows or enter a filter")
+
+# One page of rows read lazily from a (server-side) result.
+# Rows are yielded as they are fetched; next/prev cursors are known once iteration is done.
+class KeysetPage:
+    def __init__(self, result, order_cols, page_size, backwards=False, has_cursor=False):
+        self.result = result
+        self.order_cols = order_cols
+        self.page_size = page_size
+        self.backwards = backwards
+        self.has_cursor = has_cursor
+        self.first_key = None
+        self.last_key = None
+        self.has_more = False
+
+    def _key(self, row):
+        return [row[col] for col in self.order_cols]
+
+    def __iter__(self):
+        rows = self.result.mappings()
+        if self.backwards:
+            # Bounded by page_size, flipped back into display order
+            buffered = []
+            for row in rows:
+                if len(buffered) == self.page_size:
+                    self.has_more = True
+                    break
+                buffered.append(row)
+            rows = reversed(buffered)
+
+        count = 0
+        for row in rows:
+            if count == self.page_size:
+                self.has_more = True
+                break
+            if count == 0:
+                self.first_key = self._key(row)
+            self.last_key = self._key(row)
+            count += 1
+            yield row
+
+    @property
+    def next_cursor(self):
+        has_next = self.has_cursor if self.backwards else self.has_more
+        if has_next and self.last_key is not None:
+            return encode_cursor(self.last_key)
+        return None
+
+    @property
+    def prev_cursor(self):
+        has_prev = self.has_more if self.backwards else self.has_cursor
+        if has_prev and self.first_key is not None:
+            return encode_cursor(self.first_key)
+        return None
+
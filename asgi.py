@@ -0,0 +1,4 @@
+# asgi.py
+from app.api import create_api
+
+app = create_api()
@@ -0,0 +1,131 @@
+# conflict_checks.py
+# Compares reservation insert throughput on a book copy with a long issue history:
+# legacy OVERLAPS trigger (sequential scan of the copy's history) vs tsrange && trigger (GiST lookup).
+# Everything runs in one transaction that is rolled back, so it is safe against a local database.
+#
+# Usage: python -m benchmarks.conflict_checks --history 100000 --inserts 500
+from sqlalchemy import text
+import argparse
+import time
+import uuid
+from app import create_app, db
+
+LEGACY_FUNCTION = """
+    CREATE OR REPLACE FUNCTION check_reservation_conflicts_legacy()
+    RETURNS trigger AS $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1
+            FROM reservation r
+            WHERE r.book_copy_id = NEW.book_copy_id
+              AND r.id <> NEW.id
+              AND ((r.from_datetime, r.to_datetime)
+                    OVERLAPS (NEW.from_datetime, NEW.to_datetime))
+        ) THEN
+            RAISE EXCEPTION 'Current reservation period overlaps with an existing reservation for this book copy.';
+        END IF;
+
+        IF EXISTS (
+            SELECT 1
+            FROM issue i
+            WHERE i.book_copy_id = NEW.book_copy_id
+              AND ((i.issue_datetime, COALESCE(i.return_datetime, 'infinity'::timestamp))
+                    OVERLAPS (NEW.from_datetime, NEW.to_datetime))
+        ) THEN
+            RAISE EXCEPTION 'Current reservation period overlaps with an existing issue for this book copy.';
+        END IF;
+
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+
+def seed_history(conn, history):
+    tag = uuid.uuid4().hex[:12]
+    publisher_id = conn.execute(
+        text("INSERT INTO publisher (name) VALUES (:name) RETURNING id"), {"name": f"bench-{tag}"}
+    ).scalar_one()
+    book_id = conn.execute(
+        text("INSERT INTO book (title) VALUES (:title) RETURNING id"), {"title": f"bench-{tag}"}
+    ).scalar_one()
+    copy_id = conn.execute(
+        text("INSERT INTO book_copy (book_id, publisher_id, purchase_price) VALUES (:book_id, :publisher_id, 0) RETURNING id"),
+        {"book_id": book_id, "publisher_id": publisher_id}
+    ).scalar_one()
+    reader_id = conn.execute(
+        text("INSERT INTO reader (card_no) VALUES (:card_no) RETURNING id"), {"card_no": tag[:15].ljust(15, "0")}
+    ).scalar_one()
+
+    # One returned issue per hour, ending before now
+    conn.execute(
+        text("""
+            INSERT INTO issue (issue_datetime, due_datetime, return_datetime, book_copy_id, reader_id)
+            SELECT
+                CURRENT_TIMESTAMP - (g * INTERVAL '1 hour'),
+                CURRENT_TIMESTAMP - (g * INTERVAL '1 hour') + INTERVAL '30 minutes',
+                CURRENT_TIMESTAMP - (g * INTERVAL '1 hour') + INTERVAL '30 minutes',
+                :copy_id,
+                :reader_id
+            FROM generate_series(1, :history) AS g
+        """),
+        {"copy_id": copy_id, "reader_id": reader_id, "history": history}
+    )
+    conn.execute(text("ANALYZE issue"))
+    conn.execute(text("ANALYZE reservation"))
+    return copy_id, reader_id
+
+
+def time_inserts(conn, copy_id, reader_id, inserts, first_day):
+    started = time.perf_counter()
+    for day in range(first_day, first_day + inserts):
+        conn.execute(
+            text("""
+                INSERT INTO reservation (from_datetime, to_datetime, book_copy_id, reader_id)
+                VALUES (
+                    CURRENT_TIMESTAMP + (:day * INTERVAL '1 day'),
+                    CURRENT_TIMESTAMP + (:day * INTERVAL '1 day') + INTERVAL '12 hours',
+                    :copy_id,
+                    :reader_id
+                )
+            """),
+            {"day": day, "copy_id": copy_id, "reader_id": reader_id}
+        )
+    return inserts / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reservation conflict-check trigger benchmark")
+    parser.add_argument("--history", type=int, default=100000, help="Past issues of the benchmarked copy")
+    parser.add_argument("--inserts", type=int, default=500, help="Reservations inserted per variant")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context(), db.engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            copy_id, reader_id = seed_history(conn, args.history)
+
+            conn.execute(text(LEGACY_FUNCTION))
+            conn.execute(text("ALTER TABLE reservation DISABLE TRIGGER trg_reservation_conflicts"))
+            conn.execute(text("""
+                CREATE TRIGGER trg_reservation_conflicts_legacy
+                BEFORE INSERT OR UPDATE ON reservation
+                FOR EACH ROW EXECUTE FUNCTION check_reservation_conflicts_legacy()
+            """))
+            legacy = time_inserts(conn, copy_id, reader_id, args.inserts, first_day=1)
+
+            conn.execute(text("DROP TRIGGER trg_reservation_conflicts_legacy ON reservation"))
+            conn.execute(text("ALTER TABLE reservation ENABLE TRIGGER trg_reservation_conflicts"))
+            ranged = time_inserts(conn, copy_id, reader_id, args.inserts, first_day=args.inserts + 1)
+        finally:
+            trans.rollback()
+
+    print(f"History: {args.history} issues on one copy, {args.inserts} reservation inserts per variant")
+    print(f"OVERLAPS trigger:      {legacy:10,.0f} inserts/s")
+    print(f"tsrange && trigger:    {ranged:10,.0f} inserts/s")
+    print(f"Speedup:               {ranged / legacy:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# http_throughput.py
+# Closed-loop HTTP load generator: `--concurrency` clients send requests back to back over
+# keep-alive connections for `--duration` seconds, then throughput and latency percentiles are reported.
+# Used to compare the development server (python run.py), the gunicorn web app and the async API.
+#
+# Usage: python -m benchmarks.http_throughput http://localhost:8000/books --concurrency 50 --duration 30
+#        python -m benchmarks.http_throughput http://localhost:8001/api/v1/notifications/unread_count --cookie "session=..."
+# With --label a Markdown table row is printed as well, for the results table in the README.
+from urllib.parse import urlsplit
+import argparse
+import http.client
+import statistics
+import threading
+import time
+
+
+def client(url, headers, deadline, latencies, errors, lock):
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    conn = connection_class(parts.hostname, parts.port, timeout=30)
+    local_latencies = []
+    local_errors = 0
+
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                local_errors += 1
+            else:
+                local_latencies.append(time.perf_counter() - started)
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            conn.close()
+            conn = connection_class(parts.hostname, parts.port, timeout=30)
+    conn.close()
+
+    with lock:
+        latencies.extend(local_latencies)
+        errors[0] += local_errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP throughput benchmark")
+    parser.add_argument("url")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent keep-alive clients")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--cookie", help="Cookie header to send (e.g. the session cookie of a logged-in reader)")
+    parser.add_argument("--label", help="Also print the results as a Markdown table row starting with this label")
+    args = parser.parse_args()
+
+    headers = {"Connection": "keep-alive"}
+    if args.cookie:
+        headers["Cookie"] = args.cookie
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=client, args=(args.url, headers, deadline, latencies, errors, lock))
+        for _ in range(args.concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.url}: {args.concurrency} clients for {elapsed:.1f}s")
+    print(f"Requests:    {len(latencies):10,} ok, {errors[0]:,} failed")
+    print(f"Throughput:  {len(latencies) / elapsed:10,.0f} req/s")
+    if latencies:
+        percentiles = statistics.quantiles(latencies, n=100)
+        print(f"Latency p50: {percentiles[49] * 1000:10.1f}ms")
+        print(f"Latency p95: {percentiles[94] * 1000:10.1f}ms")
+        print(f"Latency p99: {percentiles[98] * 1000:10.1f}ms")
+        if args.label:
+            print(
+                f"| {args.label} | {len(latencies) / elapsed:,.0f} | {percentiles[49] * 1000:.1f} "
+                f"| {percentiles[94] * 1000:.1f} | {percentiles[98] * 1000:.1f} | {errors[0]:,} |"
+            )
+
+
+if __name__ == "__main__":
+    main()
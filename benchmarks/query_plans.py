@@ -0,0 +1,206 @@
+# query_plans.py
+# Runs the real queries behind browse_books, inject_notifications, the notification preview,
+# admin_table and the views against the configured database (seed it with `flask seed-synthetic` first).
+# For every case it records the median latency and the EXPLAIN plan shape, and fails when
+# - the plan sequentially scans a large table the case doesn't allow, or
+# - the median latency exceeds --max-ms, or --regression-factor x the baseline median.
+# Queries are read-only; EXPLAIN ANALYZE runs in a transaction that is rolled back.
+#
+# Usage: python -m benchmarks.query_plans --output plans.json [--baseline plans.json]
+from sqlalchemy import text
+import argparse
+import json
+import statistics
+import sys
+import time
+from app import create_app, db
+from app.catalog import build_book_search, build_ranked_search
+from app.recommendations import SIMILAR_BOOKS_QUERY, RECOMMENDATIONS_PER_BOOK
+from app.routes import UNREAD_COUNT_QUERY, NOTIFICATION_PREVIEW_QUERY, ADMIN_PAGE_SIZE, BOOKS_PAGE_SIZE, BOOKS_FACET_LIMIT
+from app.utility import build_keyset_query
+
+
+# Sample keys the cases are parameterized with: the busiest reader, a popular book and a title to search for
+def pick_samples(conn):
+    return conn.execute(text("""
+        SELECT
+            (SELECT reader_id FROM app_notification GROUP BY reader_id ORDER BY COUNT(*) DESC LIMIT 1) AS reader_id,
+            (SELECT book_id FROM rating GROUP BY book_id ORDER BY COUNT(*) DESC LIMIT 1) AS book_id,
+            (SELECT title FROM book ORDER BY id DESC LIMIT 1) AS title,
+            (SELECT id FROM issue ORDER BY id LIMIT 1 OFFSET 1000) AS issue_cursor
+    """)).mappings().one()
+
+
+def keyset_case(table, cursor):
+    query, params = build_keyset_query(table, ["id"], cursor)
+    params["limit"] = ADMIN_PAGE_SIZE + 1
+    return query, params
+
+
+# Each case: (sql, params) builder and the large relations it may scan sequentially
+CASES = {
+    "browse_books": {
+        "build": lambda s: build_book_search({}, 1, BOOKS_PAGE_SIZE, BOOKS_FACET_LIMIT),
+        # The unfiltered catalog reads every book to count the facets
+        "allow_seq_scan": {"book", "book_availability", "book_author", "book_category"},
+    },
+    "browse_books_title_search": {
+        "build": lambda s: build_book_search({"title": f"%{s['title']}%"}, 1, BOOKS_PAGE_SIZE, BOOKS_FACET_LIMIT),
+        "allow_seq_scan": set(),
+    },
+    "browse_books_ranked_search": {
+        "build": lambda s: build_ranked_search({"q": s["title"]}, 1, BOOKS_PAGE_SIZE),
+        "allow_seq_scan": set(),
+    },
+    "browse_books_last_page": {
+        "build": lambda s: build_book_search({}, 50, BOOKS_PAGE_SIZE, BOOKS_FACET_LIMIT),
+        "allow_seq_scan": {"book", "book_availability", "book_author", "book_category"},
+    },
+    "browse_books_similar": {
+        "build": lambda s: (SIMILAR_BOOKS_QUERY, {"book_ids": [s["book_id"]], "limit": RECOMMENDATIONS_PER_BOOK}),
+        "allow_seq_scan": set(),
+    },
+    "inject_notifications": {
+        "build": lambda s: (UNREAD_COUNT_QUERY, {"reader_id": s["reader_id"]}),
+        "allow_seq_scan": set(),
+    },
+    "notifications_preview": {
+        "build": lambda s: (NOTIFICATION_PREVIEW_QUERY, {"reader_id": s["reader_id"]}),
+        "allow_seq_scan": set(),
+    },
+    "admin_table_issue_first_page": {
+        "build": lambda s: keyset_case("issue", None),
+        "allow_seq_scan": set(),
+    },
+    "admin_table_issue_next_page": {
+        "build": lambda s: keyset_case("issue", [s["issue_cursor"]]),
+        "allow_seq_scan": set(),
+    },
+    "book_info_view_by_book": {
+        "build": lambda s: ("SELECT * FROM book_info_view WHERE book_id = :book_id", {"book_id": s["book_id"]}),
+        "allow_seq_scan": set(),
+    },
+    "reader_activity_by_reader": {
+        "build": lambda s: ("SELECT * FROM reader_activity(p_reader_id => :reader_id)", {"reader_id": s["reader_id"]}),
+        "allow_seq_scan": set(),
+    },
+    "reader_info_view_by_reader": {
+        "build": lambda s: ("SELECT * FROM reader_info_view WHERE reader_id = :reader_id", {"reader_id": s["reader_id"]}),
+        "allow_seq_scan": set(),
+    },
+    "user_info_view": {
+        "build": lambda s: ("SELECT * FROM user_info_view", {}),
+        "allow_seq_scan": {"app_user", "reader"},
+    },
+}
+
+
+# Helper: flatten an EXPLAIN (FORMAT JSON) plan into "Node Type [relation] [index]" lines, indented by depth
+def plan_shape(node, depth=0):
+    label = node["Node Type"]
+    if "Relation Name" in node:
+        label += f" on {node['Relation Name']}"
+    if "Index Name" in node:
+        label += f" using {node['Index Name']}"
+    shape = ["  " * depth + label]
+    for child in node.get("Plans", []):
+        shape.extend(plan_shape(child, depth + 1))
+    return shape
+
+
+# Helper: relations scanned sequentially anywhere in the plan
+def seq_scans(node):
+    found = set()
+    if node["Node Type"] == "Seq Scan":
+        found.add(node["Relation Name"])
+    for child in node.get("Plans", []):
+        found |= seq_scans(child)
+    return found
+
+
+def run_case(conn, query, params, runs):
+    timings = []
+    conn.execute(text(query), params).all()  # warm-up
+    for _ in range(runs):
+        started = time.perf_counter()
+        conn.execute(text(query), params).all()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    try:
+        plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}"), params).scalar_one()
+    finally:
+        conn.rollback()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return statistics.median(timings), plan[0]["Plan"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query latency and plan-shape regression checks")
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs per case (median is reported)")
+    parser.add_argument("--max-ms", type=float, default=250.0, help="Fail a case whose median latency exceeds this")
+    parser.add_argument("--min-rows", type=int, default=10000, help="Sequential scans of smaller tables are ignored")
+    parser.add_argument("--baseline", help="Results JSON of a previous run to compare against")
+    parser.add_argument("--regression-factor", type=float, default=2.0, help="Fail when median > factor x baseline median")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--case", action="append", choices=sorted(CASES), help="Run only these cases")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["cases"]
+
+    app = create_app()
+    results = {}
+    failures = []
+
+    with app.app_context(), db.engine.connect() as conn:
+        samples = pick_samples(conn)
+        table_rows = dict(conn.execute(text("""
+            SELECT relname, reltuples::BIGINT
+            FROM pg_class
+            WHERE relkind IN ('r', 'p') AND relnamespace = 'public'::regnamespace
+        """)).all())
+        conn.rollback()
+
+        for name in args.case or CASES:
+            case = CASES[name]
+            query, params = case["build"](samples)
+            median_ms, plan = run_case(conn, query, params, args.runs)
+
+            problems = []
+            for relation in sorted(seq_scans(plan) - case["allow_seq_scan"]):
+                if table_rows.get(relation, 0) >= args.min_rows:
+                    problems.append(f"sequential scan on {relation} ({table_rows[relation]} rows)")
+            if median_ms > args.max_ms:
+                problems.append(f"median {median_ms:.1f}ms exceeds {args.max_ms:.0f}ms")
+
+            shape = plan_shape(plan)
+            previous = baseline.get(name)
+            if previous:
+                if median_ms > previous["median_ms"] * args.regression_factor:
+                    problems.append(f"median {median_ms:.1f}ms is over {args.regression_factor}x the baseline {previous['median_ms']:.1f}ms")
+                if previous["plan"] != shape:
+                    print(f"  note: plan of {name} changed since the baseline")
+
+            results[name] = {"median_ms": round(median_ms, 3), "plan": shape, "problems": problems}
+            status = "FAIL" if problems else "ok"
+            print(f"{status:4}  {name:32} {median_ms:9.1f}ms")
+            for problem in problems:
+                print(f"      - {problem}")
+            if problems:
+                failures.append(name)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"tables": table_rows, "cases": results}, f, indent=2)
+
+    if failures:
+        print(f"{len(failures)} of {len(results)} cases failed: {', '.join(failures)}")
+        sys.exit(1)
+    print(f"All {len(results)} cases passed")
+
+
+if __name__ == "__main__":
+    main()
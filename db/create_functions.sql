@@ -182,4 +182,201 @@ BEGIN
 
     RETURN v_permission_id;
 END;
-$$;
\ No newline at end of file
+$$;
+-- +================================+
+-- | REFRESH BOOK AVAILABILITY ROWS |
+-- +================================+
+-- Recomputes the summary rows of the given books from their copies, issues, reservations,
+-- authors, categories and ratings. expires_at is the earliest moment at which an active
+-- issue or reservation of the book stops being active without any write.
+CREATE OR REPLACE FUNCTION refresh_book_availability(p_book_ids BIGINT[])
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_refreshed INTEGER;
+BEGIN
+    -- Serialize concurrent refreshes of the same books; the next statement then sees their commits
+    PERFORM 1
+    FROM book_availability
+    WHERE book_id = ANY(p_book_ids)
+    ORDER BY book_id
+    FOR UPDATE;
+
+    INSERT INTO book_availability (
+        book_id, title, authors, categories, description,
+        total_copies, currently_issued_copies, currently_reserved_copies,
+        rating_count, rating_sum, expires_at, refreshed_at
+    )
+    SELECT
+        b.id,
+        b.title,
+        COALESCE(a.authors, ''),
+        COALESCE(c.categories, ''),
+        COALESCE(b.description, ''),
+        cp.total_copies,
+        cp.issued_copies,
+        cp.reserved_copies,
+        rt.rating_count,
+        rt.rating_sum,
+        ex.expires_at,
+        CURRENT_TIMESTAMP
+    FROM book b
+    LEFT JOIN LATERAL (
+        SELECT STRING_AGG(a.unique_name, ', ' ORDER BY a.unique_name) AS authors
+        FROM book_author ba
+        JOIN author a ON a.id = ba.author_id
+        WHERE ba.book_id = b.id
+    ) a ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT STRING_AGG(c.name, ', ' ORDER BY c.name) AS categories
+        FROM book_category bc
+        JOIN category c ON c.id = bc.category_id
+        WHERE bc.book_id = b.id
+    ) c ON TRUE
+    CROSS JOIN LATERAL (
+        SELECT
+            COUNT(*) AS total_copies,
+            COUNT(*) FILTER (WHERE EXISTS (
+                SELECT 1
+                FROM issue i
+                WHERE i.book_copy_id = bc.id
+                  AND COALESCE(i.return_datetime, 'infinity'::timestamp) > CURRENT_TIMESTAMP
+            )) AS issued_copies,
+            COUNT(*) FILTER (WHERE EXISTS (
+                SELECT 1
+                FROM reservation r
+                WHERE r.book_copy_id = bc.id
+                  AND r.to_datetime > CURRENT_TIMESTAMP
+            )) AS reserved_copies
+        FROM book_copy bc
+        WHERE bc.book_id = b.id
+    ) cp
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS rating_count, COALESCE(SUM(r.rating), 0) AS rating_sum
+        FROM rating r
+        WHERE r.book_id = b.id
+    ) rt
+    CROSS JOIN LATERAL (
+        SELECT MIN(t.changes_at) AS expires_at
+        FROM (
+            SELECT i.return_datetime AS changes_at
+            FROM book_copy bc
+            JOIN issue i ON i.book_copy_id = bc.id
+            WHERE bc.book_id = b.id
+              AND i.return_datetime > CURRENT_TIMESTAMP
+            UNION ALL
+            SELECT r.to_datetime
+            FROM book_copy bc
+            JOIN reservation r ON r.book_copy_id = bc.id
+            WHERE bc.book_id = b.id
+              AND r.to_datetime > CURRENT_TIMESTAMP
+        ) t
+    ) ex
+    WHERE b.id = ANY(p_book_ids)
+    ON CONFLICT (book_id) DO UPDATE
+        SET title = EXCLUDED.title,
+            authors = EXCLUDED.authors,
+            categories = EXCLUDED.categories,
+            description = EXCLUDED.description,
+            total_copies = EXCLUDED.total_copies,
+            currently_issued_copies = EXCLUDED.currently_issued_copies,
+            currently_reserved_copies = EXCLUDED.currently_reserved_copies,
+            rating_count = EXCLUDED.rating_count,
+            rating_sum = EXCLUDED.rating_sum,
+            expires_at = EXCLUDED.expires_at,
+            refreshed_at = EXCLUDED.refreshed_at;
+
+    GET DIAGNOSTICS v_refreshed = ROW_COUNT;
+    RETURN v_refreshed;
+END;
+$$;
+
+-- +======================================+
+-- | SWEEP EXPIRED BOOK AVAILABILITY ROWS |
+-- +======================================+
+-- Refreshes books whose issues or reservations changed state by the passage of time
+CREATE OR REPLACE FUNCTION sweep_book_availability()
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_book_ids BIGINT[];
+BEGIN
+    SELECT array_agg(book_id)
+    INTO v_book_ids
+    FROM book_availability
+    WHERE expires_at <= CURRENT_TIMESTAMP;
+
+    -- Most runs find nothing expired; skip the refresh (and its triggers) entirely
+    IF v_book_ids IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    RETURN refresh_book_availability(v_book_ids);
+END;
+$$;
+
+-- +=================+
+-- | READER ACTIVITY |
+-- +=================+
+-- The reader_info_view columns (plus overdue loans) for one reader, found by id or card number:
+--   SELECT * FROM reader_activity(p_reader_id => 42);
+--   SELECT * FROM reader_activity(p_card_no => 'C00000000000042');
+-- Every count is an index lookup keyed by the reader, instead of the view's aggregation over whole tables.
+CREATE OR REPLACE FUNCTION reader_activity(p_reader_id BIGINT DEFAULT NULL, p_card_no TEXT DEFAULT NULL)
+RETURNS TABLE (
+    reader_id BIGINT,
+    library_card VARCHAR(15),
+    first_name TEXT,
+    last_name TEXT,
+    total_issues BIGINT,
+    active_issues BIGINT,
+    overdue_issues BIGINT,
+    total_reservations BIGINT,
+    active_reservations BIGINT,
+    total_ratings BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        r.id,
+        r.card_no,
+        COALESCE(r.first_name, ''),
+        COALESCE(r.last_name, ''),
+        (SELECT COUNT(*) FROM issue i WHERE i.reader_id = r.id),
+        active.issues,
+        active.overdue,
+        (SELECT COUNT(*) FROM reservation res WHERE res.reader_id = r.id),
+        (
+            SELECT COUNT(*)
+            FROM reservation res
+            WHERE res.reader_id = r.id
+              AND res.to_datetime >= CURRENT_TIMESTAMP
+        ),
+        (SELECT COUNT(*) FROM rating rt WHERE rt.reader_id = r.id)
+    FROM reader r
+    CROSS JOIN LATERAL (
+        -- Open loans and loans with a return date still ahead, as separate branches: an OR of the
+        -- two predicates would not match the partial index idx_issue_open_reader_id
+        SELECT
+            COUNT(*) AS issues,
+            COUNT(*) FILTER (WHERE t.due_datetime < CURRENT_TIMESTAMP) AS overdue
+        FROM (
+            SELECT i.due_datetime
+            FROM issue i
+            WHERE i.reader_id = r.id
+              AND i.return_datetime IS NULL
+
+            UNION ALL
+
+            SELECT i.due_datetime
+            FROM issue i
+            WHERE i.reader_id = r.id
+              AND i.return_datetime > CURRENT_TIMESTAMP
+        ) t
+    ) active
+    WHERE r.id = p_reader_id
+       OR r.card_no = p_card_no;
+$$;
@@ -16,6 +16,7 @@ CREATE INDEX IF NOT EXISTS idx_book_author_book_id ON book_author(book_id);
 CREATE INDEX IF NOT EXISTS idx_book_category_book_id ON book_category(book_id);
 CREATE INDEX IF NOT EXISTS idx_book_copy_book_id ON book_copy(book_id);
 CREATE INDEX IF NOT EXISTS idx_rating_book_id ON rating(book_id);
+CREATE INDEX IF NOT EXISTS idx_book_similarity_similar_book_id ON book_similarity(similar_book_id);
 
 -- author.unique_name (GIN trigram index)
 CREATE INDEX IF NOT EXISTS idx_author_unique_name_trgm ON author USING gin(unique_name gin_trgm_ops);
@@ -51,7 +52,7 @@ CREATE INDEX IF NOT EXISTS idx_book_copy_publisher_id ON book_copy(publisher_id)
 CREATE INDEX IF NOT EXISTS idx_issue_reader_id ON issue(reader_id);
 CREATE INDEX IF NOT EXISTS idx_reservation_reader_id ON reservation(reader_id);
 CREATE INDEX IF NOT EXISTS idx_rating_reader_id ON rating(reader_id);
-CREATE INDEX IF NOT EXISTS idx_app_notification_reader_id ON app_notification(reader_id);
+CREATE INDEX IF NOT EXISTS idx_app_notification_reader_id_sent_datetime ON app_notification(reader_id, sent_datetime DESC);
 CREATE INDEX IF NOT EXISTS idx_app_user_reader_id ON app_user(reader_id);
 
 -- book_copy.isbn
@@ -67,7 +68,7 @@ CREATE INDEX IF NOT EXISTS idx_reservation_from_datetime ON reservation(from_dat
 -- reservation.to_datetime
 CREATE INDEX IF NOT EXISTS idx_reservation_to_datetime ON reservation(to_datetime);
 
--- issue.issue_datetime
+-- issue.issue_datetime (also serves the date-range scans of the rollup builds)
 CREATE INDEX IF NOT EXISTS idx_issue_issue_datetime ON issue(issue_datetime);
 
 -- issue.due_datetime
@@ -76,8 +77,17 @@ CREATE INDEX IF NOT EXISTS idx_issue_due_datetime ON issue(due_datetime);
 -- issue.return_datetime
 CREATE INDEX IF NOT EXISTS idx_issue_return_datetime ON issue(return_datetime);
 
--- app_notification.sent_time (BRIN index)
-CREATE INDEX IF NOT EXISTS idx_app_notification_sent_datetime_brin ON app_notification USING brin(sent_datetime) WITH (pages_per_range = 16);
+-- issue.due_datetime of open loans (due-soon and overdue reminders)
+CREATE INDEX IF NOT EXISTS idx_issue_open_due_datetime ON issue(due_datetime) WHERE return_datetime IS NULL;
+
+-- issue.reader_id of open loans (reader activity)
+CREATE INDEX IF NOT EXISTS idx_issue_open_reader_id ON issue(reader_id) WHERE return_datetime IS NULL;
+
+-- reservation.reader_id + to_datetime (a reader's active reservations)
+CREATE INDEX IF NOT EXISTS idx_reservation_reader_id_to_datetime ON reservation(reader_id, to_datetime);
+
+-- notification_reminder.period_start (retention cleanup)
+CREATE INDEX IF NOT EXISTS idx_notification_reminder_period_start ON notification_reminder(period_start);
 
 -- app_role.id FK's
 CREATE INDEX IF NOT EXISTS idx_app_user_role_id ON app_user(role_id);
@@ -85,3 +95,25 @@ CREATE INDEX IF NOT EXISTS idx_app_role_entity_permission_role_id ON app_role_en
 
 -- entity_permission.id FK
 CREATE INDEX IF NOT EXISTS idx_app_role_entity_permission_permission_id ON app_role_entity_permission(permission_id);
+
+-- book_availability.title (catalog ordering)
+CREATE INDEX IF NOT EXISTS idx_book_availability_title ON book_availability(title);
+
+-- book_availability.search_vector (ranked full-text search)
+CREATE INDEX IF NOT EXISTS idx_book_availability_search_vector ON book_availability USING gin(search_vector);
+
+-- book_availability.title (typo-tolerant title matching in the ranked search)
+CREATE INDEX IF NOT EXISTS idx_book_availability_title_trgm ON book_availability USING gin(title gin_trgm_ops);
+
+-- book_availability.expires_at (time-based sweep)
+CREATE INDEX IF NOT EXISTS idx_book_availability_expires_at ON book_availability(expires_at) WHERE expires_at IS NOT NULL;
+
+-- FK typeahead lookups (GIN trigram indexes)
+CREATE INDEX IF NOT EXISTS idx_category_name_trgm ON category USING gin(name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_reader_card_no_trgm ON reader USING gin(card_no gin_trgm_ops);
+-- isbn is CHAR(13), which gin_trgm_ops doesn't accept: index the text value the lookup searches
+CREATE INDEX IF NOT EXISTS idx_book_copy_isbn_trgm ON book_copy USING gin((CAST(isbn AS TEXT)) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_app_user_username_trgm ON app_user USING gin(username gin_trgm_ops);
+
+-- login_throttle.window_start (purging expired counters)
+CREATE INDEX IF NOT EXISTS idx_login_throttle_window_start ON login_throttle(window_start);
@@ -1,5 +1,8 @@
 -- create_tables.sql
 
+-- Enable btree_gist for exclusion constraints mixing equality and range overlap
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
 CREATE TABLE IF NOT EXISTS book (
     id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
     title TEXT NOT NULL UNIQUE,
@@ -62,9 +65,17 @@ CREATE TABLE IF NOT EXISTS book_copy (
     FOREIGN KEY (publisher_id) REFERENCES publisher(id) ON DELETE RESTRICT
 );
 
+-- Library card numbers: 'C' + 14-digit sequence value, so generated numbers never collide
+CREATE SEQUENCE IF NOT EXISTS reader_card_no_seq;
+
+CREATE OR REPLACE FUNCTION next_card_no()
+RETURNS VARCHAR(15) AS $$
+    SELECT 'C' || lpad(nextval('reader_card_no_seq')::TEXT, 14, '0');
+$$ LANGUAGE sql;
+
 CREATE TABLE IF NOT EXISTS reader (
     id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
-    card_no VARCHAR(15) NOT NULL UNIQUE,
+    card_no VARCHAR(15) NOT NULL UNIQUE DEFAULT next_card_no(),
     first_name TEXT,
     last_name TEXT,
     CONSTRAINT card_no_fixed_length CHECK (LENGTH(card_no) = 15)
@@ -76,7 +87,9 @@ CREATE TABLE IF NOT EXISTS reservation (
     to_datetime TIMESTAMP NOT NULL,
     book_copy_id BIGINT NOT NULL,
     reader_id BIGINT NOT NULL,
+    period TSRANGE GENERATED ALWAYS AS (tsrange(from_datetime, to_datetime, '[)')) STORED,
     CONSTRAINT to_datetime_check CHECK (from_datetime < to_datetime),
+    CONSTRAINT reservation_no_overlap EXCLUDE USING gist (book_copy_id WITH =, period WITH &&),
     FOREIGN KEY (book_copy_id) REFERENCES book_copy(id) ON DELETE RESTRICT,
     FOREIGN KEY (reader_id) REFERENCES reader(id) ON DELETE RESTRICT
 );
@@ -88,8 +101,10 @@ CREATE TABLE IF NOT EXISTS issue (
     return_datetime TIMESTAMP,
     book_copy_id BIGINT NOT NULL,
     reader_id BIGINT NOT NULL,
+    period TSRANGE GENERATED ALWAYS AS (tsrange(issue_datetime, return_datetime, '[)')) STORED,
     CONSTRAINT due_datetime_check CHECK (issue_datetime < due_datetime),
     CONSTRAINT return_datetime_check CHECK (return_datetime IS NULL OR issue_datetime < return_datetime),
+    CONSTRAINT issue_no_overlap EXCLUDE USING gist (book_copy_id WITH =, period WITH &&),
     FOREIGN KEY (book_copy_id) REFERENCES book_copy(id) ON DELETE RESTRICT,
     FOREIGN KEY (reader_id) REFERENCES reader(id) ON DELETE RESTRICT
 );
@@ -106,14 +121,67 @@ CREATE TABLE IF NOT EXISTS rating (
     FOREIGN KEY (reader_id) REFERENCES reader(id) ON DELETE RESTRICT
 );
 
+-- Monthly range partitions named app_notification_YYYY_MM (see create_notification_partitions)
 CREATE TABLE IF NOT EXISTS app_notification (
-    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    id BIGINT GENERATED ALWAYS AS IDENTITY,
     sent_datetime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     reader_id BIGINT NOT NULL,
     subject TEXT NOT NULL,
     body TEXT NOT NULL,
     read BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (id, sent_datetime),
     FOREIGN KEY (reader_id) REFERENCES reader(id) ON DELETE RESTRICT
+) PARTITION BY RANGE (sent_datetime);
+
+-- Catches notifications outside every monthly partition, so inserts never fail for a missing month
+CREATE TABLE IF NOT EXISTS app_notification_default PARTITION OF app_notification DEFAULT;
+
+-- Creates the missing monthly app_notification partitions covering p_from..p_to, returns how many it created.
+-- Rows of a new month already caught by the default partition are moved into it (directly, so the
+-- unread counters are untouched); a partition cannot be created while the default holds rows of its range.
+CREATE OR REPLACE FUNCTION create_notification_partitions(p_from TIMESTAMP, p_to TIMESTAMP)
+RETURNS INTEGER AS $$
+DECLARE
+    v_month TIMESTAMP := date_trunc('month', p_from);
+    v_name TEXT;
+    v_rows app_notification[];
+    v_created INTEGER := 0;
+BEGIN
+    WHILE v_month <= p_to LOOP
+        v_name := 'app_notification_' || to_char(v_month, 'YYYY_MM');
+        IF to_regclass(v_name) IS NULL THEN
+            WITH moved AS (
+                DELETE FROM app_notification_default
+                WHERE sent_datetime >= v_month AND sent_datetime < v_month + INTERVAL '1 month'
+                RETURNING *
+            )
+            SELECT array_agg(moved) INTO v_rows FROM moved;
+
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF app_notification FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_month, v_month + INTERVAL '1 month'
+            );
+            IF v_rows IS NOT NULL THEN
+                EXECUTE format('INSERT INTO %I OVERRIDING SYSTEM VALUE SELECT * FROM unnest($1)', v_name)
+                USING v_rows;
+            END IF;
+            v_created := v_created + 1;
+        END IF;
+        v_month := v_month + INTERVAL '1 month';
+    END LOOP;
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_notification_partitions(LOCALTIMESTAMP, LOCALTIMESTAMP + INTERVAL '3 months');
+
+-- Reminders already generated, one row per (kind, issue/reservation, period), so reminder runs are idempotent
+CREATE TABLE IF NOT EXISTS notification_reminder (
+    kind TEXT NOT NULL,
+    ref_id BIGINT NOT NULL,
+    period_start DATE NOT NULL,
+    sent_datetime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (kind, ref_id, period_start)
 );
 
 CREATE TABLE IF NOT EXISTS app_role (
@@ -155,3 +223,104 @@ CREATE TABLE IF NOT EXISTS app_role_entity_permission (
     FOREIGN KEY (role_id) REFERENCES app_role(id) ON DELETE CASCADE,
     FOREIGN KEY (permission_id) REFERENCES entity_permission(id) ON DELETE CASCADE
 );
+
+CREATE TABLE IF NOT EXISTS cache_version (
+    name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS reader_notification_counter (
+    reader_id BIGINT PRIMARY KEY,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT non_negative_unread_count CHECK (unread_count >= 0),
+    FOREIGN KEY (reader_id) REFERENCES reader(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS book_availability (
+    book_id BIGINT PRIMARY KEY,
+    title TEXT NOT NULL,
+    authors TEXT NOT NULL DEFAULT '',
+    categories TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    total_copies INTEGER NOT NULL DEFAULT 0,
+    currently_issued_copies INTEGER NOT NULL DEFAULT 0,
+    currently_reserved_copies INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    avg_rating INTEGER GENERATED ALWAYS AS (
+        CASE WHEN rating_count > 0 THEN FLOOR(rating_sum::NUMERIC / rating_count)::INTEGER END
+    ) STORED,
+    expires_at TIMESTAMP,
+    refreshed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- Weighted full-text document, kept current by the triggers refreshing this table
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', title), 'A')
+        || setweight(to_tsvector('english', authors), 'B')
+        || setweight(to_tsvector('english', categories), 'C')
+        || setweight(to_tsvector('english', description), 'D')
+    ) STORED,
+    FOREIGN KEY (book_id) REFERENCES book(id) ON DELETE CASCADE
+);
+
+-- Daily aggregates built by `flask build-rollups`, one row per day (and category / publisher)
+CREATE TABLE IF NOT EXISTS rollup_circulation_daily (
+    day DATE PRIMARY KEY,
+    issues INTEGER NOT NULL DEFAULT 0,
+    returns INTEGER NOT NULL DEFAULT 0,
+    late_returns INTEGER NOT NULL DEFAULT 0,
+    reservations INTEGER NOT NULL DEFAULT 0,
+    copies INTEGER NOT NULL DEFAULT 0,
+    copies_on_loan INTEGER NOT NULL DEFAULT 0,
+    copies_reserved INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS rollup_category_daily (
+    day DATE NOT NULL,
+    category_id BIGINT NOT NULL,
+    issues INTEGER NOT NULL DEFAULT 0,
+    returns INTEGER NOT NULL DEFAULT 0,
+    late_returns INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, category_id)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_purchase_daily (
+    day DATE NOT NULL,
+    publisher_id BIGINT NOT NULL,
+    copies INTEGER NOT NULL DEFAULT 0,
+    spend NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, publisher_id)
+);
+
+-- First day not yet rolled up, per rollup
+CREATE TABLE IF NOT EXISTS rollup_watermark (
+    name TEXT PRIMARY KEY,
+    built_until DATE NOT NULL,
+    built_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Top-K "readers who liked this also liked" books per book, built offline by `flask build-recommendations`
+CREATE TABLE IF NOT EXISTS book_similarity (
+    book_id BIGINT NOT NULL,
+    rank SMALLINT NOT NULL,
+    similar_book_id BIGINT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (book_id, rank),
+    FOREIGN KEY (book_id) REFERENCES book(id) ON DELETE CASCADE,
+    FOREIGN KEY (similar_book_id) REFERENCES book(id) ON DELETE CASCADE
+);
+
+-- Newest rating covered by book_similarity, per similarity table
+CREATE TABLE IF NOT EXISTS similarity_watermark (
+    name TEXT PRIMARY KEY,
+    last_rating_id BIGINT NOT NULL,
+    built_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Failed login counters per username / username and client IP / client IP (ephemeral, so not WAL-logged)
+CREATE UNLOGGED TABLE IF NOT EXISTS login_throttle (
+    key TEXT PRIMARY KEY,
+    failures INTEGER NOT NULL DEFAULT 0,
+    window_start TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_failure TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -3,17 +3,24 @@
 -- +=================================+
 -- | NO OVERLAP RESERVATIONS TRIGGER |
 -- +=================================+
+-- Overlaps are tested with && on the tsrange period columns, served by the GiST indexes
+-- behind the reservation_no_overlap / issue_no_overlap exclusion constraints.
+-- The per-copy advisory lock serializes concurrent writers, which the exclusion
+-- constraints can't do across the reservation and issue tables.
 CREATE OR REPLACE FUNCTION check_reservation_conflicts()
 RETURNS trigger AS $$
+DECLARE
+    v_period TSRANGE := tsrange(NEW.from_datetime, NEW.to_datetime, '[)');
 BEGIN
+    PERFORM pg_advisory_xact_lock(hashtextextended('book_copy:' || NEW.book_copy_id, 0));
+
     -- Overlapping reservation:
     IF EXISTS (
         SELECT 1
         FROM reservation r
         WHERE r.book_copy_id = NEW.book_copy_id
           AND r.id <> NEW.id
-          AND ((r.from_datetime, r.to_datetime) 
-                OVERLAPS (NEW.from_datetime, NEW.to_datetime))
+          AND r.period && v_period
     ) THEN
         RAISE EXCEPTION 'Current reservation period overlaps with an existing reservation for this book copy.';
     END IF;
@@ -23,8 +30,7 @@ BEGIN
         SELECT 1
         FROM issue i
         WHERE i.book_copy_id = NEW.book_copy_id
-          AND ((i.issue_datetime, COALESCE(i.return_datetime, 'infinity'::timestamp)) 
-                OVERLAPS (NEW.from_datetime, NEW.to_datetime))
+          AND i.period && v_period
     ) THEN
         RAISE EXCEPTION 'Current reservation period overlaps with an existing issue for this book copy.';
     END IF;  
@@ -42,14 +48,17 @@ FOR EACH ROW EXECUTE FUNCTION check_reservation_conflicts();
 -- +===========================+
 CREATE OR REPLACE FUNCTION check_issue_conflicts()
 RETURNS trigger AS $$
+DECLARE
+    v_period TSRANGE := tsrange(NEW.issue_datetime, NEW.return_datetime, '[)');
 BEGIN
+    PERFORM pg_advisory_xact_lock(hashtextextended('book_copy:' || NEW.book_copy_id, 0));
+
     -- Overlapping reservation:
     IF EXISTS (
         SELECT 1
         FROM reservation r
         WHERE r.book_copy_id = NEW.book_copy_id
-          AND ((r.from_datetime, r.to_datetime) 
-                OVERLAPS (NEW.issue_datetime, COALESCE(NEW.return_datetime, 'infinity'::timestamp)))
+          AND r.period && v_period
     ) THEN
         RAISE EXCEPTION 'Current issue period overlaps with an existing reservation for this book copy.';
     END IF;
@@ -60,8 +69,7 @@ BEGIN
         FROM issue i
         WHERE i.book_copy_id = NEW.book_copy_id
           AND i.id <> NEW.id
-          AND ((i.issue_datetime, COALESCE(i.return_datetime, 'infinity'::timestamp)) 
-                OVERLAPS (NEW.issue_datetime, COALESCE(NEW.return_datetime, 'infinity'::timestamp)))
+          AND i.period && v_period
     ) THEN
         RAISE EXCEPTION 'Current issue period overlaps with an existing issue for this book copy.';
     END IF;  
@@ -73,3 +81,339 @@ $$ LANGUAGE plpgsql;
 CREATE TRIGGER trg_issue_conflicts
 BEFORE INSERT OR UPDATE ON issue
 FOR EACH ROW EXECUTE FUNCTION check_issue_conflicts();
+
+-- +======================+
+-- | CACHE VERSION BUMPER |
+-- +======================+
+CREATE OR REPLACE FUNCTION bump_cache_version(p_name TEXT)
+RETURNS BIGINT AS $$
+    INSERT INTO cache_version (name, version, changed_at)
+    VALUES (p_name, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (name) DO UPDATE
+        SET version = cache_version.version + 1,
+            changed_at = EXCLUDED.changed_at
+    RETURNING version;
+$$ LANGUAGE sql;
+
+-- +=============================+
+-- | SCHEMA CHANGE EVENT TRIGGER |
+-- +=============================+
+-- Any DDL (except on temporary objects) invalidates the per-process schema catalog cache
+CREATE OR REPLACE FUNCTION bump_schema_version()
+RETURNS event_trigger AS $$
+BEGIN
+    IF EXISTS (
+        SELECT 1
+        FROM pg_event_trigger_ddl_commands()
+        WHERE schema_name IS DISTINCT FROM 'pg_temp'
+    ) THEN
+        PERFORM bump_cache_version('schema');
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE EVENT TRIGGER trg_schema_version
+ON ddl_command_end
+EXECUTE FUNCTION bump_schema_version();
+
+-- +===================================+
+-- | PERMISSION MATRIX VERSION TRIGGER |
+-- +===================================+
+-- Any change to roles or permissions invalidates the cached permission matrix
+CREATE OR REPLACE FUNCTION bump_permissions_version()
+RETURNS trigger AS $$
+BEGIN
+    PERFORM bump_cache_version('permissions');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_app_role_permissions_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON app_role
+FOR EACH STATEMENT EXECUTE FUNCTION bump_permissions_version();
+
+CREATE TRIGGER trg_entity_permission_permissions_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON entity_permission
+FOR EACH STATEMENT EXECUTE FUNCTION bump_permissions_version();
+
+CREATE TRIGGER trg_app_role_entity_permission_permissions_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON app_role_entity_permission
+FOR EACH STATEMENT EXECUTE FUNCTION bump_permissions_version();
+
+-- +=====================================+
+-- | UNREAD NOTIFICATION COUNTER TRIGGER |
+-- +=====================================+
+CREATE OR REPLACE FUNCTION adjust_unread_notification_counter(p_reader_id BIGINT, p_delta INTEGER)
+RETURNS void AS $$
+    INSERT INTO reader_notification_counter (reader_id, unread_count)
+    VALUES (p_reader_id, GREATEST(p_delta, 0))
+    ON CONFLICT (reader_id) DO UPDATE
+        SET unread_count = GREATEST(reader_notification_counter.unread_count + p_delta, 0);
+$$ LANGUAGE sql;
+
+-- Statement-level: sums the unread notifications added and removed per reader from the transition
+-- tables, so marking many notifications read costs one counter update per reader, not one per row.
+-- Readers are updated in id order, so concurrent statements lock their counters in the same order.
+CREATE OR REPLACE FUNCTION maintain_unread_notification_counter()
+RETURNS trigger AS $$
+DECLARE
+    v_rows TEXT;
+BEGIN
+    v_rows := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT reader_id, 1 AS delta FROM new_rows WHERE NOT read'
+        WHEN 'DELETE' THEN 'SELECT reader_id, -1 AS delta FROM old_rows WHERE NOT read'
+        ELSE 'SELECT reader_id, 1 AS delta FROM new_rows WHERE NOT read
+              UNION ALL
+              SELECT reader_id, -1 AS delta FROM old_rows WHERE NOT read'
+    END;
+
+    EXECUTE format(
+        'SELECT adjust_unread_notification_counter(reader_id, CAST(SUM(delta) AS INTEGER))
+         FROM (%s) t
+         GROUP BY reader_id
+         HAVING SUM(delta) <> 0
+         ORDER BY reader_id',
+        v_rows
+    );
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_app_notification_unread_counter_insert
+AFTER INSERT ON app_notification
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_unread_notification_counter();
+
+CREATE TRIGGER trg_app_notification_unread_counter_update
+AFTER UPDATE ON app_notification
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_unread_notification_counter();
+
+CREATE TRIGGER trg_app_notification_unread_counter_delete
+AFTER DELETE ON app_notification
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_unread_notification_counter();
+
+-- Backfill counters for notifications that existed before the trigger
+INSERT INTO reader_notification_counter (reader_id, unread_count)
+SELECT reader_id, COUNT(*)
+FROM app_notification
+WHERE read = FALSE
+GROUP BY reader_id
+ON CONFLICT (reader_id) DO UPDATE
+    SET unread_count = EXCLUDED.unread_count;
+
+-- +========================================+
+-- | BOOK AVAILABILITY MAINTENANCE TRIGGERS |
+-- +========================================+
+-- Statement-level: collects the affected book ids from the transition tables and refreshes
+-- their book_availability rows once per statement. TG_ARGV[0] says how rows map to books:
+--   book_id      - the row has a book_id column
+--   book_copy_id - the row references a book copy
+--   id           - the row is a book
+--   author_id    - the row is an author (renames change the cached author strings)
+--   category_id  - the row is a category (renames change the cached category strings)
+CREATE OR REPLACE FUNCTION maintain_book_availability()
+RETURNS trigger AS $$
+DECLARE
+    v_rows TEXT;
+    v_book_ids BIGINT[];
+BEGIN
+    v_rows := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT * FROM new_rows'
+        WHEN 'DELETE' THEN 'SELECT * FROM old_rows'
+        ELSE 'SELECT * FROM new_rows UNION ALL SELECT * FROM old_rows'
+    END;
+
+    EXECUTE format(
+        CASE TG_ARGV[0]
+            WHEN 'book_id' THEN 'SELECT array_agg(DISTINCT t.book_id) FROM (%s) t'
+            WHEN 'id' THEN 'SELECT array_agg(DISTINCT t.id) FROM (%s) t'
+            WHEN 'book_copy_id' THEN
+                'SELECT array_agg(DISTINCT bc.book_id) FROM (%s) t JOIN book_copy bc ON bc.id = t.book_copy_id'
+            WHEN 'author_id' THEN
+                'SELECT array_agg(DISTINCT ba.book_id) FROM (%s) t JOIN book_author ba ON ba.author_id = t.id'
+            WHEN 'category_id' THEN
+                'SELECT array_agg(DISTINCT bc.book_id) FROM (%s) t JOIN book_category bc ON bc.category_id = t.id'
+        END,
+        v_rows
+    ) INTO v_book_ids;
+
+    IF v_book_ids IS NOT NULL THEN
+        PERFORM refresh_book_availability(v_book_ids);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_issue_availability_insert
+AFTER INSERT ON issue
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_copy_id');
+
+CREATE TRIGGER trg_issue_availability_update
+AFTER UPDATE ON issue
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_copy_id');
+
+CREATE TRIGGER trg_issue_availability_delete
+AFTER DELETE ON issue
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_copy_id');
+
+CREATE TRIGGER trg_reservation_availability_insert
+AFTER INSERT ON reservation
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_copy_id');
+
+CREATE TRIGGER trg_reservation_availability_update
+AFTER UPDATE ON reservation
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_copy_id');
+
+CREATE TRIGGER trg_reservation_availability_delete
+AFTER DELETE ON reservation
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_copy_id');
+
+CREATE TRIGGER trg_book_copy_availability_insert
+AFTER INSERT ON book_copy
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+CREATE TRIGGER trg_book_copy_availability_update
+AFTER UPDATE ON book_copy
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+CREATE TRIGGER trg_book_copy_availability_delete
+AFTER DELETE ON book_copy
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+CREATE TRIGGER trg_book_author_availability_insert
+AFTER INSERT ON book_author
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+CREATE TRIGGER trg_book_author_availability_update
+AFTER UPDATE ON book_author
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+CREATE TRIGGER trg_book_author_availability_delete
+AFTER DELETE ON book_author
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+CREATE TRIGGER trg_book_category_availability_insert
+AFTER INSERT ON book_category
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+CREATE TRIGGER trg_book_category_availability_update
+AFTER UPDATE ON book_category
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+CREATE TRIGGER trg_book_category_availability_delete
+AFTER DELETE ON book_category
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+CREATE TRIGGER trg_rating_availability_insert
+AFTER INSERT ON rating
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+CREATE TRIGGER trg_rating_availability_update
+AFTER UPDATE ON rating
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+CREATE TRIGGER trg_rating_availability_delete
+AFTER DELETE ON rating
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+CREATE TRIGGER trg_book_availability_insert
+AFTER INSERT ON book
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('id');
+
+CREATE TRIGGER trg_book_availability_update
+AFTER UPDATE ON book
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('id');
+
+CREATE TRIGGER trg_author_availability_update
+AFTER UPDATE ON author
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('author_id');
+
+CREATE TRIGGER trg_category_availability_update
+AFTER UPDATE ON category
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('category_id');
+
+-- +=========================+
+-- | CATALOG VERSION TRIGGER |
+-- +=========================+
+-- Every catalog change (books, copies, authors, categories, ratings, issues, reservations) is
+-- funneled into book_availability by the triggers above, so a change there invalidates the
+-- cached catalog pages. Statements that touched no rows, or only rewrote the same catalog values
+-- (e.g. a refresh that merely moved expires_at), leave the version alone: every bump locks the
+-- shared cache_version row until commit.
+CREATE OR REPLACE FUNCTION bump_catalog_version()
+RETURNS trigger AS $$
+DECLARE
+    v_changed BOOLEAN;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        v_changed := TRUE;
+    ELSE
+        EXECUTE CASE TG_OP
+            WHEN 'INSERT' THEN 'SELECT EXISTS (SELECT 1 FROM new_rows)'
+            WHEN 'DELETE' THEN 'SELECT EXISTS (SELECT 1 FROM old_rows)'
+            ELSE
+                'SELECT EXISTS (
+                    SELECT 1
+                    FROM new_rows n
+                    JOIN old_rows o ON o.book_id = n.book_id
+                    WHERE (n.title, n.authors, n.categories, n.description, n.total_copies,
+                           n.currently_issued_copies, n.currently_reserved_copies, n.rating_count, n.rating_sum)
+                        IS DISTINCT FROM
+                          (o.title, o.authors, o.categories, o.description, o.total_copies,
+                           o.currently_issued_copies, o.currently_reserved_copies, o.rating_count, o.rating_sum)
+                )'
+        END INTO v_changed;
+    END IF;
+
+    IF v_changed THEN
+        PERFORM bump_cache_version('catalog');
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_book_availability_catalog_version_insert
+AFTER INSERT ON book_availability
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+CREATE TRIGGER trg_book_availability_catalog_version_update
+AFTER UPDATE ON book_availability
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+CREATE TRIGGER trg_book_availability_catalog_version_delete
+AFTER DELETE ON book_availability
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+CREATE TRIGGER trg_book_availability_catalog_version_truncate
+AFTER TRUNCATE ON book_availability
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
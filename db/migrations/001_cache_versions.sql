@@ -0,0 +1,66 @@
+-- 001_cache_versions.sql
+-- Adds the cache_version table with its bump function, the DDL event trigger invalidating the
+-- schema catalog cache and the triggers invalidating the permission matrix.
+-- Event triggers can only be created by a superuser.
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/001_cache_versions.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS cache_version (
+    name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION bump_cache_version(p_name TEXT)
+RETURNS BIGINT AS $$
+    INSERT INTO cache_version (name, version, changed_at)
+    VALUES (p_name, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (name) DO UPDATE
+        SET version = cache_version.version + 1,
+            changed_at = EXCLUDED.changed_at
+    RETURNING version;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION bump_schema_version()
+RETURNS event_trigger AS $$
+BEGIN
+    IF EXISTS (
+        SELECT 1
+        FROM pg_event_trigger_ddl_commands()
+        WHERE schema_name IS DISTINCT FROM 'pg_temp'
+    ) THEN
+        PERFORM bump_cache_version('schema');
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP EVENT TRIGGER IF EXISTS trg_schema_version;
+CREATE EVENT TRIGGER trg_schema_version
+ON ddl_command_end
+EXECUTE FUNCTION bump_schema_version();
+
+CREATE OR REPLACE FUNCTION bump_permissions_version()
+RETURNS trigger AS $$
+BEGIN
+    PERFORM bump_cache_version('permissions');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_app_role_permissions_version ON app_role;
+CREATE TRIGGER trg_app_role_permissions_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON app_role
+FOR EACH STATEMENT EXECUTE FUNCTION bump_permissions_version();
+
+DROP TRIGGER IF EXISTS trg_entity_permission_permissions_version ON entity_permission;
+CREATE TRIGGER trg_entity_permission_permissions_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON entity_permission
+FOR EACH STATEMENT EXECUTE FUNCTION bump_permissions_version();
+
+DROP TRIGGER IF EXISTS trg_app_role_entity_permission_permissions_version ON app_role_entity_permission;
+CREATE TRIGGER trg_app_role_entity_permission_permissions_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON app_role_entity_permission
+FOR EACH STATEMENT EXECUTE FUNCTION bump_permissions_version();
+
+COMMIT;
@@ -0,0 +1,78 @@
+-- 002_notification_counter.sql
+-- Adds the per-reader unread notification counter, its triggers and fills it from the existing notifications.
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/002_notification_counter.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS reader_notification_counter (
+    reader_id BIGINT PRIMARY KEY,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT non_negative_unread_count CHECK (unread_count >= 0),
+    FOREIGN KEY (reader_id) REFERENCES reader(id) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE FUNCTION adjust_unread_notification_counter(p_reader_id BIGINT, p_delta INTEGER)
+RETURNS void AS $$
+    INSERT INTO reader_notification_counter (reader_id, unread_count)
+    VALUES (p_reader_id, GREATEST(p_delta, 0))
+    ON CONFLICT (reader_id) DO UPDATE
+        SET unread_count = GREATEST(reader_notification_counter.unread_count + p_delta, 0);
+$$ LANGUAGE sql;
+
+-- Statement-level: sums the unread notifications added and removed per reader from the transition
+-- tables, so marking many notifications read costs one counter update per reader, not one per row.
+-- Readers are updated in id order, so concurrent statements lock their counters in the same order.
+CREATE OR REPLACE FUNCTION maintain_unread_notification_counter()
+RETURNS trigger AS $$
+DECLARE
+    v_rows TEXT;
+BEGIN
+    v_rows := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT reader_id, 1 AS delta FROM new_rows WHERE NOT read'
+        WHEN 'DELETE' THEN 'SELECT reader_id, -1 AS delta FROM old_rows WHERE NOT read'
+        ELSE 'SELECT reader_id, 1 AS delta FROM new_rows WHERE NOT read
+              UNION ALL
+              SELECT reader_id, -1 AS delta FROM old_rows WHERE NOT read'
+    END;
+
+    EXECUTE format(
+        'SELECT adjust_unread_notification_counter(reader_id, CAST(SUM(delta) AS INTEGER))
+         FROM (%s) t
+         GROUP BY reader_id
+         HAVING SUM(delta) <> 0
+         ORDER BY reader_id',
+        v_rows
+    );
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_app_notification_unread_counter_insert ON app_notification;
+CREATE TRIGGER trg_app_notification_unread_counter_insert
+AFTER INSERT ON app_notification
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_unread_notification_counter();
+
+DROP TRIGGER IF EXISTS trg_app_notification_unread_counter_update ON app_notification;
+CREATE TRIGGER trg_app_notification_unread_counter_update
+AFTER UPDATE ON app_notification
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_unread_notification_counter();
+
+DROP TRIGGER IF EXISTS trg_app_notification_unread_counter_delete ON app_notification;
+CREATE TRIGGER trg_app_notification_unread_counter_delete
+AFTER DELETE ON app_notification
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_unread_notification_counter();
+
+-- Backfill counters for notifications that existed before the trigger
+INSERT INTO reader_notification_counter (reader_id, unread_count)
+SELECT reader_id, COUNT(*)
+FROM app_notification
+WHERE read = FALSE
+GROUP BY reader_id
+ON CONFLICT (reader_id) DO UPDATE
+    SET unread_count = EXCLUDED.unread_count;
+
+COMMIT;
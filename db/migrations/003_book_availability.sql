@@ -0,0 +1,340 @@
+-- 003_book_availability.sql
+-- Adds the per-book availability summary read by the catalog, the functions refreshing it and the
+-- triggers keeping it current, then fills it for every existing book (runs one large statement).
+-- Schedule `flask sweep-book-availability` afterwards (see README).
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/003_book_availability.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS book_availability (
+    book_id BIGINT PRIMARY KEY,
+    title TEXT NOT NULL,
+    authors TEXT NOT NULL DEFAULT '',
+    categories TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    total_copies INTEGER NOT NULL DEFAULT 0,
+    currently_issued_copies INTEGER NOT NULL DEFAULT 0,
+    currently_reserved_copies INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    avg_rating INTEGER GENERATED ALWAYS AS (
+        CASE WHEN rating_count > 0 THEN FLOOR(rating_sum::NUMERIC / rating_count)::INTEGER END
+    ) STORED,
+    expires_at TIMESTAMP,
+    refreshed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (book_id) REFERENCES book(id) ON DELETE CASCADE
+);
+
+-- book_availability.title (catalog ordering)
+CREATE INDEX IF NOT EXISTS idx_book_availability_title ON book_availability(title);
+
+-- book_availability.expires_at (time-based sweep)
+CREATE INDEX IF NOT EXISTS idx_book_availability_expires_at ON book_availability(expires_at) WHERE expires_at IS NOT NULL;
+
+-- Recomputes the summary rows of the given books from their copies, issues, reservations,
+-- authors, categories and ratings. expires_at is the earliest moment at which an active
+-- issue or reservation of the book stops being active without any write.
+CREATE OR REPLACE FUNCTION refresh_book_availability(p_book_ids BIGINT[])
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_refreshed INTEGER;
+BEGIN
+    -- Serialize concurrent refreshes of the same books; the next statement then sees their commits
+    PERFORM 1
+    FROM book_availability
+    WHERE book_id = ANY(p_book_ids)
+    ORDER BY book_id
+    FOR UPDATE;
+
+    INSERT INTO book_availability (
+        book_id, title, authors, categories, description,
+        total_copies, currently_issued_copies, currently_reserved_copies,
+        rating_count, rating_sum, expires_at, refreshed_at
+    )
+    SELECT
+        b.id,
+        b.title,
+        COALESCE(a.authors, ''),
+        COALESCE(c.categories, ''),
+        COALESCE(b.description, ''),
+        cp.total_copies,
+        cp.issued_copies,
+        cp.reserved_copies,
+        rt.rating_count,
+        rt.rating_sum,
+        ex.expires_at,
+        CURRENT_TIMESTAMP
+    FROM book b
+    LEFT JOIN LATERAL (
+        SELECT STRING_AGG(a.unique_name, ', ' ORDER BY a.unique_name) AS authors
+        FROM book_author ba
+        JOIN author a ON a.id = ba.author_id
+        WHERE ba.book_id = b.id
+    ) a ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT STRING_AGG(c.name, ', ' ORDER BY c.name) AS categories
+        FROM book_category bc
+        JOIN category c ON c.id = bc.category_id
+        WHERE bc.book_id = b.id
+    ) c ON TRUE
+    CROSS JOIN LATERAL (
+        SELECT
+            COUNT(*) AS total_copies,
+            COUNT(*) FILTER (WHERE EXISTS (
+                SELECT 1
+                FROM issue i
+                WHERE i.book_copy_id = bc.id
+                  AND COALESCE(i.return_datetime, 'infinity'::timestamp) > CURRENT_TIMESTAMP
+            )) AS issued_copies,
+            COUNT(*) FILTER (WHERE EXISTS (
+                SELECT 1
+                FROM reservation r
+                WHERE r.book_copy_id = bc.id
+                  AND r.to_datetime > CURRENT_TIMESTAMP
+            )) AS reserved_copies
+        FROM book_copy bc
+        WHERE bc.book_id = b.id
+    ) cp
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS rating_count, COALESCE(SUM(r.rating), 0) AS rating_sum
+        FROM rating r
+        WHERE r.book_id = b.id
+    ) rt
+    CROSS JOIN LATERAL (
+        SELECT MIN(t.changes_at) AS expires_at
+        FROM (
+            SELECT i.return_datetime AS changes_at
+            FROM book_copy bc
+            JOIN issue i ON i.book_copy_id = bc.id
+            WHERE bc.book_id = b.id
+              AND i.return_datetime > CURRENT_TIMESTAMP
+            UNION ALL
+            SELECT r.to_datetime
+            FROM book_copy bc
+            JOIN reservation r ON r.book_copy_id = bc.id
+            WHERE bc.book_id = b.id
+              AND r.to_datetime > CURRENT_TIMESTAMP
+        ) t
+    ) ex
+    WHERE b.id = ANY(p_book_ids)
+    ON CONFLICT (book_id) DO UPDATE
+        SET title = EXCLUDED.title,
+            authors = EXCLUDED.authors,
+            categories = EXCLUDED.categories,
+            description = EXCLUDED.description,
+            total_copies = EXCLUDED.total_copies,
+            currently_issued_copies = EXCLUDED.currently_issued_copies,
+            currently_reserved_copies = EXCLUDED.currently_reserved_copies,
+            rating_count = EXCLUDED.rating_count,
+            rating_sum = EXCLUDED.rating_sum,
+            expires_at = EXCLUDED.expires_at,
+            refreshed_at = EXCLUDED.refreshed_at;
+
+    GET DIAGNOSTICS v_refreshed = ROW_COUNT;
+    RETURN v_refreshed;
+END;
+$$;
+
+-- Refreshes books whose issues or reservations changed state by the passage of time
+CREATE OR REPLACE FUNCTION sweep_book_availability()
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_book_ids BIGINT[];
+BEGIN
+    SELECT array_agg(book_id)
+    INTO v_book_ids
+    FROM book_availability
+    WHERE expires_at <= CURRENT_TIMESTAMP;
+
+    -- Most runs find nothing expired; skip the refresh (and its triggers) entirely
+    IF v_book_ids IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    RETURN refresh_book_availability(v_book_ids);
+END;
+$$;
+
+-- Statement-level: collects the affected book ids from the transition tables and refreshes
+-- their book_availability rows once per statement. TG_ARGV[0] says how rows map to books:
+--   book_id      - the row has a book_id column
+--   book_copy_id - the row references a book copy
+--   id           - the row is a book
+--   author_id    - the row is an author (renames change the cached author strings)
+--   category_id  - the row is a category (renames change the cached category strings)
+CREATE OR REPLACE FUNCTION maintain_book_availability()
+RETURNS trigger AS $$
+DECLARE
+    v_rows TEXT;
+    v_book_ids BIGINT[];
+BEGIN
+    v_rows := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT * FROM new_rows'
+        WHEN 'DELETE' THEN 'SELECT * FROM old_rows'
+        ELSE 'SELECT * FROM new_rows UNION ALL SELECT * FROM old_rows'
+    END;
+
+    EXECUTE format(
+        CASE TG_ARGV[0]
+            WHEN 'book_id' THEN 'SELECT array_agg(DISTINCT t.book_id) FROM (%s) t'
+            WHEN 'id' THEN 'SELECT array_agg(DISTINCT t.id) FROM (%s) t'
+            WHEN 'book_copy_id' THEN
+                'SELECT array_agg(DISTINCT bc.book_id) FROM (%s) t JOIN book_copy bc ON bc.id = t.book_copy_id'
+            WHEN 'author_id' THEN
+                'SELECT array_agg(DISTINCT ba.book_id) FROM (%s) t JOIN book_author ba ON ba.author_id = t.id'
+            WHEN 'category_id' THEN
+                'SELECT array_agg(DISTINCT bc.book_id) FROM (%s) t JOIN book_category bc ON bc.category_id = t.id'
+        END,
+        v_rows
+    ) INTO v_book_ids;
+
+    IF v_book_ids IS NOT NULL THEN
+        PERFORM refresh_book_availability(v_book_ids);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_issue_availability_insert ON issue;
+CREATE TRIGGER trg_issue_availability_insert
+AFTER INSERT ON issue
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_copy_id');
+
+DROP TRIGGER IF EXISTS trg_issue_availability_update ON issue;
+CREATE TRIGGER trg_issue_availability_update
+AFTER UPDATE ON issue
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_copy_id');
+
+DROP TRIGGER IF EXISTS trg_issue_availability_delete ON issue;
+CREATE TRIGGER trg_issue_availability_delete
+AFTER DELETE ON issue
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_copy_id');
+
+DROP TRIGGER IF EXISTS trg_reservation_availability_insert ON reservation;
+CREATE TRIGGER trg_reservation_availability_insert
+AFTER INSERT ON reservation
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_copy_id');
+
+DROP TRIGGER IF EXISTS trg_reservation_availability_update ON reservation;
+CREATE TRIGGER trg_reservation_availability_update
+AFTER UPDATE ON reservation
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_copy_id');
+
+DROP TRIGGER IF EXISTS trg_reservation_availability_delete ON reservation;
+CREATE TRIGGER trg_reservation_availability_delete
+AFTER DELETE ON reservation
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_copy_id');
+
+DROP TRIGGER IF EXISTS trg_book_copy_availability_insert ON book_copy;
+CREATE TRIGGER trg_book_copy_availability_insert
+AFTER INSERT ON book_copy
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+DROP TRIGGER IF EXISTS trg_book_copy_availability_update ON book_copy;
+CREATE TRIGGER trg_book_copy_availability_update
+AFTER UPDATE ON book_copy
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+DROP TRIGGER IF EXISTS trg_book_copy_availability_delete ON book_copy;
+CREATE TRIGGER trg_book_copy_availability_delete
+AFTER DELETE ON book_copy
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+DROP TRIGGER IF EXISTS trg_book_author_availability_insert ON book_author;
+CREATE TRIGGER trg_book_author_availability_insert
+AFTER INSERT ON book_author
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+DROP TRIGGER IF EXISTS trg_book_author_availability_update ON book_author;
+CREATE TRIGGER trg_book_author_availability_update
+AFTER UPDATE ON book_author
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+DROP TRIGGER IF EXISTS trg_book_author_availability_delete ON book_author;
+CREATE TRIGGER trg_book_author_availability_delete
+AFTER DELETE ON book_author
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+DROP TRIGGER IF EXISTS trg_book_category_availability_insert ON book_category;
+CREATE TRIGGER trg_book_category_availability_insert
+AFTER INSERT ON book_category
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+DROP TRIGGER IF EXISTS trg_book_category_availability_update ON book_category;
+CREATE TRIGGER trg_book_category_availability_update
+AFTER UPDATE ON book_category
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+DROP TRIGGER IF EXISTS trg_book_category_availability_delete ON book_category;
+CREATE TRIGGER trg_book_category_availability_delete
+AFTER DELETE ON book_category
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+DROP TRIGGER IF EXISTS trg_rating_availability_insert ON rating;
+CREATE TRIGGER trg_rating_availability_insert
+AFTER INSERT ON rating
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+DROP TRIGGER IF EXISTS trg_rating_availability_update ON rating;
+CREATE TRIGGER trg_rating_availability_update
+AFTER UPDATE ON rating
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+DROP TRIGGER IF EXISTS trg_rating_availability_delete ON rating;
+CREATE TRIGGER trg_rating_availability_delete
+AFTER DELETE ON rating
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('book_id');
+
+DROP TRIGGER IF EXISTS trg_book_availability_insert ON book;
+CREATE TRIGGER trg_book_availability_insert
+AFTER INSERT ON book
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('id');
+
+DROP TRIGGER IF EXISTS trg_book_availability_update ON book;
+CREATE TRIGGER trg_book_availability_update
+AFTER UPDATE ON book
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('id');
+
+DROP TRIGGER IF EXISTS trg_author_availability_update ON author;
+CREATE TRIGGER trg_author_availability_update
+AFTER UPDATE ON author
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('author_id');
+
+DROP TRIGGER IF EXISTS trg_category_availability_update ON category;
+CREATE TRIGGER trg_category_availability_update
+AFTER UPDATE ON category
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_book_availability('category_id');
+
+-- Initial fill; the triggers above keep the rows current from here on
+SELECT refresh_book_availability(ARRAY(SELECT id FROM book));
+
+COMMIT;
+
+ANALYZE book_availability;
@@ -0,0 +1,14 @@
+-- 004_lookup_indexes.sql
+-- Adds the trigram indexes serving the superadmin FK typeahead lookups.
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/004_lookup_indexes.sql
+
+BEGIN;
+
+-- FK typeahead lookups (GIN trigram indexes)
+CREATE INDEX IF NOT EXISTS idx_category_name_trgm ON category USING gin(name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_reader_card_no_trgm ON reader USING gin(card_no gin_trgm_ops);
+-- isbn is CHAR(13), which gin_trgm_ops doesn't accept: index the text value the lookup searches
+CREATE INDEX IF NOT EXISTS idx_book_copy_isbn_trgm ON book_copy USING gin((CAST(isbn AS TEXT)) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_app_user_username_trgm ON app_user USING gin(username gin_trgm_ops);
+
+COMMIT;
@@ -0,0 +1,135 @@
+-- 005_update_books.sql
+-- Adds the set-based update_books procedure; update_book now calls it for a single book.
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/005_update_books.sql
+
+BEGIN;
+
+-- Batch, set-based update of many books at once.
+-- p_books is a JSON array of objects: {"title": ..., "description": ..., "authors": [...], "categories": [...]}
+-- Books are matched by title; a missing or null field leaves that attribute unchanged.
+CREATE OR REPLACE PROCEDURE update_books(p_books JSONB)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_missing TEXT;
+BEGIN
+    CREATE TEMPORARY TABLE IF NOT EXISTS book_update_input (
+        book_id BIGINT,
+        title TEXT,
+        description TEXT,
+        authors TEXT[],
+        categories TEXT[]
+    ) ON COMMIT DROP;
+    TRUNCATE book_update_input;
+
+    INSERT INTO book_update_input (book_id, title, description, authors, categories)
+    SELECT b.id, x.title, x.description, x.authors, x.categories
+    FROM jsonb_to_recordset(p_books) AS x(title TEXT, description TEXT, authors TEXT[], categories TEXT[])
+    LEFT JOIN book b ON b.title = x.title;
+
+    SELECT STRING_AGG(DISTINCT COALESCE(title, '<null>'), ', ') INTO v_missing
+    FROM book_update_input
+    WHERE book_id IS NULL;
+
+    IF v_missing IS NOT NULL THEN
+        RAISE EXCEPTION 'Books with titles "%" do not exist', v_missing;
+    END IF;
+
+    SELECT STRING_AGG(title, ', ') INTO v_missing
+    FROM (
+        SELECT title
+        FROM book_update_input
+        GROUP BY title
+        HAVING COUNT(*) > 1
+    ) duplicated;
+
+    IF v_missing IS NOT NULL THEN
+        RAISE EXCEPTION 'Books "%" appear more than once in the batch', v_missing;
+    END IF;
+
+    SELECT STRING_AGG(DISTINCT n.name, ', ') INTO v_missing
+    FROM book_update_input t
+    CROSS JOIN unnest(t.authors) AS n(name)
+    LEFT JOIN author a ON a.unique_name = n.name
+    WHERE a.id IS NULL;
+
+    IF v_missing IS NOT NULL THEN
+        RAISE EXCEPTION 'Authors "%" do not exist', v_missing;
+    END IF;
+
+    SELECT STRING_AGG(DISTINCT n.name, ', ') INTO v_missing
+    FROM book_update_input t
+    CROSS JOIN unnest(t.categories) AS n(name)
+    LEFT JOIN category c ON c.name = n.name
+    WHERE c.id IS NULL;
+
+    IF v_missing IS NOT NULL THEN
+        RAISE EXCEPTION 'Categories "%" do not exist', v_missing;
+    END IF;
+
+    UPDATE book b
+    SET description = t.description
+    FROM book_update_input t
+    WHERE b.id = t.book_id
+      AND t.description IS NOT NULL
+      AND b.description IS DISTINCT FROM t.description;
+
+    -- Authors: drop links not in the new lists, add the missing ones
+    DELETE FROM book_author ba
+    USING book_update_input t
+    WHERE ba.book_id = t.book_id
+      AND t.authors IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1
+          FROM unnest(t.authors) AS n(name)
+          JOIN author a ON a.unique_name = n.name
+          WHERE a.id = ba.author_id
+      );
+
+    INSERT INTO book_author (book_id, author_id)
+    SELECT DISTINCT t.book_id, a.id
+    FROM book_update_input t
+    CROSS JOIN unnest(t.authors) AS n(name)
+    JOIN author a ON a.unique_name = n.name
+    ON CONFLICT DO NOTHING;
+
+    -- Categories: same as authors
+    DELETE FROM book_category bc
+    USING book_update_input t
+    WHERE bc.book_id = t.book_id
+      AND t.categories IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1
+          FROM unnest(t.categories) AS n(name)
+          JOIN category c ON c.name = n.name
+          WHERE c.id = bc.category_id
+      );
+
+    INSERT INTO book_category (book_id, category_id)
+    SELECT DISTINCT t.book_id, c.id
+    FROM book_update_input t
+    CROSS JOIN unnest(t.categories) AS n(name)
+    JOIN category c ON c.name = n.name
+    ON CONFLICT DO NOTHING;
+END;
+$$;
+
+CREATE OR REPLACE PROCEDURE update_book(
+    p_title TEXT,
+    p_description TEXT,
+    p_author_unique_names TEXT[],
+    p_category_names TEXT[]
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    CALL update_books(jsonb_build_array(jsonb_build_object(
+        'title', p_title,
+        'description', p_description,
+        'authors', to_jsonb(p_author_unique_names),
+        'categories', to_jsonb(p_category_names)
+    )));
+END;
+$$;
+
+COMMIT;
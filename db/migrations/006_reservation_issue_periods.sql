@@ -0,0 +1,116 @@
+-- 006_reservation_issue_periods.sql
+-- Migrates an existing database to tsrange-based conflict detection:
+-- adds the generated period columns (filled for existing rows), the GiST-backed
+-- exclusion constraints and the index-friendly conflict trigger functions.
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/006_reservation_issue_periods.sql
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE reservation
+    ADD COLUMN IF NOT EXISTS period TSRANGE GENERATED ALWAYS AS (tsrange(from_datetime, to_datetime, '[)')) STORED;
+
+ALTER TABLE issue
+    ADD COLUMN IF NOT EXISTS period TSRANGE GENERATED ALWAYS AS (tsrange(issue_datetime, return_datetime, '[)')) STORED;
+
+-- Existing overlaps would make the exclusion constraints fail; report them first
+DO $$
+DECLARE
+    v_conflicts TEXT;
+BEGIN
+    SELECT STRING_AGG(format('reservation %s/%s', a.id, b.id), ', ') INTO v_conflicts
+    FROM reservation a
+    JOIN reservation b
+        ON b.book_copy_id = a.book_copy_id
+       AND b.id > a.id
+       AND b.period && a.period;
+
+    IF v_conflicts IS NOT NULL THEN
+        RAISE EXCEPTION 'Overlapping reservations must be fixed before migrating: %', v_conflicts;
+    END IF;
+
+    SELECT STRING_AGG(format('issue %s/%s', a.id, b.id), ', ') INTO v_conflicts
+    FROM issue a
+    JOIN issue b
+        ON b.book_copy_id = a.book_copy_id
+       AND b.id > a.id
+       AND b.period && a.period;
+
+    IF v_conflicts IS NOT NULL THEN
+        RAISE EXCEPTION 'Overlapping issues must be fixed before migrating: %', v_conflicts;
+    END IF;
+END;
+$$;
+
+ALTER TABLE reservation
+    ADD CONSTRAINT reservation_no_overlap EXCLUDE USING gist (book_copy_id WITH =, period WITH &&);
+
+ALTER TABLE issue
+    ADD CONSTRAINT issue_no_overlap EXCLUDE USING gist (book_copy_id WITH =, period WITH &&);
+
+CREATE OR REPLACE FUNCTION check_reservation_conflicts()
+RETURNS trigger AS $$
+DECLARE
+    v_period TSRANGE := tsrange(NEW.from_datetime, NEW.to_datetime, '[)');
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtextextended('book_copy:' || NEW.book_copy_id, 0));
+
+    -- Overlapping reservation:
+    IF EXISTS (
+        SELECT 1
+        FROM reservation r
+        WHERE r.book_copy_id = NEW.book_copy_id
+          AND r.id <> NEW.id
+          AND r.period && v_period
+    ) THEN
+        RAISE EXCEPTION 'Current reservation period overlaps with an existing reservation for this book copy.';
+    END IF;
+
+    -- Overlapping issue:
+    IF EXISTS (
+        SELECT 1
+        FROM issue i
+        WHERE i.book_copy_id = NEW.book_copy_id
+          AND i.period && v_period
+    ) THEN
+        RAISE EXCEPTION 'Current reservation period overlaps with an existing issue for this book copy.';
+    END IF;  
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION check_issue_conflicts()
+RETURNS trigger AS $$
+DECLARE
+    v_period TSRANGE := tsrange(NEW.issue_datetime, NEW.return_datetime, '[)');
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtextextended('book_copy:' || NEW.book_copy_id, 0));
+
+    -- Overlapping reservation:
+    IF EXISTS (
+        SELECT 1
+        FROM reservation r
+        WHERE r.book_copy_id = NEW.book_copy_id
+          AND r.period && v_period
+    ) THEN
+        RAISE EXCEPTION 'Current issue period overlaps with an existing reservation for this book copy.';
+    END IF;
+
+    -- Overlapping issue:
+    IF EXISTS (
+        SELECT 1
+        FROM issue i
+        WHERE i.book_copy_id = NEW.book_copy_id
+          AND i.id <> NEW.id
+          AND i.period && v_period
+    ) THEN
+        RAISE EXCEPTION 'Current issue period overlaps with an existing issue for this book copy.';
+    END IF;  
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
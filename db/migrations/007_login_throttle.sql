@@ -0,0 +1,16 @@
+-- 007_login_throttle.sql
+-- Adds the failed login counters shared by all web workers (ephemeral, so not WAL-logged).
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/007_login_throttle.sql
+
+BEGIN;
+
+CREATE UNLOGGED TABLE IF NOT EXISTS login_throttle (
+    key TEXT PRIMARY KEY,
+    failures INTEGER NOT NULL DEFAULT 0,
+    window_start TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_failure TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_login_throttle_window_start ON login_throttle(window_start);
+
+COMMIT;
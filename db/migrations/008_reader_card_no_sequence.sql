@@ -0,0 +1,24 @@
+-- 008_reader_card_no_sequence.sql
+-- Generates library card numbers from a sequence instead of timestamp + random digits.
+-- New numbers look like 'C00000000000001' and cannot collide with the old all-digit ones.
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/008_reader_card_no_sequence.sql
+
+BEGIN;
+
+CREATE SEQUENCE IF NOT EXISTS reader_card_no_seq;
+
+CREATE OR REPLACE FUNCTION next_card_no()
+RETURNS VARCHAR(15) AS $$
+    SELECT 'C' || lpad(nextval('reader_card_no_seq')::TEXT, 14, '0');
+$$ LANGUAGE sql;
+
+-- Continue after any card numbers already issued in the new format
+SELECT setval(
+    'reader_card_no_seq',
+    COALESCE((SELECT MAX(substr(card_no, 2)::BIGINT) FROM reader WHERE card_no ~ '^C[0-9]{14}$'), 0) + 1,
+    false
+);
+
+ALTER TABLE reader ALTER COLUMN card_no SET DEFAULT next_card_no();
+
+COMMIT;
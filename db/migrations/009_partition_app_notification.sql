@@ -0,0 +1,123 @@
+-- 009_partition_app_notification.sql
+-- Converts app_notification into a table range-partitioned by month on sent_datetime,
+-- and adds the tables and indexes used by `flask send-reminders` and `flask prune-notifications`.
+-- Copies every notification, so run it during a quiet period.
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/009_partition_app_notification.sql
+
+BEGIN;
+
+LOCK TABLE app_notification IN ACCESS EXCLUSIVE MODE;
+
+-- Move the old table out of the way (names of relations must stay unique)
+ALTER TABLE app_notification RENAME TO app_notification_unpartitioned;
+ALTER INDEX app_notification_pkey RENAME TO app_notification_unpartitioned_pkey;
+ALTER SEQUENCE app_notification_id_seq RENAME TO app_notification_unpartitioned_id_seq;
+DROP TRIGGER IF EXISTS trg_app_notification_unread_counter_insert ON app_notification_unpartitioned;
+DROP TRIGGER IF EXISTS trg_app_notification_unread_counter_update ON app_notification_unpartitioned;
+DROP TRIGGER IF EXISTS trg_app_notification_unread_counter_delete ON app_notification_unpartitioned;
+DROP INDEX IF EXISTS idx_app_notification_reader_id;
+DROP INDEX IF EXISTS idx_app_notification_sent_datetime_brin;
+
+CREATE TABLE app_notification (
+    id BIGINT GENERATED ALWAYS AS IDENTITY,
+    sent_datetime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    reader_id BIGINT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    read BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (id, sent_datetime),
+    FOREIGN KEY (reader_id) REFERENCES reader(id) ON DELETE RESTRICT
+) PARTITION BY RANGE (sent_datetime);
+
+-- Catches notifications outside every monthly partition, so inserts never fail for a missing month
+CREATE TABLE IF NOT EXISTS app_notification_default PARTITION OF app_notification DEFAULT;
+
+-- Creates the missing monthly app_notification partitions covering p_from..p_to, returns how many it created.
+-- Rows of a new month already caught by the default partition are moved into it (directly, so the
+-- unread counters are untouched); a partition cannot be created while the default holds rows of its range.
+CREATE OR REPLACE FUNCTION create_notification_partitions(p_from TIMESTAMP, p_to TIMESTAMP)
+RETURNS INTEGER AS $$
+DECLARE
+    v_month TIMESTAMP := date_trunc('month', p_from);
+    v_name TEXT;
+    v_rows app_notification[];
+    v_created INTEGER := 0;
+BEGIN
+    WHILE v_month <= p_to LOOP
+        v_name := 'app_notification_' || to_char(v_month, 'YYYY_MM');
+        IF to_regclass(v_name) IS NULL THEN
+            WITH moved AS (
+                DELETE FROM app_notification_default
+                WHERE sent_datetime >= v_month AND sent_datetime < v_month + INTERVAL '1 month'
+                RETURNING *
+            )
+            SELECT array_agg(moved) INTO v_rows FROM moved;
+
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF app_notification FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_month, v_month + INTERVAL '1 month'
+            );
+            IF v_rows IS NOT NULL THEN
+                EXECUTE format('INSERT INTO %I OVERRIDING SYSTEM VALUE SELECT * FROM unnest($1)', v_name)
+                USING v_rows;
+            END IF;
+            v_created := v_created + 1;
+        END IF;
+        v_month := v_month + INTERVAL '1 month';
+    END LOOP;
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions for every month holding notifications, plus the next three
+SELECT create_notification_partitions(
+    COALESCE((SELECT MIN(sent_datetime) FROM app_notification_unpartitioned), LOCALTIMESTAMP),
+    GREATEST((SELECT MAX(sent_datetime) FROM app_notification_unpartitioned), LOCALTIMESTAMP + INTERVAL '3 months')
+);
+
+-- The unread counters already account for these rows; the counter triggers are created afterwards
+INSERT INTO app_notification (id, sent_datetime, reader_id, subject, body, read)
+OVERRIDING SYSTEM VALUE
+SELECT id, sent_datetime, reader_id, subject, body, read
+FROM app_notification_unpartitioned;
+
+SELECT setval(
+    pg_get_serial_sequence('app_notification', 'id'),
+    COALESCE((SELECT MAX(id) FROM app_notification), 0) + 1,
+    false
+);
+
+DROP TABLE app_notification_unpartitioned;
+
+CREATE INDEX IF NOT EXISTS idx_app_notification_reader_id_sent_datetime ON app_notification(reader_id, sent_datetime DESC);
+
+-- The counter triggers (see 002_notification_counter.sql) were dropped with the old table
+CREATE TRIGGER trg_app_notification_unread_counter_insert
+AFTER INSERT ON app_notification
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_unread_notification_counter();
+
+CREATE TRIGGER trg_app_notification_unread_counter_update
+AFTER UPDATE ON app_notification
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_unread_notification_counter();
+
+CREATE TRIGGER trg_app_notification_unread_counter_delete
+AFTER DELETE ON app_notification
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_unread_notification_counter();
+
+CREATE TABLE IF NOT EXISTS notification_reminder (
+    kind TEXT NOT NULL,
+    ref_id BIGINT NOT NULL,
+    period_start DATE NOT NULL,
+    sent_datetime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (kind, ref_id, period_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_notification_reminder_period_start ON notification_reminder(period_start);
+CREATE INDEX IF NOT EXISTS idx_issue_open_due_datetime ON issue(due_datetime) WHERE return_datetime IS NULL;
+
+COMMIT;
+
+ANALYZE app_notification;
@@ -0,0 +1,66 @@
+-- 010_catalog_version.sql
+-- Adds the catalog cache version, bumped whenever book_availability rows change.
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/010_catalog_version.sql
+
+BEGIN;
+
+DROP TRIGGER IF EXISTS trg_book_availability_catalog_version_insert ON book_availability;
+DROP TRIGGER IF EXISTS trg_book_availability_catalog_version_update ON book_availability;
+DROP TRIGGER IF EXISTS trg_book_availability_catalog_version_delete ON book_availability;
+DROP TRIGGER IF EXISTS trg_book_availability_catalog_version_truncate ON book_availability;
+
+CREATE OR REPLACE FUNCTION bump_catalog_version()
+RETURNS trigger AS $$
+DECLARE
+    v_changed BOOLEAN;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        v_changed := TRUE;
+    ELSE
+        EXECUTE CASE TG_OP
+            WHEN 'INSERT' THEN 'SELECT EXISTS (SELECT 1 FROM new_rows)'
+            WHEN 'DELETE' THEN 'SELECT EXISTS (SELECT 1 FROM old_rows)'
+            ELSE
+                'SELECT EXISTS (
+                    SELECT 1
+                    FROM new_rows n
+                    JOIN old_rows o ON o.book_id = n.book_id
+                    WHERE (n.title, n.authors, n.categories, n.description, n.total_copies,
+                           n.currently_issued_copies, n.currently_reserved_copies, n.rating_count, n.rating_sum)
+                        IS DISTINCT FROM
+                          (o.title, o.authors, o.categories, o.description, o.total_copies,
+                           o.currently_issued_copies, o.currently_reserved_copies, o.rating_count, o.rating_sum)
+                )'
+        END INTO v_changed;
+    END IF;
+
+    IF v_changed THEN
+        PERFORM bump_cache_version('catalog');
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_book_availability_catalog_version_insert
+AFTER INSERT ON book_availability
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+CREATE TRIGGER trg_book_availability_catalog_version_update
+AFTER UPDATE ON book_availability
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+CREATE TRIGGER trg_book_availability_catalog_version_delete
+AFTER DELETE ON book_availability
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+CREATE TRIGGER trg_book_availability_catalog_version_truncate
+AFTER TRUNCATE ON book_availability
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+SELECT bump_cache_version('catalog');
+
+COMMIT;
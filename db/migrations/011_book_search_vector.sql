@@ -0,0 +1,21 @@
+-- 011_book_search_vector.sql
+-- Adds the weighted full-text search document to book_availability and its indexes.
+-- Adding the stored column rewrites book_availability.
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/011_book_search_vector.sql
+
+BEGIN;
+
+ALTER TABLE book_availability
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', title), 'A')
+        || setweight(to_tsvector('english', authors), 'B')
+        || setweight(to_tsvector('english', categories), 'C')
+        || setweight(to_tsvector('english', description), 'D')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_book_availability_search_vector ON book_availability USING gin(search_vector);
+CREATE INDEX IF NOT EXISTS idx_book_availability_title_trgm ON book_availability USING gin(title gin_trgm_ops);
+
+COMMIT;
+
+ANALYZE book_availability;
@@ -0,0 +1,42 @@
+-- 013_daily_rollups.sql
+-- Adds the daily rollup tables read by the circulation reports.
+-- Fill the rollups afterwards with: flask build-rollups
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/013_daily_rollups.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS rollup_circulation_daily (
+    day DATE PRIMARY KEY,
+    issues INTEGER NOT NULL DEFAULT 0,
+    returns INTEGER NOT NULL DEFAULT 0,
+    late_returns INTEGER NOT NULL DEFAULT 0,
+    reservations INTEGER NOT NULL DEFAULT 0,
+    copies INTEGER NOT NULL DEFAULT 0,
+    copies_on_loan INTEGER NOT NULL DEFAULT 0,
+    copies_reserved INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS rollup_category_daily (
+    day DATE NOT NULL,
+    category_id BIGINT NOT NULL,
+    issues INTEGER NOT NULL DEFAULT 0,
+    returns INTEGER NOT NULL DEFAULT 0,
+    late_returns INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, category_id)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_purchase_daily (
+    day DATE NOT NULL,
+    publisher_id BIGINT NOT NULL,
+    copies INTEGER NOT NULL DEFAULT 0,
+    spend NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, publisher_id)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_watermark (
+    name TEXT PRIMARY KEY,
+    built_until DATE NOT NULL,
+    built_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMIT;
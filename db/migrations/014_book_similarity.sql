@@ -0,0 +1,26 @@
+-- 014_book_similarity.sql
+-- Adds the precomputed book recommendations and their build watermark.
+-- Fill them afterwards with: flask build-recommendations --full
+-- Run once with: psql -v ON_ERROR_STOP=1 -f db/migrations/014_book_similarity.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS book_similarity (
+    book_id BIGINT NOT NULL,
+    rank SMALLINT NOT NULL,
+    similar_book_id BIGINT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (book_id, rank),
+    FOREIGN KEY (book_id) REFERENCES book(id) ON DELETE CASCADE,
+    FOREIGN KEY (similar_book_id) REFERENCES book(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS similarity_watermark (
+    name TEXT PRIMARY KEY,
+    last_rating_id BIGINT NOT NULL,
+    built_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_book_similarity_similar_book_id ON book_similarity(similar_book_id);
+
+COMMIT;
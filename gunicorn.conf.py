@@ -0,0 +1,28 @@
+# gunicorn.conf.py
+# Production server settings, shared by the web app (gthread workers) and the async API (uvicorn workers):
+#   gunicorn -c gunicorn.conf.py "app:create_app()"
+#   gunicorn -c gunicorn.conf.py -k uvicorn_worker.UvicornWorker asgi:app
+# Send SIGHUP to the master process for a graceful reload (new workers start before old ones finish).
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('WEB_INTERNAL_PORT', '8000')}"
+# Capped at 4 by default: every worker opens its own connection pool (see DB_POOL_SIZE in the README)
+workers = int(os.getenv("WEB_WORKERS", str(min(multiprocessing.cpu_count() * 2 + 1, 4))))
+# Threads per worker (gthread workers only); each thread may hold one pooled connection
+threads = int(os.getenv("WEB_THREADS", "4"))
+worker_class = os.getenv("WEB_WORKER_CLASS", "gthread")
+
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+# Recycle workers periodically (with jitter so they don't all restart at once)
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "1000"))
+
+# The app is imported in every worker so each one opens its own connection pool
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("WEB_LOG_LEVEL", "info")